@@ -1,8 +1,10 @@
 import collections
 import datetime
+import json
 import os
 import re
 import subprocess
+import time
 import traceback
 import typing
 import csv
@@ -19,10 +21,12 @@ from _PipelineCreator.PipelineRegistrar import PipelineInfo
 import vtk, qt, slicer
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
-from PipelineCreator import PipelineCreatorLogic, PipelineProgressCallback
+from PipelineCreator import (PipelineCreatorLogic, PipelineExecutionSettings, PipelineProfile, PipelineProgressCallback,
+                             PipelineProgressDispatcher, PipelineTracer, materializeVolume, traceSpan)
 from PipelineCaseIteratorLibrary import (
  Asynchrony,
  IteratorParameterFile,
+ RowProfiler,
  ScopedNode,
  ScopedDefaultStorageNode
 )
@@ -107,7 +111,17 @@ class PipelineCaseIteratorRunner(object):
             self.currentPassIndex = currentFileIndex
 
     def __init__(self, pipelineName, inputFile, outputDirectory, resultsFileName = "results.csv", prefix=None, suffix=None,
-                 timestampFormat=None, pipelineCreatorLogic=None):
+                 timestampFormat=None, pipelineCreatorLogic=None, executionSettings=None, profile=False,
+                 traceFile=None, launchTime=None, profileRows=None, profileBaseline=None):
+        """
+        profile: If True, the time and memory used by each step is measured for every row and written
+            next to the results file, see _writeProfiles.
+        traceFile: If given, the run is traced into this file (Chrome trace event JSON, see PipelineTracer).
+        launchTime: The time.time() at which this process was launched, traced as its startup.
+        profileRows: If given, the rows it samples (see parseRowSampling) are profiled with cProfile into
+            rowProfilesDirectory, see RowProfiler.
+        profileBaseline: The rowProfilesDirectory of an earlier run, the row profiles are compared against it.
+        """
 
         if not os.path.isfile(inputFile):
             raise RuntimeError("Input directory does not exist or is not a directory: " + inputFile)
@@ -132,12 +146,35 @@ class PipelineCaseIteratorRunner(object):
         self._suffix = suffix
         self._timestampFormat = timestampFormat
         self._timestamp = None
+        self._executionSettings = executionSettings
+        self._profile = profile
+        self._currentProfile = None
+        self._traceFile = traceFile
+        self._launchTime = launchTime
+        self._rowProfiler = None
+        if profileRows:
+            self._rowProfiler = RowProfiler(os.path.join(outputDirectory, self.rowProfilesDirectoryName),
+                                            profileRows, baseline=profileBaseline)
         self._progressHelper = self._ProgressHelper(0, 0)
+        self._currentRow = None
+        self._currentInputNodes = []
 
     def setProgressCallback(self, progressCallback):
         self._progressCallbackFunction = progressCallback
 
     def run(self):
+        if self._traceFile is None:
+            self._runRows()
+            return
+
+        with PipelineTracer(self._traceFile, processName="PipelineCaseIteratorRunner") as tracer:
+            if self._launchTime is not None:
+                # from the launch of the process to here, mostly starting Slicer and loading the modules
+                tracer.addSpan("startup", self._launchTime, time.time(), "case iterator")
+            with traceSpan("run", "case iterator", pipeline=self._pipeline.name):
+                self._runRows()
+
+    def _runRows(self):
         if self._timestampFormat is not None:
             self._timestamp = datetime.datetime.now().strftime(self._timestampFormat)
 
@@ -148,29 +185,99 @@ class PipelineCaseIteratorRunner(object):
         self._progressHelper.numberOfPasses = len(csvParameters)
 
         outputData = []
-        inputNodes = []
+        profiles = []
+
+        def onError(index, e):
+            print(f"Exception: {e}")
+            traceback.print_exception(type(e), e, e.__traceback__)
+            self._removeCurrentInputNodes()
+            if self._profile:
+                profiles.append({"row": self._currentRow[0], "error": str(e)} | self._currentProfile.toDict())
+            if self._rowProfiler is not None:
+                self._rowProfiler.stop()
+
+        try:
+            # The whole input file is run as a single batch so the pipeline steps can share
+            # their setup (widgets, logic objects, parameter nodes, ...) across all the rows.
+            try:
+                for output in self._pipeline.runBatch(self._iterateInputs(csvParameters, callback),
+                                                      progressCallback=callback,
+                                                      onError=onError,
+                                                      executionSettings=self._executionSettings):
+                    passIndex, row = self._currentRow
+                    if self._profile:
+                        profiles.append({"row": passIndex} | self._currentProfile.toDict())
+                    try:
+                        with traceSpan("save outputs", "case iterator", row=passIndex):
+                            outputRow = self._postProcessPipelineOutput(output, passIndex, self._outputDirectory)
+                        outputData.append(outputRow | row)
+                    except Exception as e:
+                        print(f"Exception: {e}")
+                        traceback.print_exc()
+                    finally:
+                        self._removeCurrentInputNodes()
+                        if self._rowProfiler is not None:
+                            self._rowProfiler.stop()
+            finally:
+                self._removeCurrentInputNodes()
+
+            with traceSpan("write results", "case iterator"):
+                self._writeResults(outputData, self._outputDirectory)
+            if self._profile:
+                self._writeProfiles(profiles, self._outputDirectory)
+        finally:
+            # after the results, the row profiles must not cost them
+            if self._rowProfiler is not None:
+                self._finishRowProfiles()
+
+    def _finishRowProfiles(self):
+        try:
+            if self._rowProfiler.finish() is not None:
+                print(f"Row profiles report written to {self._rowProfiler.reportPath}")
+        except Exception as e:
+            print(f"Could not write the row profiles report: {e}")
+            traceback.print_exc()
 
+    def _iterateInputs(self, csvParameters, progressCallback):
+        """
+        Yields the pipeline inputs for each valid row of the input file, loading the needed nodes.
+        The row currently being run and its loaded nodes are kept in self._currentRow and self._currentInputNodes.
+        When profiling, each row gets a new profile in self._currentProfile.
+        The sampled rows are profiled from the loading of their inputs, the caller stops the row profiler.
+        """
         for passIndex, row in enumerate(csvParameters):
+            self._progressHelper.currentPassIndex = passIndex
+            self._removeCurrentInputNodes()
+            if self._rowProfiler is not None:
+                self._rowProfiler.start(passIndex)
             try:
-                self._progressHelper.currentPassIndex = passIndex
-                valid, inputParameters, inputNodes = rowToTypes(row, self._pipeline.parameters, baseDirectory=self._baseDir)
-                if valid:
-                    output = self._pipeline.function(**inputParameters, progress_callback=callback)
-                    outputRow = self._postProcessPipelineOutput(output, passIndex, self._outputDirectory)
-                    outputData.append(outputRow | row)
-                else:
-                    print(f"Invalid data in row {passIndex}, skipping ...")
+                with traceSpan("load inputs", "case iterator", row=passIndex):
+                    valid, inputParameters, self._currentInputNodes = rowToTypes(row, self._pipeline.parameters, baseDirectory=self._baseDir)
             except Exception as e:
                 print(f"Exception: {e}")
                 traceback.print_exc()
-            finally:
-                for node in inputNodes:
-                    id = node.GetID()
-                    found = slicer.mrmlScene.GetNodeByID(id)
-                    if found:
-                        slicer.mrmlScene.RemoveNode(found)
-
-        self._writeResults(outputData, self._outputDirectory)
+                if self._rowProfiler is not None:
+                    self._rowProfiler.discard()
+                continue
+
+            if valid:
+                self._currentRow = (passIndex, row)
+                if self._profile:
+                    self._currentProfile = PipelineProfile()
+                    progressCallback.profile = self._currentProfile
+                yield inputParameters
+            else:
+                print(f"Invalid data in row {passIndex}, skipping ...")
+                if self._rowProfiler is not None:
+                    self._rowProfiler.discard()
+
+    def _removeCurrentInputNodes(self):
+        for node in self._currentInputNodes:
+            id = node.GetID()
+            found = slicer.mrmlScene.GetNodeByID(id)
+            if found:
+                slicer.mrmlScene.RemoveNode(found)
+        self._currentInputNodes = []
 
     def _writeResults(self, data: list[dict[str, typing.Any]], outputDirectory: str):
         filename = os.path.join(outputDirectory, self._resultsFileName)
@@ -183,6 +290,22 @@ class PipelineCaseIteratorRunner(object):
             for row in data:
                 writer.writerow(row)
 
+    @property
+    def profilesFileName(self) -> str:
+        return os.path.splitext(self._resultsFileName)[0] + "_profile.json"
+
+    @property
+    def rowProfilesDirectoryName(self) -> str:
+        return os.path.splitext(self._resultsFileName)[0] + "_rowProfiles"
+
+    def _writeProfiles(self, profiles: list[dict], outputDirectory: str):
+        """
+        Writes the profile of every row (see PipelineProfile.toDict) with the row number, as a JSON list.
+        """
+        filename = os.path.join(outputDirectory, self.profilesFileName)
+        with open(filename, mode='w') as f:
+            json.dump(profiles, f, indent=2)
+
     def _createOutputFilepath(self, baseFilename, outputExtension, outputDirectory):
         # Get filename and strip extension
         outputFilename = os.path.splitext(os.path.basename(baseFilename))[0]
@@ -220,20 +343,30 @@ class PipelineCaseIteratorRunner(object):
         nodes = {}
         outputRow = {}
 
+        def isNodeList(value):
+            return isinstance(value, list) and all(isinstance(item, slicer.vtkMRMLNode) for item in value)
+
         if isParameterPack(output):
             for param in output.allParameters:
                 value = output.getValue(param)
                 if issubclass(value.__class__, slicer.vtkMRMLNode):
                     nodes[param] = value
+                elif isNodeList(value):
+                    # each node of a list is written to its own file, e.g. models_0, models_1, ...
+                    nodes.update({f"{param}_{index}": item for index, item in enumerate(value)})
                 else:
                     outputRow[param] = output.getValue(param)
         elif issubclass(output.__class__, slicer.vtkMRMLNode):
             nodes["returnValue"] = output
+        elif isNodeList(output):
+            nodes.update({f"returnValue_{index}": item for index, item in enumerate(output)})
 
         # Iterates over all nodes in the output, stores them to file
         # additionally releases them after writing through the ScopedNode
         for name, outputNode in nodes.items():
             with ScopedNode(outputNode) as node:
+                # geometry only volumes have no voxels to write until materialized
+                materializeVolume(node)
                 with ScopedDefaultStorageNode(node) as storageNode:
                     fileTypes = storageNode.GetSupportedWriteFileTypes()
                     fileExtensions = vtk.vtkStringArray()
@@ -243,7 +376,9 @@ class PipelineCaseIteratorRunner(object):
                     outputFilepath = self._createOutputFilepath(f'{name}_{rowCount:03d}',
                                                                 outputExtension,
                                                                 outputDirectory, )
-                    if slicer.util.saveNode(node, outputFilepath):
+                    with traceSpan(f"save {name}", "io", path=outputFilepath):
+                        saved = slicer.util.saveNode(node, outputFilepath)
+                    if saved:
                         outputRow[name] = outputFilepath
                     else:
                         print(f'Failed to write node {node} to disk at {outputFilepath} \n'
@@ -339,6 +474,8 @@ class PipelineCaseIteratorWidget(ScriptedLoadableModuleWidget, VTKObservationMix
         self._browseDirectory = self.ui.outputDirectoryLineEdit.text
         self.ui.pipelineNameLabel.text = settings.value('PipelineCaseIterator/LastPipelineName', '')
         self.ui.resultsFileNameLineEdit.text = settings.value('PipelineCaseIterator/LastResultFileName', 'results')
+        self.ui.profileRowsLineEdit.text = settings.value('PipelineCaseIterator/LastProfileRows', '10')
+        self.ui.profileBaselineLineEdit.text = settings.value('PipelineCaseIterator/LastProfileBaseline', '')
 
         self._validateInputs(doWarn=False)
 
@@ -376,7 +513,7 @@ class PipelineCaseIteratorWidget(ScriptedLoadableModuleWidget, VTKObservationMix
             self._browseDirectory = directoryPicker.selectedFiles()[0]
 
     def selectPipeline(self):
-        popUp = SelectPipelinePopUp(self.PipelineCreatorLogic.registeredPipelines, parent=self.uiWidget)
+        popUp = SelectPipelinePopUp(self.PipelineCreatorLogic.registrar, parent=self.uiWidget)
         popUp.accepted.connect(lambda: self._onPopUpAccepted(popUp))
         popUp.open()
         pass
@@ -449,6 +586,8 @@ class PipelineCaseIteratorWidget(ScriptedLoadableModuleWidget, VTKObservationMix
         prefix = self.ui.outputPrefixLineEdit.text  # empty string is acceptable
         suffix = self.ui.outputSuffixLineEdit.text  # empty string is acceptable
         timestampFormat = self.ui.timestampFormatLineEdit.text if self.ui.addTimestampCheckbox.checked else None
+        profileRows = self.ui.profileRowsLineEdit.text if self.ui.profileRowsCheckBox.checked else None
+        profileBaseline = self.ui.profileBaselineLineEdit.text or None
 
         errors = []
         if outputDirectory == "":
@@ -471,7 +610,9 @@ class PipelineCaseIteratorWidget(ScriptedLoadableModuleWidget, VTKObservationMix
                 resultsFileName=resultsFileName,
                 prefix=prefix,
                 suffix=suffix,
-                timestampFormat=timestampFormat)
+                timestampFormat=timestampFormat,
+                profileRows=profileRows,
+                profileBaseline=profileBaseline)
             self.ui.runButton.enabled = False
             self.ui.cancelButton.enabled = True
         except Exception as e:
@@ -490,6 +631,8 @@ class PipelineCaseIteratorWidget(ScriptedLoadableModuleWidget, VTKObservationMix
         self._safeSetValue('PipelineCaseIterator/LastOutputDirectory', self.ui.outputDirectoryLineEdit)
         self._safeSetValue('PipelineCaseIterator/LastPipelineName', self.ui.pipelineNameLabel)
         self._safeSetValue('PipelineCaseIterator/LastResultsFileName', self.ui.resultsFileNameLineEdit)
+        self._safeSetValue('PipelineCaseIterator/LastProfileRows', self.ui.profileRowsLineEdit)
+        self._safeSetValue('PipelineCaseIterator/LastProfileBaseline', self.ui.profileBaselineLineEdit)
 
     def _safeSetValue(self, settingsLabel, widget):
         if not widget:
@@ -552,19 +695,27 @@ class PipelineCaseIteratorLogic(ScriptedLoadableModuleLogic):
             resultsFileName: str = 'results.csv',
             prefix: str = None,
             suffix: str = None,
-            timestampFormat: str = None):
+            timestampFormat: str = None,
+            executionSettings: PipelineExecutionSettings = None,
+            profile: bool = False,
+            traceFile: str = None,
+            profileRows: str = None,
+            profileBaseline: str = None):
         # we cheat and know how the PipelineCaseIteratorRunner.py does its job, so we are going
         # to start it to short cut any exceptions and get better error messages
-        # but we don't actually run anything in this process
+        # but we don't actually run anything in this process.
+        # This also reads the profileBaseline, so a wrong one fails here instead of after all the rows
         PipelineCaseIteratorRunner(pipelineInfo.name, inputFile, outputDirectory, resultsFileName, prefix, suffix,
-                                   timestampFormat)
+                                   timestampFormat, executionSettings=executionSettings, profile=profile,
+                                   profileRows=profileRows, profileBaseline=profileBaseline)
 
         script = self.resourcePath('CommandLineScripts/PipelineCaseIteratorRunner.py')
         self._asynchrony = Asynchrony(
             lambda: self._runImpl(
                 slicer.app.applicationFilePath(), script,
                 pipelineInfo.name, inputFile, outputDirectory, resultsFileName,
-                prefix, suffix, timestampFormat),
+                prefix, suffix, timestampFormat, executionSettings, profile, traceFile, profileRows,
+                profileBaseline),
             self._runFinished)
         self._asynchrony.Start()
         self._running = True
@@ -575,12 +726,19 @@ class PipelineCaseIteratorLogic(ScriptedLoadableModuleLogic):
                          resultsFileName: str = None,
                          prefix: str = None,
                          suffix: str = None,
-                         timestampFormat: str = None):
+                         timestampFormat: str = None,
+                         executionSettings: PipelineExecutionSettings = None,
+                         profile: bool = False,
+                         traceFile: str = None,
+                         profileRows: str = None,
+                         profileBaseline: str = None):
         """Executes the pipeline synchronously inside of slicer, allows for better testing
         """
 
         runner = PipelineCaseIteratorRunner(pipelineInfo.name, inputFile, outputDirectory, resultsFileName, prefix,
-                                            suffix, timestampFormat)
+                                            suffix, timestampFormat, executionSettings=executionSettings,
+                                            profile=profile, traceFile=traceFile, profileRows=profileRows,
+                                            profileBaseline=profileBaseline)
         runner.run()
 
     @property
@@ -604,7 +762,8 @@ class PipelineCaseIteratorLogic(ScriptedLoadableModuleLogic):
             self._asynchrony = None
 
     def _runImpl(self, launcherPath, scriptPath, pipelineName, inputFile, outputDirectory, resultsFileName,
-                 prefix, suffix, timestampFormat):
+                 prefix, suffix, timestampFormat, executionSettings=None, profile=False, traceFile=None,
+                 profileRows=None, profileBaseline=None):
         positiveIntReStr = '[0-9]+'
         # TODO check the name regex against the pipeline naming conventions
         pipelineProgressRe = re.compile(
@@ -627,9 +786,26 @@ class PipelineCaseIteratorLogic(ScriptedLoadableModuleLogic):
             cmd += ['--suffix="%s"' % suffix]
         if timestampFormat:  # empty string would do nothing so don't send it
             cmd += ['--timestampFormat="%s"' % timestampFormat]
+        if executionSettings is not None:
+            if executionSettings.smpBackend:
+                cmd += ['--smpBackend="%s"' % executionSettings.smpBackend]
+            if executionSettings.numberOfThreads:
+                cmd += ['--numberOfThreads=%d' % executionSettings.numberOfThreads]
+        if profile:
+            cmd += ['--profile']
+        if traceFile:
+            cmd += ['--traceFile="%s"' % traceFile, '--launchTime=%f' % time.time()]
+        if profileRows:
+            cmd += ['--profileRows="%s"' % profileRows]
+            if profileBaseline:
+                cmd += ['--profileBaseline="%s"' % profileBaseline]
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
 
         totalCount = 0
+        # throttled in this thread, so the dropped progress lines never reach the main thread
+        dispatchProgress = PipelineProgressDispatcher(
+            lambda *progress: Asynchrony.RunOnMainThread(lambda: self._setProgress(*progress)),
+            done=100)
 
         try:
             while True:
@@ -645,12 +821,11 @@ class PipelineCaseIteratorLogic(ScriptedLoadableModuleLogic):
                         pipelineName = search.group('pipelineName')
                         totalCount = int(search.group('totalCount'))
                         currentNumber = int(search.group('currentNumber'))
-                        Asynchrony.RunOnMainThread(
-                            lambda: self._setProgress(overallProgress, pipelineName, currentNumber, totalCount))
+                        dispatchProgress(overallProgress, pipelineName, currentNumber, totalCount)
                     print(
                         textOutput.strip())  # prints the output as if it were run in this process. Useful for debugging.
             if proc.poll() == 0:
-                Asynchrony.RunOnMainThread(lambda: self._setProgress(100, 100, totalCount, totalCount - 1))
+                dispatchProgress(100, 100, totalCount, totalCount - 1)
             else:
                 raise CaseIteratorSubProcessError('Error running pipeline case iterator runner')
         except:
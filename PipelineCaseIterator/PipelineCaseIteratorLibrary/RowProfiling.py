@@ -0,0 +1,218 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import typing
+
+__all__ = [
+    "RowProfiler",
+    "compareRowProfiles",
+    "parseRowSampling",
+]
+
+
+def parseRowSampling(spec: str) -> typing.Callable[[int], bool]:
+    """
+    Returns a function telling if a row (by its zero based index) is profiled.
+
+    spec is either
+        - "N": every Nth row, starting with the first one, e.g. "1" profiles all the rows
+        - "random:F" or "random:F:SEED": each row with the probability F (0 < F <= 1), the same seed picks
+          the same rows
+    """
+    spec = str(spec).strip()
+    if spec.startswith("random:"):
+        parts = spec.split(":")
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Invalid row sampling '{spec}', expected 'random:FRACTION' or 'random:FRACTION:SEED'")
+        try:
+            fraction = float(parts[1])
+            seed = int(parts[2]) if len(parts) == 3 else None
+        except ValueError:
+            raise ValueError(f"Invalid row sampling '{spec}', expected 'random:FRACTION' or 'random:FRACTION:SEED'")
+        if not 0 < fraction <= 1:
+            raise ValueError(f"Invalid row sampling '{spec}', the fraction must be in (0, 1]")
+        generator = random.Random(seed)
+        # one draw per row, in order, so a seed always picks the same rows of the same file
+        draws = []
+
+        def isSampled(rowIndex: int) -> bool:
+            while len(draws) <= rowIndex:
+                draws.append(generator.random())
+            return draws[rowIndex] < fraction
+        return isSampled
+
+    try:
+        every = int(spec)
+    except ValueError:
+        raise ValueError(f"Invalid row sampling '{spec}', expected a number of rows or 'random:FRACTION'")
+    if every < 1:
+        raise ValueError(f"Invalid row sampling '{spec}', the number of rows must be at least 1")
+    return lambda rowIndex: rowIndex % every == 0
+
+
+def _functionName(function: tuple[str, int, str]) -> str:
+    # without the line number, so a function is still matched after the code above it changed
+    filename, _, name = function
+    return f"{filename}:{name}"
+
+
+def _summarize(stats: pstats.Stats, rows: list[int]) -> dict:
+    functions = {}
+    for function, (_, calls, totalTime, cumulativeTime, _) in stats.stats.items():
+        summary = functions.setdefault(_functionName(function),
+                                       {"calls": 0, "totalTime": 0.0, "cumulativeTime": 0.0})
+        summary["calls"] += calls
+        summary["totalTime"] += totalTime
+        summary["cumulativeTime"] += cumulativeTime
+    return {"rows": rows, "functions": functions}
+
+
+def compareRowProfiles(summary: dict, baseline: dict, threshold: float = 1.25,
+                       minimumIncrease: float = 0.01) -> list[tuple[str, float, float]]:
+    """
+    Returns (function, baselineTime, time) of the functions whose cumulative time per profiled row is more
+    than threshold times the one of the baseline, and at least minimumIncrease seconds more.
+    The summaries are the ones RowProfiler.finish writes. Slowest increase first.
+    """
+    rows = max(len(summary["rows"]), 1)
+    baselineRows = max(len(baseline["rows"]), 1)
+    regressions = []
+    for name, function in summary["functions"].items():
+        if name not in baseline["functions"]:
+            continue
+        time = function["cumulativeTime"] / rows
+        baselineTime = baseline["functions"][name]["cumulativeTime"] / baselineRows
+        if time > baselineTime * threshold and time - baselineTime >= minimumIncrease:
+            regressions.append((name, baselineTime, time))
+    regressions.sort(key=lambda regression: regression[2] - regression[1], reverse=True)
+    return regressions
+
+
+class RowProfiler(object):
+    """
+    Profiles a sample of the rows of a case iterator run with cProfile.
+
+    start(rowIndex) begins profiling the row if it is sampled and stop() ends it, saving its stats in
+    row_NNNNN.pstats of the directory. finish() then merges the stats of all the profiled rows into
+    merged.pstats and summary.json, and writes report.txt ranking the functions by cumulative time.
+
+    baseline is the directory (or its summary.json) of an earlier run, the functions that got slower
+    since are listed at the end of the report. It is read right away, so a wrong path fails before any
+    row is run.
+    """
+    mergedStatsFileName = "merged.pstats"
+    summaryFileName = "summary.json"
+    reportFileName = "report.txt"
+
+    def __init__(self, directory: str, sampling, baseline: typing.Optional[str] = None, reportSize: int = 50):
+        """
+        sampling - A spec for parseRowSampling, or a function telling if a row index is profiled.
+        reportSize - The number of functions listed in the report.
+        """
+        self.directory = directory
+        self._isSampled = sampling if callable(sampling) else parseRowSampling(sampling)
+        self.baseline = baseline
+        self._baselineSummary = None if baseline is None else self.loadBaseline(baseline)
+        self.reportSize = reportSize
+        self.profiledRows: list[int] = []
+        self._profile = None
+        self._row = None
+
+    def rowStatsPath(self, rowIndex: int) -> str:
+        return os.path.join(self.directory, f"row_{rowIndex:05d}.pstats")
+
+    @property
+    def reportPath(self) -> str:
+        return os.path.join(self.directory, self.reportFileName)
+
+    @property
+    def profiling(self) -> bool:
+        return self._profile is not None
+
+    def start(self, rowIndex: int) -> None:
+        """
+        Starts profiling the row if it is sampled. A row still being profiled is stopped first.
+        """
+        self.stop()
+        if not self._isSampled(rowIndex):
+            return
+        self._row = rowIndex
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+
+    def stop(self) -> None:
+        """
+        Stops profiling the current row, if any, and saves its stats.
+        """
+        if self._profile is None:
+            return
+        self._profile.disable()
+        os.makedirs(self.directory, exist_ok=True)
+        self._profile.dump_stats(self.rowStatsPath(self._row))
+        self.profiledRows.append(self._row)
+        self._profile = None
+
+    def discard(self) -> None:
+        """
+        Stops profiling the current row without saving it, e.g. when its inputs could not be loaded.
+        """
+        if self._profile is not None:
+            self._profile.disable()
+        self._profile = None
+
+    @classmethod
+    def loadBaseline(cls, baseline: str) -> dict:
+        """
+        Reads the summary of a baseline, the directory of an earlier run or its summary.json.
+        Raises ValueError if it can't be read or is not a summary written by finish.
+        """
+        path = os.path.join(baseline, cls.summaryFileName) if os.path.isdir(baseline) else baseline
+        try:
+            with open(path) as file:
+                summary = json.load(file)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"Could not read the row profiles baseline '{path}': {e}")
+        if not isinstance(summary, dict) or "rows" not in summary or "functions" not in summary:
+            raise ValueError(f"'{path}' is not a row profiles summary")
+        return summary
+
+    def finish(self) -> typing.Optional[str]:
+        """
+        Merges the stats of the profiled rows and writes the report. Returns the report, None if no row was profiled.
+        """
+        self.stop()
+        if not self.profiledRows:
+            return None
+
+        stats = pstats.Stats(*[self.rowStatsPath(row) for row in self.profiledRows], stream=io.StringIO())
+        stats.dump_stats(os.path.join(self.directory, self.mergedStatsFileName))
+        summary = _summarize(stats, self.profiledRows)
+        with open(os.path.join(self.directory, self.summaryFileName), "w") as file:
+            json.dump(summary, file, indent=2)
+
+        stream = io.StringIO()
+        stream.write(f"Profiled rows: {', '.join(str(row) for row in self.profiledRows)}"
+                     f" ({len(self.profiledRows)} rows)\n")
+        stats.stream = stream
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.reportSize)
+
+        if self._baselineSummary is not None:
+            stream.write(f"Regressions against baseline {self.baseline} (cumulative time per row):\n")
+            try:
+                regressions = compareRowProfiles(summary, self._baselineSummary)
+            except (KeyError, TypeError, ValueError) as e:
+                # the report of this run is still useful without the comparison
+                stream.write(f"  could not compare: {type(e).__name__}: {e}\n")
+            else:
+                for name, baselineTime, time in regressions:
+                    stream.write(f"  {name}: {baselineTime:.3f}s -> {time:.3f}s (x{time / max(baselineTime, 1e-9):.2f})\n")
+                if not regressions:
+                    stream.write("  none\n")
+
+        report = stream.getvalue()
+        with open(self.reportPath, "w") as file:
+            file.write(report)
+        return report
@@ -1,11 +1,15 @@
 from .Asynchrony import Asynchrony
 from .IteratorParameterFile import IteratorParameterFile
+from .RowProfiling import RowProfiler, compareRowProfiles, parseRowSampling
 from .Util import ScopedNode, ScopedDefaultStorageNode, human_sorted
 
 __all__ = [
     "Asynchrony",
     "IteratorParameterFile",
+    "RowProfiler",
     "ScopedNode",
     "ScopedDefaultStorageNode",
+    "compareRowProfiles",
     "human_sorted",
+    "parseRowSampling",
 ]
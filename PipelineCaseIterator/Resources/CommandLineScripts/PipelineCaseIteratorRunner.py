@@ -3,6 +3,7 @@ import argparse
 import sys
 import traceback
 from PipelineCaseIterator import PipelineCaseIteratorRunner
+from PipelineCreator import PipelineExecutionSettings, PipelineProgressDispatcher
 
 _progressStatement = '<pipelineProgress>{totalProgress}, {currentPipelinePieceName}, {currentPipelinePieceNumber}, {numberOfPieces}</pipelineProgress>'
 
@@ -33,6 +34,11 @@ def cleanupQuotes(args):
 
 
 def main(args):
+  executionSettings = None
+  if args.smpBackend or args.numberOfThreads:
+    executionSettings = PipelineExecutionSettings(smpBackend=args.smpBackend or None,
+                                                  numberOfThreads=args.numberOfThreads)
+
   runner = PipelineCaseIteratorRunner(
     args.pipelineName,
     args.inputFile,
@@ -40,10 +46,19 @@ def main(args):
     resultsFileName=args.resultsFileName,
     prefix=args.prefix,
     suffix=args.suffix,
-    timestampFormat=args.timestampFormat)
+    timestampFormat=args.timestampFormat,
+    executionSettings=executionSettings,
+    profile=args.profile,
+    traceFile=args.traceFile,
+    launchTime=args.launchTime,
+    profileRows=args.profileRows,
+    profileBaseline=args.profileBaseline)
 
-  runner.setProgressCallback(_onProgress)
+  # the parent process parses every progress line, only print as many as it can show
+  dispatchProgress = PipelineProgressDispatcher(_onProgress)
+  runner.setProgressCallback(dispatchProgress)
   runner.run()
+  dispatchProgress.flush()
 
 if __name__ == "__main__":
 
@@ -55,6 +70,20 @@ if __name__ == "__main__":
   parser.add_argument('--suffix', required=False, default=None)
   parser.add_argument('--timestampFormat', required=False, default=None)
   parser.add_argument('--resultsFileName', required=False, default='results.csv')
+  parser.add_argument('--smpBackend', required=False, default=None,
+                      help='VTK SMP backend to use (Sequential, STDThread, TBB or OpenMP)')
+  parser.add_argument('--numberOfThreads', required=False, type=int, default=0,
+                      help='Maximum number of threads used by the VTK SMP filters, 0 for the default')
+  parser.add_argument('--profile', action='store_true',
+                      help='Write the time and memory used by each step of every row next to the results file')
+  parser.add_argument('--traceFile', required=False, default=None,
+                      help='Write a Chrome trace event file of the run (loading, pipeline steps, saving)')
+  parser.add_argument('--launchTime', required=False, type=float, default=None,
+                      help='time.time() at which this process was launched, traced as the startup')
+  parser.add_argument('--profileRows', '--profile-rows', dest='profileRows', required=False, default=None,
+                      help='Profile rows with cProfile: N for every Nth row, random:FRACTION[:SEED] for a random sample')
+  parser.add_argument('--profileBaseline', '--profile-baseline', dest='profileBaseline', required=False, default=None,
+                      help='Row profiles directory of an earlier run, the slower functions are reported as regressions')
 
 
   try:
@@ -0,0 +1,122 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from PipelineCaseIteratorLibrary import RowProfiler, compareRowProfiles, parseRowSampling
+
+
+def _work(seconds):
+    time.sleep(seconds)
+
+
+class RowProfilingTest(unittest.TestCase):
+
+    def testEveryNthRow(self):
+        isSampled = parseRowSampling("3")
+        self.assertEqual([row for row in range(10) if isSampled(row)], [0, 3, 6, 9])
+        isSampled = parseRowSampling("1")
+        self.assertEqual([row for row in range(4) if isSampled(row)], [0, 1, 2, 3])
+
+    def testRandomRows(self):
+        rows = [row for row in range(100) if parseRowSampling("random:0.3:7")(row)]
+        self.assertEqual(rows, [row for row in range(100) if parseRowSampling("random:0.3:7")(row)])
+        self.assertTrue(0 < len(rows) < 100)
+        self.assertEqual(len([row for row in range(20) if parseRowSampling("random:1")(row)]), 20)
+
+    def testInvalidSampling(self):
+        for spec in ("0", "-2", "abc", "random:0", "random:1.5", "random:x", "random:0.5:1:2"):
+            with self.assertRaises(ValueError, msg=spec):
+                parseRowSampling(spec)
+
+    def testProfileRows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = RowProfiler(directory, "2")
+            for row in range(5):
+                profiler.start(row)
+                _work(0.001)
+            profiler.stop()
+            self.assertEqual(profiler.profiledRows, [0, 2, 4])
+            for row in range(5):
+                self.assertEqual(os.path.exists(profiler.rowStatsPath(row)), row % 2 == 0)
+
+            report = profiler.finish()
+            self.assertIn("Profiled rows: 0, 2, 4 (3 rows)", report)
+            self.assertIn("_work", report)
+            self.assertNotIn("Regressions", report)
+            with open(os.path.join(directory, RowProfiler.summaryFileName)) as file:
+                summary = json.load(file)
+            self.assertEqual(summary["rows"], [0, 2, 4])
+            work = [function for name, function in summary["functions"].items() if name.endswith(":_work")]
+            self.assertEqual(len(work), 1)
+            self.assertEqual(work[0]["calls"], 3)
+            self.assertTrue(os.path.exists(os.path.join(directory, RowProfiler.mergedStatsFileName)))
+
+    def testDiscard(self):
+        with tempfile.TemporaryDirectory() as directory:
+            profiler = RowProfiler(directory, "1")
+            profiler.start(0)
+            profiler.discard()
+            self.assertFalse(profiler.profiling)
+            self.assertIsNone(profiler.finish())
+            self.assertFalse(os.path.exists(profiler.reportPath))
+
+    def testBaseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baselineDirectory = os.path.join(directory, "baseline")
+            baseline = RowProfiler(baselineDirectory, "1")
+            for row in range(2):
+                baseline.start(row)
+                _work(0.01)
+            baseline.finish()
+
+            profiler = RowProfiler(os.path.join(directory, "current"), "1", baseline=baselineDirectory)
+            for row in range(2):
+                profiler.start(row)
+                _work(0.05)
+            report = profiler.finish()
+            self.assertIn("Regressions against baseline", report)
+            regressions = report.split("Regressions against baseline")[1]
+            self.assertIn("_work", regressions)
+
+    def testInvalidBaseline(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # a missing or unreadable baseline fails before any row is profiled
+            with self.assertRaises(ValueError):
+                RowProfiler(os.path.join(directory, "current"), "1", baseline=os.path.join(directory, "missing"))
+            notJson = os.path.join(directory, "notJson.json")
+            with open(notJson, "w") as file:
+                file.write("not json")
+            with self.assertRaises(ValueError):
+                RowProfiler(os.path.join(directory, "current"), "1", baseline=notJson)
+
+            # a summary that can't be compared still gives a report
+            malformed = os.path.join(directory, "malformed.json")
+            with open(malformed, "w") as file:
+                json.dump({"rows": None, "functions": {}}, file)
+            profiler = RowProfiler(os.path.join(directory, "current"), "1", baseline=malformed)
+            profiler.start(0)
+            _work(0.001)
+            report = profiler.finish()
+            self.assertIn("_work", report)
+            self.assertIn("could not compare", report)
+
+    def testCompareRowProfiles(self):
+        baseline = {"rows": [0, 1], "functions": {
+            "a.py:slower": {"calls": 2, "totalTime": 0.0, "cumulativeTime": 2.0},
+            "a.py:same": {"calls": 2, "totalTime": 0.0, "cumulativeTime": 2.0},
+            "a.py:tiny": {"calls": 2, "totalTime": 0.0, "cumulativeTime": 0.002},
+        }}
+        # the times are per row, so the different number of rows doesn't matter
+        summary = {"rows": [0, 1, 2, 3], "functions": {
+            "a.py:slower": {"calls": 4, "totalTime": 0.0, "cumulativeTime": 8.0},
+            "a.py:same": {"calls": 4, "totalTime": 0.0, "cumulativeTime": 4.0},
+            "a.py:tiny": {"calls": 4, "totalTime": 0.0, "cumulativeTime": 0.02},
+            "a.py:new": {"calls": 4, "totalTime": 0.0, "cumulativeTime": 4.0},
+        }}
+        self.assertEqual(compareRowProfiles(summary, baseline), [("a.py:slower", 1.0, 2.0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
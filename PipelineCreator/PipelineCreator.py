@@ -1,8 +1,11 @@
+import collections
 import importlib
+import linecache
+import logging
 import os
 import pathlib
-import shutil
 import sys
+import types
 from typing import Annotated, Optional
 
 try:
@@ -15,12 +18,21 @@ except ImportError:
 import qt
 import slicer
 from _PipelineCreator import PipelineCreation
+from _PipelineCreator.PipelineBatch import runBatch, setupBatchHooks, teardownBatchHooks
+from _PipelineCreator.PipelineCreation import deserializePipeline, serializePipeline
+from _PipelineCreator.PipelineExecution import PipelineExecutionSettings, isPipelineExecutionSettings
+from _PipelineCreator.PipelineGeometry import createGeometryOnlyVolume, isGeometryOnlyVolume, materializeVolume
+from _PipelineCreator.PipelineOwnership import PipelineOwnedInputs, isPipelineOwnedInputs
+from _PipelineCreator.PipelineProfiling import PipelineProfile, PipelineStepProfile
+from _PipelineCreator.PipelineTracing import PipelineTracer, traceSpan
 from _PipelineCreator.PipelineRegistrar import PipelineInfo, PipelineRegistrar
 from slicer.parameterNodeWrapper import Default, parameterNodeWrapper
 from slicer.ScriptedLoadableModule import *
 from slicer.util import VTKObservationMixin
 from Widgets.PipelineListWidget import PipelineListWidget
-from Widgets.PipelineProgressBar import (PipelineProgressCallback,
+from Widgets.PipelineProgressBar import (PipelineCancelledException,
+                                         PipelineProgressCallback,
+                                         PipelineProgressDispatcher,
                                          isPipelineProgressCallback)
 
 __all__ = [
@@ -28,11 +40,35 @@ __all__ = [
     "PipelineCreator",
     "PipelineCreatorWidget",
     "PipelineCreatorLogic",
+    "registerPipelineModules",
+    "runBatch",
+    "setupBatchHooks",
     "singletonRegisterPipelineFunction",
     "slicerPipeline",
+    "teardownBatchHooks",
+
+    "deserializePipeline",
+    "serializePipeline",
 
     "isPipelineProgressCallback",
+    "PipelineCancelledException",
     "PipelineProgressCallback",
+    "PipelineProgressDispatcher",
+
+    "PipelineProfile",
+    "PipelineStepProfile",
+    "PipelineTracer",
+    "traceSpan",
+
+    "isPipelineOwnedInputs",
+    "PipelineOwnedInputs",
+
+    "isPipelineExecutionSettings",
+    "PipelineExecutionSettings",
+
+    "createGeometryOnlyVolume",
+    "isGeometryOnlyVolume",
+    "materializeVolume",
 ]
 
 
@@ -118,7 +154,6 @@ class PipelineCreatorWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.logic = None
         self._parameterNode = None
         self._parameterNodeGuiTag = None
-        self._testNum = 0
 
     def setup(self) -> None:
         """
@@ -141,6 +176,8 @@ class PipelineCreatorWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         # Create logic class. Logic implements all computations that should be possible to run
         # in batch mode, without a graphical user interface.
         self.logic = PipelineCreatorLogic()
+        # keeps the results of the previous validations, so Test and Generate only check the edits
+        self._validator = self.logic.createValidator()
 
         # Finish adding the widgets
         self.ui.StepsContainerWidget.setLayout(qt.QVBoxLayout())
@@ -149,7 +186,7 @@ class PipelineCreatorWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
         # Add pipeline categories to the combo box, select "Pipeline Creator" as default
         # Note the combobox gui wrapper is set to expect fixed choices can't be used here atm
-        categories = set(c for info in self.logic.registeredPipelines.values() for c in info.categories)
+        categories = set(self.logic.registrar.categories)
         categories.add("Pipeline Creator")
         categories = sorted(list(categories))
         self.ui.CategoryComboBox.addItems(categories)
@@ -161,6 +198,8 @@ class PipelineCreatorWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         # Connections
         self.ui.GeneratePipelineButton.clicked.connect(self.onGeneratePipeline)
         self.ui.TestPipelineButton.clicked.connect(self.onTestPipeline)
+        self.ui.SavePipelineButton.clicked.connect(self.onSavePipeline)
+        self.ui.LoadPipelineButton.clicked.connect(self.onLoadPipeline)
 
         # These connections ensure that we update parameter node when scene is closed
         self.addObserver(
@@ -239,29 +278,32 @@ class PipelineCreatorWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
     def onTestPipeline(self):
         """
-        To test the pipeline, we generate it, load it halfway into the python and slicer module infrastructures
-        (but not all the way), and then use it.
+        To test the pipeline, we generate and compile it in memory, load it halfway into the python and
+        slicer module infrastructures (but not all the way), and then use it.
         """
 
         class FakeSlicerModule:
             def __init__(self, path):
                 self.path = path
 
-        tempDir = os.path.join(slicer.app.temporaryPath, f"TestPipeline-{id(self)}-{self._testNum}")
         pipelineName = "PipelineCreatorTemporaryPipeline"
-        filepath = os.path.join(tempDir, f"{pipelineName}.py")
-        print(f"Temporary pipeline at {filepath}")
-        self._testNum += 1
-        self._generatePipeline(pipelineName, [self._parameterNode.categoryName], tempDir, popUpOnSuccess=False)
-
-        # load it as a Python module
-        spec = importlib.util.spec_from_file_location(pipelineName, filepath)
-        pipelineModule = importlib.util.module_from_spec(spec)
-        # needs to exist in sys.modules for some of the parameterPack stuff to work
-        sys.modules[pipelineName] = pipelineModule
-        # fake load it into the slicer infrastructure
-        setattr(slicer.modules, pipelineName.lower(), FakeSlicerModule(tempDir))
-        spec.loader.exec_module(pipelineModule)
+        try:
+            codeObject = self.logic.compilePipeline(
+                pipelineName,
+                [self._parameterNode.categoryName],
+                self.ui.PipelineListWidget.computePipeline(),
+                validator=self._validator)
+        except Exception as e:
+            msgbox = qt.QMessageBox()
+            msgbox.setWindowTitle("ERROR")
+            msgbox.setText(f"Failed to create Pipeline:\n  {str(e)}")
+            msgbox.exec()
+            raise
+
+        # fake load it into the slicer infrastructure. Nothing is written, the path is only there
+        # because the module widget expects its module to have one
+        setattr(slicer.modules, pipelineName.lower(), FakeSlicerModule(slicer.app.temporaryPath))
+        pipelineModule = self.logic.loadCompiledPipeline(pipelineName, codeObject)
 
         pipelineWidget = getattr(pipelineModule, f"{pipelineName}Widget")()
 
@@ -269,7 +311,6 @@ class PipelineCreatorWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
             # when we leave the testing, clean up after ourselves
             self.ui.StackedWidget.setCurrentIndex(0)
             self.ui.StackedWidget.removeWidget(widget)
-            shutil.rmtree(tempDir)
             sys.modules.pop(pipelineName)
             delattr(slicer.modules, pipelineName.lower())
             # need to completely clear up the underlying parameter node in case we retest with the same widget.
@@ -317,19 +358,51 @@ class PipelineCreatorWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
                 rawSearchPaths.append(str(outputDirectory))
                 settings.setValue("Modules/AdditionalPaths", rawSearchPaths)
 
+    def onSavePipeline(self):
+        path = qt.QFileDialog.getSaveFileName(self.parent, "Save Pipeline", "", "Pipelines (*.json)")
+        if not path:
+            return
+        try:
+            self.logic.savePipeline(self.ui.PipelineListWidget.computePipeline(), path)
+        except Exception as e:
+            msgbox = qt.QMessageBox()
+            msgbox.setWindowTitle("ERROR")
+            msgbox.setText(f"Failed to save Pipeline:\n  {str(e)}")
+            msgbox.exec()
+            raise
+
+    def onLoadPipeline(self):
+        path = qt.QFileDialog.getOpenFileName(self.parent, "Load Pipeline", "", "Pipelines (*.json)")
+        if not path:
+            return
+        try:
+            self.ui.PipelineListWidget.setPipeline(self.logic.loadPipeline(path))
+        except Exception as e:
+            msgbox = qt.QMessageBox()
+            msgbox.setWindowTitle("ERROR")
+            msgbox.setText(f"Failed to load Pipeline:\n  {str(e)}")
+            msgbox.exec()
+            raise
+
     def _generatePipeline(self, pipelineName, categories, outputDirectory, popUpOnSuccess=True):
         try:
-            self.logic.createPipeline(
+            report = self.logic.createPipeline(
                 pipelineName,
                 categories,
                 outputDirectory,
                 self.ui.PipelineListWidget.computePipeline(),
-                self._parameterNode.icon)
+                self._parameterNode.icon,
+                validator=self._validator)
+            if report.changed:
+                logging.info(str(report))
 
             if popUpOnSuccess:
                 msgbox = qt.QMessageBox()
                 msgbox.setWindowTitle("SUCCESS")
-                msgbox.setText(f"Successfully created Pipeline '{pipelineName}' at '{outputDirectory}'!")
+                text = f"Successfully created Pipeline '{pipelineName}' at '{outputDirectory}'!"
+                if report.changed:
+                    text += f"\n\n{report}"
+                msgbox.setText(text)
                 msgbox.exec()
         except Exception as e:
             msgbox = qt.QMessageBox()
@@ -366,6 +439,9 @@ class PipelineCreatorLogic(ScriptedLoadableModuleLogic):
         else:
             self._registrar: PipelineRegistrar = PipelineRegistrar()
 
+        # key: (name, categories, pipeline hash), value: (code object, pipelines used by the steps)
+        self._compiledPipelines: collections.OrderedDict = collections.OrderedDict()
+
     def getParameterNode(self):
         return PipelineCreatorParameterNode(super().getParameterNode())
 
@@ -389,8 +465,13 @@ class PipelineCreatorLogic(ScriptedLoadableModuleLogic):
     def isRegistered(self, pipelineName: str) -> bool:
         return self._registrar.isRegistered(pipelineName)
 
-    def registerPipeline(self, name: str, function, dependencies, categories=None) -> None:
-        self._registrar.registerPipeline(name, function, dependencies, categories)
+    def registerPipeline(self, name: str, function, dependencies, categories=None,
+                         batchSetup=None, batchTeardown=None, requiredRepresentations=None, sourceGraph=None,
+                         geometryOnlyVolumes=None) -> None:
+        self._registrar.registerPipeline(name, function, dependencies, categories,
+                                         batchSetup=batchSetup, batchTeardown=batchTeardown,
+                                         requiredRepresentations=requiredRepresentations,
+                                         sourceGraph=sourceGraph, geometryOnlyVolumes=geometryOnlyVolumes)
 
     #################################################################
     #
@@ -400,21 +481,101 @@ class PipelineCreatorLogic(ScriptedLoadableModuleLogic):
     def fillInDataTypes(self, pipeline: nx.DiGraph) -> None:
         PipelineCreation.fillInDataTypes(pipeline, self.registeredPipelines)
 
+    def savePipeline(self, pipeline: nx.DiGraph, path) -> None:
+        """
+        Writes the pipeline to path as JSON. The datatypes the registered pipelines already know are left out.
+        """
+        PipelineCreation.savePipeline(pipeline, path, self.registeredPipelines)
+
+    def loadPipeline(self, path) -> nx.DiGraph:
+        """
+        Reads a pipeline written by savePipeline.
+        """
+        return PipelineCreation.loadPipeline(path, self.registeredPipelines)
+
     def createPipeline(self,
                        name: str,
                        categories: list[str],
                        outputDirectory: pathlib.Path,
                        pipeline: nx.DiGraph,
-                       icon=None) -> None:
+                       icon=None,
+                       validator: Optional[PipelineCreation.PipelineValidator]=None,
+                       optimize: bool=True) -> PipelineCreation.OptimizationReport:
+        """
+        Writes the pipeline module to outputDirectory.
+
+        If optimize, steps whose outputs are not used and steps duplicating an earlier step are left out
+        of the generated code. Returns what was left out.
+        """
         icon = icon or _defaultIcon()
 
-        PipelineCreation.createPipeline(
+        return PipelineCreation.createPipeline(
             name=name,
             categories=categories,
             outputDirectory=outputDirectory,
             pipeline=pipeline,
             registeredPipelines=self.registeredPipelines,
-            icon=icon)
+            icon=icon,
+            validator=validator,
+            optimize=optimize)
+
+    # number of code objects kept by compilePipeline
+    compiledPipelineCacheSize = 16
+
+    def compilePipeline(self,
+                        name: str,
+                        categories: list[str],
+                        pipeline: nx.DiGraph,
+                        validator: Optional[PipelineCreation.PipelineValidator]=None) -> types.CodeType:
+        """
+        Generates the code of the pipeline module and compiles it, without writing anything to disk.
+
+        Code objects are cached by the hash of the pipeline graph, so compiling the same pipeline again
+        (e.g. testing it over and over while designing it) skips validation and code generation.
+        A cached code object is only used while the steps' pipelines are still the ones registered.
+        """
+        key = (name, tuple(categories), PipelineCreation.hashPipeline(pipeline))
+        cached = self._compiledPipelines.get(key)
+        if cached is not None and all(self.registeredPipelines.get(stepName) is info for stepName, info in cached[1].items()):
+            self._compiledPipelines.move_to_end(key)
+            return cached[0]
+
+        code = PipelineCreation.createPipelineCode(name, categories, pipeline, self.registeredPipelines, validator=validator)
+        filename = f"<PipelineCreator {name} {key[2][:12]}>"
+        # tracebacks and the debugger can show the generated code without it being in a file
+        linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+        codeObject = compile(code, filename, "exec")
+
+        stepNames = set(node[1] for node in pipeline.nodes if node[1] is not None)
+        self._compiledPipelines[key] = (codeObject, {stepName: self.registeredPipelines[stepName] for stepName in stepNames})
+        while len(self._compiledPipelines) > self.compiledPipelineCacheSize:
+            _, (evictedCode, _) = self._compiledPipelines.popitem(last=False)
+            linecache.cache.pop(evictedCode.co_filename, None)
+        return codeObject
+
+    @staticmethod
+    def loadCompiledPipeline(name: str, codeObject: types.CodeType) -> types.ModuleType:
+        """
+        Runs a code object made by compilePipeline as the python module name, which registers the pipeline.
+
+        The module is added to sys.modules, the caller is responsible for removing it and for removing
+        the pipeline from the registry once done.
+        """
+        module = types.ModuleType(name)
+        # needs to exist in sys.modules for some of the parameterPack stuff to work
+        sys.modules[name] = module
+        try:
+            exec(codeObject, module.__dict__)
+        except Exception:
+            sys.modules.pop(name)
+            raise
+        return module
+
+    def createValidator(self) -> PipelineCreation.PipelineValidator:
+        """
+        A validator for pipelines built from the registered pipelines, see PipelineValidator.
+        """
+        return PipelineCreation.PipelineValidator(self.registeredPipelines)
 
 #
 # Free functions
@@ -433,24 +594,92 @@ def _callAfterAllTheseModulesLoaded(callback, modules):
         slicer.app.moduleManager().moduleLoaded.connect(callbackWrapper)
 
 
-def singletonRegisterPipelineFunction(pipelineName, function, dependencies, categories):
+# key: name of a python module, value: the modules its @slicerPipeline functions depend on
+_pipelineModuleDependencies: dict[str, set[str]] = dict()
+
+
+def singletonRegisterPipelineFunction(pipelineName, function, dependencies, categories,
+                                      batchSetup=None, batchTeardown=None, requiredRepresentations=None,
+                                      sourceGraph=None, geometryOnlyVolumes=None):
     """
     This method will handle correctly registering the module regardless of if
     the pipeline creator has already been loaded into slicer when it is called
     """
+    _pipelineModuleDependencies.setdefault(function.__module__, set()).update(dependencies)
+
     def registerPipeline():
         PipelineCreatorLogic().registerPipeline(
-            pipelineName, function, dependencies, categories)
+            pipelineName, function, dependencies, categories,
+            batchSetup=batchSetup, batchTeardown=batchTeardown,
+            requiredRepresentations=requiredRepresentations, sourceGraph=sourceGraph,
+            geometryOnlyVolumes=geometryOnlyVolumes)
     _callAfterAllTheseModulesLoaded(registerPipeline, dependencies)
 
 
-def slicerPipeline(name=None, dependencies=None, categories=None):
+def _defaultManifestPath() -> str:
+    return os.path.join(slicer.app.cachePath, "SlicerPipelines", "PipelineManifest.json")
+
+
+def registerPipelineModules(moduleNames: list[str], manifestPath=None) -> None:
+    """
+    Registers the pipelines defined with @slicerPipeline in the given python modules.
+
+    Importing those modules can be slow (they import the modules they wrap), so the pipelines are
+    registered from a manifest when it is up to date, and a module is only imported the first time
+    one of its pipelines is called. Otherwise the module is imported right away and the manifest
+    is updated for the next time.
+
+    manifestPath defaults to a file in the Slicer cache directory.
+    """
+    manifestPath = manifestPath or _defaultManifestPath()
+    registrar = PipelineCreatorLogic().registrar
+    missingModuleNames = registrar.loadManifest(manifestPath, moduleNames, callAfterLoaded=_callAfterAllTheseModulesLoaded)
+    if not missingModuleNames:
+        return
+
+    for moduleName in missingModuleNames:
+        importlib.import_module(moduleName)
+
+    # the pipelines are only registered once their dependencies are loaded
+    dependencies = set()
+    for moduleName in missingModuleNames:
+        dependencies.update(_pipelineModuleDependencies.get(moduleName, set()))
+
+    def updateManifest():
+        try:
+            registrar.updateManifest(manifestPath, missingModuleNames)
+        except OSError as e:
+            # the manifest is only an optimization
+            logging.warning(f"Could not write the pipeline manifest '{manifestPath}': {e}")
+    _callAfterAllTheseModulesLoaded(updateManifest, dependencies)
+
+
+def slicerPipeline(name=None, dependencies=None, categories=None, batchSetup=None, batchTeardown=None,
+                   requiredRepresentations=None, sourceGraph=None, geometryOnlyVolumes=None):
     """
     Class decorator to automatically register a function with the PipelineCreator
+
+    batchSetup and batchTeardown are optional callables taking no arguments that are run once
+    before and once after a batch of calls (see runBatch).
+
+    requiredRepresentations is an optional dictionary from the names of segmentation parameters to
+    the segmentation representations the function needs, e.g. {"segmentation": ["Binary labelmap"]}.
+    Generated pipelines create those representations right before calling the function.
+
+    geometryOnlyVolumes is an optional list of the names of the volume parameters the function only
+    reads the geometry of (e.g. a reference volume). Generated pipelines allocate the voxels of
+    geometry only volumes (see createGeometryOnlyVolume) before calling a function with them, unless
+    they are given to one of those parameters.
+
+    sourceGraph is set by the code generated by createPipeline to the graph of the pipeline, so
+    pipelines using the generated one as a step can inline it.
     """
 
     def Inner(func):
-        singletonRegisterPipelineFunction(name, func, dependencies or [], categories or [])
+        singletonRegisterPipelineFunction(name, func, dependencies or [], categories or [],
+                                          batchSetup=batchSetup, batchTeardown=batchTeardown,
+                                          requiredRepresentations=requiredRepresentations,
+                                          sourceGraph=sourceGraph, geometryOnlyVolumes=geometryOnlyVolumes)
 
         return func
     return Inner
@@ -4,13 +4,14 @@ import pickle  # this shows as unused but is used by test_cleanType during the e
 import sys
 import tempfile
 import unittest
-from typing import Annotated
+from typing import Annotated, Optional
 
 import networkx as nx
 import qt
 import slicer
 import vtk
 from _PipelineCreator import PipelineCreation
+from _PipelineCreator.PipelineManifest import LazyPipelineInfo
 from _PipelineCreator.PipelineRegistrar import PipelineRegistrar
 from slicer import (vtkMRMLLabelMapVolumeNode, vtkMRMLModelNode,
                     vtkMRMLScalarVolumeNode, vtkMRMLSegmentationNode)
@@ -19,7 +20,9 @@ from slicer.parameterNodeWrapper import (Decimals, Default, Minimum,
                                          findChildWidgetForParameter,
                                          parameterPack)
 
-from PipelineCreator import PipelineCreatorLogic
+from PipelineCreator import (PipelineCancelledException, PipelineCreatorLogic, PipelineExecutionSettings, PipelineOwnedInputs,
+                             PipelineProfile, PipelineProgressCallback, PipelineProgressDispatcher, PipelineTracer,
+                             setupBatchHooks, traceSpan)
 
 
 class TempPythonModule:
@@ -81,6 +84,52 @@ def translate(mesh: vtkMRMLModelNode,
     model.SetAndObserveMesh(transformFilter.GetOutput())
     return model
 
+# records whether translateOwned was given ownership of its mesh
+ownedCalls = []
+
+def translateOwned(mesh: vtkMRMLModelNode,
+                   x: float,
+                   ownedInputs: PipelineOwnedInputs = PipelineOwnedInputs()) -> vtkMRMLModelNode:
+    ownedCalls.append("mesh" in ownedInputs)
+    transform = vtk.vtkTransform()
+    transform.Translate(x, 0, 0)
+    transformFilter = vtk.vtkTransformPolyDataFilter()
+    transformFilter.SetTransform(transform)
+    transformFilter.SetInputData(mesh.GetPolyData())
+    transformFilter.Update()
+    model = mesh if "mesh" in ownedInputs else slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+    model.SetAndObserveMesh(transformFilter.GetOutput())
+    return model
+
+def copies(mesh: vtkMRMLModelNode, count: int) -> list[vtkMRMLModelNode]:
+    models = []
+    for _ in range(count):
+        model = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+        polyData = vtk.vtkPolyData()
+        polyData.DeepCopy(mesh.GetPolyData())
+        model.SetAndObservePolyData(polyData)
+        models.append(model)
+    return models
+
+def last(models: list[vtkMRMLModelNode]) -> vtkMRMLModelNode:
+    return models[-1]
+
+def segmentationWithSurface(mesh: vtkMRMLModelNode) -> vtkMRMLSegmentationNode:
+    # binary labelmap source, with a derived closed surface
+    segmentation = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
+    slicer.modules.segmentations.logic().ImportModelToSegmentationNode(mesh, segmentation)
+    segmentation.CreateBinaryLabelmapRepresentation()
+    segmentation.SetMasterRepresentationToBinaryLabelmap()
+    segmentation.CreateClosedSurfaceRepresentation()
+    return segmentation
+
+seenRepresentations = []
+def labelmapOnly(segmentation: vtkMRMLSegmentationNode) -> vtkMRMLSegmentationNode:
+    representationNames = []
+    segmentation.GetSegmentation().GetContainedRepresentationNames(representationNames)
+    seenRepresentations.append(sorted(representationNames))
+    return segmentation
+
 def makeSphereModel(self):
     sphereSource = vtk.vtkSphereSource()
     sphereSource.Update()
@@ -148,6 +197,9 @@ def multiply(a: int, b: int) -> int:
 def strlen(s: str) -> int:
     return len(s)
 
+def failingAdd(a: int, b: int) -> int:
+    raise ValueError("failingAdd always fails")
+
 @parameterPack
 class PlusMinus:
     positive: int
@@ -156,6 +208,22 @@ class PlusMinus:
 def plusMinus(a: int) -> PlusMinus:
     return PlusMinus(a, -a)
 
+# records calls of the batch hooks
+batchEvents = []
+
+def batchSetupHook():
+    batchEvents.append("setup")
+
+def batchTeardownHook():
+    batchEvents.append("teardown")
+
+def failingBatchSetupHook():
+    batchEvents.append("failing setup")
+    raise RuntimeError("setup failed")
+
+def failingBatchTeardownHook():
+    batchEvents.append("failing teardown")
+
 def makeTestMathPipeline(registeredPipelines):
     """
     See also: funcTestMathPipeline
@@ -352,6 +420,123 @@ class PipelineCreatorRegistrationTest(unittest.TestCase):
         self.assertEqual(logic.registeredPipelines["subtraction"].returnType, int)
         self.assertEqual(logic.registeredPipelines["subtraction"].dependencies, [])
 
+    def test_indexes(self):
+        registrar = PipelineRegistrar()
+        registrar.registerPipeline("passthru", passthru, [], ["Models"])
+        registrar.registerPipeline("centerOfX", centerOfX, [], ["Models", "Measurements"])
+        registrar.registerPipeline("passThruScalarVolume", passThruScalarVolume, [], ["Volumes"])
+        registrar.registerPipeline("copies", copies, [])
+        registrar.registerPipeline("last", last, [])
+        registrar.registerPipeline("add", add, [])
+
+        self.assertEqual(registrar.categories, ["Measurements", "Models", "Volumes"])
+        self.assertEqual(registrar.pipelinesInCategory("Models"), {"passthru", "centerOfX"})
+        self.assertEqual(registrar.pipelinesInCategory("NotACategory"), set())
+        self.assertEqual(registrar.pipelinesWithInputType(vtkMRMLModelNode), {"passthru", "centerOfX", "copies"})
+        self.assertEqual(registrar.pipelinesWithReturnType(float), {"centerOfX"})
+        self.assertEqual(registrar.pipelinedTypes,
+                         {vtkMRMLModelNode, vtkMRMLScalarVolumeNode, float, int, list[vtkMRMLModelNode]})
+
+        # a label map is a scalar volume, but a scalar volume is not a label map
+        self.assertEqual(registrar.pipelinesConsuming(vtkMRMLLabelMapVolumeNode), {"passThruScalarVolume"})
+        self.assertEqual(registrar.pipelinesConsuming(vtkMRMLScalarVolumeNode), {"passThruScalarVolume"})
+        self.assertEqual(registrar.pipelinesConsuming(vtkMRMLModelNode), {"passthru", "centerOfX", "copies"})
+        self.assertEqual(registrar.pipelinesConsuming(list[vtkMRMLModelNode]), {"last"})
+        self.assertEqual(registrar.pipelinesConsuming(vtkMRMLSegmentationNode), set())
+
+        registrar.removePipeline("centerOfX")
+        registrar.removePipeline("last")
+        self.assertEqual(registrar.categories, ["Models", "Volumes"])
+        self.assertEqual(registrar.pipelinesWithReturnType(float), set())
+        self.assertEqual(registrar.pipelinesConsuming(vtkMRMLModelNode), {"passthru", "copies"})
+        self.assertEqual(registrar.pipelinesConsuming(list[vtkMRMLModelNode]), set())
+        self.assertEqual(registrar.pipelinedTypes,
+                         {vtkMRMLModelNode, vtkMRMLScalarVolumeNode, int, list[vtkMRMLModelNode]})
+
+    def test_manifest(self):
+        moduleCode = """
+from typing import Annotated
+from slicer import vtkMRMLModelNode
+from slicer.parameterNodeWrapper import Default, Minimum
+import manifestTestTypes
+
+def manifestPassthru(mesh: vtkMRMLModelNode, count: Annotated[int, Minimum(0), Default(2)]) -> vtkMRMLModelNode:
+    return mesh
+
+def manifestResult(mesh: vtkMRMLModelNode) -> manifestTestTypes.ManifestResult:
+    return manifestTestTypes.ManifestResult()
+"""
+        with tempfile.TemporaryDirectory() as tempDir:
+            modulePath = os.path.join(tempDir, "manifestTestModule.py")
+            with open(modulePath, "w") as moduleFile:
+                moduleFile.write(moduleCode)
+            typesPath = os.path.join(tempDir, "manifestTestTypes.py")
+            with open(typesPath, "w") as typesFile:
+                typesFile.write("class ManifestResult:\n    pass\n")
+            manifestPath = os.path.join(tempDir, "manifest.json")
+            sys.path.insert(0, tempDir)
+            try:
+                module = importlib.import_module("manifestTestModule")
+                registrar = PipelineRegistrar()
+                registrar.registerPipeline("manifestPassthru", module.manifestPassthru, ["Models"], ["Tests"])
+                registrar.registerPipeline("manifestResult", module.manifestResult, [], ["Tests"])
+                registrar.updateManifest(manifestPath, ["manifestTestModule"])
+                expectedParameters = registrar.registeredPipelines["manifestPassthru"].parameters
+
+                # a new registrar is filled from the manifest without importing the module
+                sys.modules.pop("manifestTestModule")
+                registrar = PipelineRegistrar()
+                self.assertEqual(registrar.loadManifest(manifestPath, ["manifestTestModule", "notInTheManifest"]),
+                                 ["notInTheManifest"])
+                info = registrar.registeredPipelines["manifestPassthru"]
+                self.assertIsInstance(info, LazyPipelineInfo)
+                self.assertEqual(info.dependencies, ["Models"])
+                self.assertEqual(info.categories, ["Tests"])
+                self.assertEqual(info.parameters, expectedParameters)
+                self.assertEqual(info.returnType, vtkMRMLModelNode)
+                self.assertNotIn("manifestTestModule", sys.modules)
+
+                # the function is imported on first use
+                self.assertIsNone(info.function(None, 2))
+                self.assertIn("manifestTestModule", sys.modules)
+
+                # the real registration replaces the one from the manifest
+                registrar.registerPipeline("manifestPassthru", sys.modules["manifestTestModule"].manifestPassthru, ["Models"])
+                self.assertNotIsInstance(registrar.registeredPipelines["manifestPassthru"], LazyPipelineInfo)
+                with self.assertRaises(RuntimeError):
+                    registrar.registerPipeline("manifestPassthru", sys.modules["manifestTestModule"].manifestPassthru, [])
+
+                # the pipelines wait for their dependencies to be loaded, like with @slicerPipeline
+                waiting = []
+                registrar = PipelineRegistrar()
+                self.assertEqual(registrar.loadManifest(manifestPath, ["manifestTestModule"],
+                                                        callAfterLoaded=lambda callback, dependencies: waiting.append((callback, dependencies))),
+                                 [])
+                self.assertNotIn("manifestPassthru", registrar.registeredPipelines)
+                self.assertEqual(sorted(dependencies for _, dependencies in waiting), [[], ["Models"]])
+                for callback, _ in waiting:
+                    callback()
+                self.assertIsInstance(registrar.registeredPipelines["manifestPassthru"], LazyPipelineInfo)
+
+                # changing a module whose types are pickled in the entries invalidates them
+                mtime = os.stat(typesPath).st_mtime_ns + 10**9
+                os.utime(typesPath, ns=(mtime, mtime))
+                self.assertEqual(PipelineRegistrar().loadManifest(manifestPath, ["manifestTestModule"]), ["manifestTestModule"])
+
+                # and so does changing the module
+                registrar = PipelineRegistrar()
+                registrar.registerPipeline("manifestPassthru", module.manifestPassthru, ["Models"], ["Tests"])
+                registrar.registerPipeline("manifestResult", module.manifestResult, [], ["Tests"])
+                registrar.updateManifest(manifestPath, ["manifestTestModule"])
+                self.assertEqual(PipelineRegistrar().loadManifest(manifestPath, ["manifestTestModule"]), [])
+                mtime = os.stat(modulePath).st_mtime_ns + 10**9
+                os.utime(modulePath, ns=(mtime, mtime))
+                self.assertEqual(PipelineRegistrar().loadManifest(manifestPath, ["manifestTestModule"]), ["manifestTestModule"])
+            finally:
+                sys.path.remove(tempDir)
+                sys.modules.pop("manifestTestModule", None)
+                sys.modules.pop("manifestTestTypes", None)
+
 
 class PipelineCreatorValidationTest(unittest.TestCase):
     def setUp(self) -> None:
@@ -434,6 +619,17 @@ class PipelineCreatorValidationTest(unittest.TestCase):
 
         PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
 
+    def test_compatible_types(self):
+        from _PipelineCreator.PipelineCreation.util import isCompatibleType
+        self.assertTrue(isCompatibleType(vtkMRMLLabelMapVolumeNode, vtkMRMLScalarVolumeNode))
+        self.assertFalse(isCompatibleType(vtkMRMLScalarVolumeNode, vtkMRMLLabelMapVolumeNode))
+        self.assertTrue(isCompatibleType(list[vtkMRMLModelNode], list[vtkMRMLModelNode]))
+        self.assertTrue(isCompatibleType(list[vtkMRMLLabelMapVolumeNode], list[vtkMRMLScalarVolumeNode]))
+        self.assertFalse(isCompatibleType(list[vtkMRMLScalarVolumeNode], list[vtkMRMLLabelMapVolumeNode]))
+        self.assertFalse(isCompatibleType(list[vtkMRMLModelNode], vtkMRMLModelNode))
+        self.assertFalse(isCompatibleType(vtkMRMLModelNode, list[vtkMRMLModelNode]))
+        self.assertFalse(isCompatibleType(list[int], dict[int, int]))
+
     def test_pipeline_validation_fail_no_datatype_on_step0(self):
         pipeline = self._makeDefaultTestPipeline()
         del pipeline.nodes[(0, None, "translateX")]["datatype"]
@@ -471,6 +667,311 @@ class PipelineCreatorValidationTest(unittest.TestCase):
         with self.assertRaises(TypeError):
             PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
 
+    def _assertValidatorMatches(self, validator, pipeline):
+        expected = pipeline.copy()
+        errors = validator.findErrors(pipeline)
+        try:
+            PipelineCreation.validation.validatePipeline(expected, self.logic.registeredPipelines)
+        except Exception as e:
+            self.assertGreater(len(errors), 0)
+            self.assertEqual(type(errors[0]), type(e))
+            self.assertEqual(str(errors[0]), str(e))
+            return errors
+        self.assertEqual(errors, [])
+        self.assertEqual(dict(pipeline.nodes(data=True)), dict(expected.nodes(data=True)))
+        return errors
+
+    def test_validator(self):
+        def removeDataType(pipeline):
+            del pipeline.nodes[(0, None, "translateX")]["datatype"]
+        def removeFixedValue(pipeline):
+            del pipeline.nodes[(2, "translate", "z")]["fixed_value"]
+        def badFixedValue(pipeline):
+            pipeline.nodes[(2, "translate", "z")]["fixed_value"] = "This is not a number"
+        def unregisteredStep(pipeline):
+            nx.relabel_nodes(pipeline, {n: (n[0], "notRegistered", n[2]) for n in pipeline.nodes if n[0] == 2}, copy=False)
+        def backwardConnection(pipeline):
+            pipeline.remove_edge((0, None, "reduction"), (1, "decimation", "reduction"))
+            pipeline.add_edge((2, "translate", "return"), (1, "decimation", "reduction"))
+        def badConnectionType(pipeline):
+            pipeline.remove_edge((1, "decimation", "return"), (2, "translate", "mesh"))
+            pipeline.add_edge((0, None, "translateX"), (2, "translate", "mesh"))
+        def skippedStep(pipeline):
+            nx.relabel_nodes(pipeline, {(3, None, "outputMesh"): (4, None, "outputMesh")}, copy=False)
+        def missingParameter(pipeline):
+            pipeline.remove_node((2, "translate", "y"))
+
+        # the same validator is used throughout, so results are computed from the cache as much as possible
+        validator = PipelineCreation.PipelineValidator(self.logic.registeredPipelines)
+        self._assertValidatorMatches(validator, self._makeDefaultTestPipeline())
+        for mutation in (removeDataType, removeFixedValue, badFixedValue, unregisteredStep,
+                         backwardConnection, badConnectionType, skippedStep, missingParameter):
+            with self.subTest(mutation=mutation.__name__):
+                pipeline = self._makeDefaultTestPipeline()
+                mutation(pipeline)
+                self._assertValidatorMatches(validator, pipeline)
+                # and back to a valid pipeline
+                self._assertValidatorMatches(validator, self._makeDefaultTestPipeline())
+
+        # all errors are reported at once
+        pipeline = self._makeDefaultTestPipeline()
+        badFixedValue(pipeline)
+        badConnectionType(pipeline)
+        errors = self._assertValidatorMatches(validator, pipeline)
+        self.assertEqual([type(e) for e in errors], [TypeError, TypeError])
+        with self.assertRaises(PipelineCreation.PipelineValidationError) as context:
+            validator.validate(pipeline)
+        self.assertEqual(len(context.exception.errors), 2)
+
+        self.assertEqual(validator.findErrors(nx.DiGraph())[0].args, ("Cannot have an empty pipeline",))
+        validator.validate(self._makeDefaultTestPipeline())
+
+class PipelineCreatorOptimizationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        slicer.mrmlScene.Clear()
+        self.logic = PipelineCreatorLogic(False)
+        self.logic.registerPipeline("add", add, [])
+        self.logic.registerPipeline("multiply", multiply, [])
+        self.logic.registerPipeline("strlen", strlen, [])
+
+    def _makeRedundantPipeline(self):
+        """
+        Computes len(string) + len(string), where the second strlen is a copy of the first,
+        and computes additive * factor for nothing.
+        """
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "string"), datatype=str, position=0)
+        pipeline.add_node((0, None, "additive"), datatype=int, position=1)
+        pipeline.add_node((0, None, "factor"), datatype=int, position=2)
+
+        pipeline.add_node((1, "strlen", "s"))
+        pipeline.add_node((1, "strlen", "return"))
+
+        pipeline.add_node((2, "multiply", "a"))
+        pipeline.add_node((2, "multiply", "b"))
+        pipeline.add_node((2, "multiply", "return"))
+
+        pipeline.add_node((3, "strlen", "s"))
+        pipeline.add_node((3, "strlen", "return"))
+
+        pipeline.add_node((4, "add", "a"))
+        pipeline.add_node((4, "add", "b"))
+        pipeline.add_node((4, "add", "return"))
+
+        pipeline.add_node((5, None, "value"), datatype=int)
+
+        pipeline.add_edges_from([
+            ((0, None, "string"),     (1, "strlen", "s")),
+            ((0, None, "additive"),   (2, "multiply", "a")),
+            ((0, None, "factor"),     (2, "multiply", "b")),
+            ((0, None, "string"),     (3, "strlen", "s")),
+            ((1, "strlen", "return"), (4, "add", "a")),
+            ((3, "strlen", "return"), (4, "add", "b")),
+            ((4, "add", "return"),    (5, None, "value")),
+        ])
+        PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
+        return pipeline
+
+    def _run(self, pipeline, *args):
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipeline", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        with TempPythonModule("\n".join([code.imports, code.code])) as tempModule:
+            return tempModule.TestPipelineLogic().run(*args)
+
+    def test_optimize(self):
+        pipeline = self._makeRedundantPipeline()
+        numNodes = len(pipeline.nodes)
+        optimized, report = PipelineCreation.optimizePipeline(pipeline)
+
+        # the original is left alone
+        self.assertEqual(len(pipeline.nodes), numNodes)
+
+        self.assertTrue(report.changed)
+        self.assertEqual(report.removedSteps, [(2, "multiply")])
+        self.assertEqual(report.mergedSteps, [(3, 1, "strlen")])
+        self.assertEqual(report.stepMapping, {0: 0, 1: 1, 4: 2, 5: 3})
+        self.assertEqual(PipelineCreation.util.numSteps(optimized), 4)
+        self.assertEqual(set(optimized.predecessors((2, "add", "a"))), {(1, "strlen", "return")})
+        self.assertEqual(set(optimized.predecessors((2, "add", "b"))), {(1, "strlen", "return")})
+        PipelineCreation.validation.validatePipeline(optimized, self.logic.registeredPipelines)
+
+        for args in [("hi", 2, 3), ("", 0, 0), ("hello", -1, 7)]:
+            self.assertEqual(self._run(optimized, *args), self._run(pipeline, *args))
+
+        # optimizing again changes nothing
+        again, report = PipelineCreation.optimizePipeline(optimized)
+        self.assertFalse(report.changed)
+        self.assertEqual(PipelineCreation.hashPipeline(again), PipelineCreation.hashPipeline(optimized))
+
+    def test_optimize_keeps_different_steps(self):
+        # different fixed values are different computations
+        pipeline = self._makeRedundantPipeline()
+        pipeline.remove_edge((0, None, "string"), (1, "strlen", "s"))
+        pipeline.remove_edge((0, None, "string"), (3, "strlen", "s"))
+        pipeline.nodes[(1, "strlen", "s")]["fixed_value"] = "one"
+        pipeline.nodes[(3, "strlen", "s")]["fixed_value"] = "three"
+        _, report = PipelineCreation.optimizePipeline(pipeline)
+        self.assertEqual(report.mergedSteps, [])
+
+        # returning both duplicates must still return two objects
+        pipeline = self._makeRedundantPipeline()
+        pipeline.remove_nodes_from([(4, "add", "a"), (4, "add", "b"), (4, "add", "return"), (5, None, "value")])
+        pipeline.add_node((4, None, "first"), datatype=int, position=0)
+        pipeline.add_node((4, None, "second"), datatype=int, position=1)
+        pipeline.add_edges_from([
+            ((1, "strlen", "return"), (4, None, "first")),
+            ((3, "strlen", "return"), (4, None, "second")),
+        ])
+        optimized, report = PipelineCreation.optimizePipeline(pipeline)
+        self.assertEqual(report.removedSteps, [(2, "multiply")])
+        self.assertEqual(report.mergedSteps, [])
+        self.assertEqual(PipelineCreation.util.numSteps(optimized), 4)
+
+class PipelineCreatorSerializationTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.logic = PipelineCreatorLogic(False)
+        self.logic.registerPipeline("add", add, [])
+        self.logic.registerPipeline("multiply", multiply, [])
+        self.logic.registerPipeline("strlen", strlen, [])
+
+    def assertSamePipeline(self, lhs, rhs):
+        self.assertEqual(dict(lhs.nodes(data=True)), dict(rhs.nodes(data=True)))
+        self.assertEqual(set(lhs.edges), set(rhs.edges))
+        self.assertEqual(PipelineCreation.hashPipeline(lhs), PipelineCreation.hashPipeline(rhs))
+
+    def test_round_trip(self):
+        pipeline = makeTestMathPipeline(self.logic.registeredPipelines)
+        pipeline.nodes[(0, None, "string")]["position"] = (0, "tuple", [1.5, None])
+        pipeline.graph["note"] = "made by a test"
+
+        text = PipelineCreation.serializePipeline(pipeline)
+        self.assertSamePipeline(PipelineCreation.deserializePipeline(text), pipeline)
+        self.assertEqual(PipelineCreation.deserializePipeline(text).graph, pipeline.graph)
+
+        # the datatypes of the steps can be left to the registered pipelines
+        compact = PipelineCreation.serializePipeline(pipeline, self.logic.registeredPipelines)
+        self.assertLess(len(compact), len(text))
+        self.assertSamePipeline(
+            PipelineCreation.deserializePipeline(compact, self.logic.registeredPipelines), pipeline)
+
+        with tempfile.TemporaryDirectory() as tempDir:
+            path = os.path.join(tempDir, "pipeline.json")
+            self.logic.savePipeline(pipeline, path)
+            self.assertSamePipeline(self.logic.loadPipeline(path), pipeline)
+
+    def test_annotated_types(self):
+        import base64
+        import json
+        import typing
+        self.logic.registerPipeline("decimation", decimation, [])
+        reduction = Annotated[float, WithinRange(0, 1), Default(0.25)]
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "mesh"), datatype=vtkMRMLModelNode, position=0)
+        pipeline.add_node((0, None, "reduction"), datatype=Optional[reduction], position=1)
+        pipeline.add_node((1, "decimation", "mesh"))
+        pipeline.add_node((1, "decimation", "reduction"))
+        pipeline.add_node((1, "decimation", "return"))
+        pipeline.add_node((2, None, "mesh"), datatype=vtkMRMLModelNode)
+        pipeline.add_edge((0, None, "mesh"), (1, "decimation", "mesh"))
+        pipeline.add_edge((0, None, "reduction"), (1, "decimation", "reduction"))
+        pipeline.add_edge((1, "decimation", "return"), (2, None, "mesh"))
+        PipelineCreation.fillInDataTypes(pipeline, self.logic.registeredPipelines)
+
+        # annotated types are stored as their type and the fields of their annotations
+        text = PipelineCreation.serializePipeline(pipeline)
+        self.assertNotIn('"pickle"', text)
+
+        loaded = PipelineCreation.deserializePipeline(text, self.logic.registeredPipelines)
+        for node in pipeline.nodes:
+            original = pipeline.nodes[node]["datatype"]
+            datatype = loaded.nodes[node]["datatype"]
+            if node == (0, None, "reduction"):
+                original, datatype = typing.get_args(original)[0], typing.get_args(datatype)[0]
+            self.assertEqual(typing.get_origin(datatype), typing.get_origin(original))
+            self.assertEqual(typing.get_args(datatype)[:1], typing.get_args(original)[:1])
+            self.assertEqual([(type(a), vars(a)) for a in getattr(datatype, "__metadata__", [])],
+                             [(type(a), vars(a)) for a in getattr(original, "__metadata__", [])])
+
+        # a pickled value is only unpickled if it only uses the allowed modules
+        serialized = json.loads(text)
+        serialized["graph"]["note"] = {"pickle": base64.b64encode(pickle.dumps(os.system)).decode("ascii")}
+        with self.assertRaises(ValueError):
+            PipelineCreation.deserializePipeline(json.dumps(serialized), self.logic.registeredPipelines)
+        # so is an annotation whose class is not in the allowed modules
+        serialized = json.loads(text)
+        serialized["graph"]["note"] = {"object": {"class": "subprocess:Popen", "fields": {}}}
+        with self.assertRaises(ValueError):
+            PipelineCreation.deserializePipeline(json.dumps(serialized), self.logic.registeredPipelines)
+
+    def test_versions(self):
+        import json
+        serialized = json.loads(PipelineCreation.serializePipeline(nx.DiGraph()))
+        serialized["version"] += 1
+        with self.assertRaises(ValueError):
+            PipelineCreation.deserializePipeline(json.dumps(serialized))
+        with self.assertRaises(ValueError):
+            PipelineCreation.deserializePipeline(json.dumps({"nodes": [], "edges": []}))
+
+class PipelineCreatorWidgetTest(unittest.TestCase):
+    def test_reference_combo_box_updates(self):
+        from Widgets.ReferenceComboBox import ReferenceComboBox
+        from Widgets.Types import Reference
+
+        owner = object()
+        def makeReferences(firstName="a"):
+            return [Reference(owner, 0, 0, None, firstName, int), Reference(owner, 1, 0, None, "b", str)]
+
+        combo = ReferenceComboBox(int, makeReferences())
+        self.assertEqual(combo.references, makeReferences()[:1])
+        combo.currentReference = combo.references[0]
+        changes = []
+        combo.referenceChanged.connect(lambda: changes.append(combo.currentReference))
+
+        # rebuilt but identical references keep the choice quietly
+        combo.references = makeReferences()
+        self.assertEqual(combo.currentReference, makeReferences()[0])
+        self.assertEqual(changes, [])
+
+        # renaming keeps the choice and updates the text
+        combo.references = makeReferences("renamed")
+        self.assertEqual(combo.currentReference.name, "step0_None_renamed")
+        self.assertEqual(combo._combobox.itemText(1), "step0_None_renamed")
+        self.assertEqual(changes, [])
+
+        # removing the chosen reference chooses None
+        combo.references = []
+        self.assertIsNone(combo.currentReference)
+        self.assertEqual(changes, [None])
+
+class PipelineCreatorProgressTest(unittest.TestCase):
+    def test_progress_dispatcher(self):
+        now = [0.0]
+        reports = []
+        dispatcher = PipelineProgressDispatcher(lambda *report: reports.append(report), maxRate=10, clock=lambda: now[0])
+        callback = PipelineProgressCallback(dispatcher)
+
+        # the first report goes through, the next ones within 0.1s are coalesced
+        for piece in range(4):
+            callback.reportProgress("piece", 0.0, piece, 10)
+        self.assertEqual([report[2] for report in reports], [0])
+
+        # once the interval passed, the latest report goes through
+        now[0] = 0.1
+        callback.reportProgress("piece", 0.5, 4, 10)
+        self.assertEqual([report[2] for report in reports], [0, 4])
+
+        callback.reportProgress("piece", 0.0, 5, 10)
+        dispatcher.flush()
+        self.assertEqual([report[2] for report in reports], [0, 4, 5])
+
+        # the final state is never held back
+        callback.reportProgress("piece", 0.0, 6, 10)
+        callback.reportProgress("", 0.0, 10, 10)
+        self.assertEqual(reports[-1], (1.0, "", 10, 10))
+        self.assertEqual(dispatcher.dispatchedUpdates, 4)
+        self.assertEqual(dispatcher.droppedUpdates, 4)
+
 class PipelineCreatorCodeGenModuleTests(unittest.TestCase):
 
     def tearDown(self) -> None:
@@ -544,6 +1045,149 @@ class PipelineCreatorCodeGenLogicTests(unittest.TestCase):
             self.assertEqual(logic.run("hello", 12, -3), funcTestMathPipeline("hello", 12, -3))
             self.assertEqual(logic.run("", 0, 0), funcTestMathPipeline("", 0, 0))
 
+    def test_cancel(self):
+        pipeline = makeTestMathPipeline(self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipeline", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule:
+            logic = tempModule.TestPipelineLogic()
+
+            reported = []
+            callback = PipelineProgressCallback()
+            def onProgress(totalProgress, pieceName, pieceNumber, numberOfPieces):
+                reported.append(pieceName)
+                if pieceName == "add":
+                    callback.cancel()
+            callback.setCallback(onProgress)
+
+            # the step running when cancelling finishes, the next one does not start
+            with self.assertRaises(PipelineCancelledException):
+                logic.run("hi", 2, 3, progress_callback=callback)
+            self.assertEqual(reported, ["", "strlen", "add"])
+
+            # sub callbacks given to the steps are cancelled with their parent
+            self.assertTrue(callback.getSubCallback(1, 4).getSubCallback(0, 2).cancelled)
+
+    def test_profile(self):
+        pipeline = makeTestMathPipeline(self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipeline", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule:
+            logic = tempModule.TestPipelineLogic()
+            # without a profile nothing is recorded
+            self.assertEqual(logic.run("hi", 2, 3), funcTestMathPipeline("hi", 2, 3))
+
+            profile = PipelineProfile()
+            self.assertEqual(logic.run("hi", 2, 3, progress_callback=PipelineProgressCallback(profile=profile)),
+                             funcTestMathPipeline("hi", 2, 3))
+            self.assertEqual([(step.label, step.name) for step in profile.steps],
+                             [("1", "strlen"), ("2", "add"), ("3", "multiply"), ("4", "add")])
+            for step in profile.steps:
+                self.assertGreaterEqual(step.wallTime, 0)
+                self.assertEqual(step.vtkDataMemory, 0)
+                self.assertEqual(step.steps, [])
+            self.assertEqual(len(profile.toDict()["steps"]), 4)
+
+        # steps of the pipelines run by a step are its children
+        profile = PipelineProfile()
+        callback = PipelineProgressCallback(profile=profile)
+        callback.beginStep("outer", "1")
+        callback.getSubCallback(0, 1).beginStep("inner", "1")
+        model = makeSphereModel(self)
+        callback.getSubCallback(0, 1).endStep(model)
+        callback.endStep([model, None])
+        self.assertEqual(profile.steps[0].steps[0].name, "inner")
+        self.assertGreater(profile.steps[0].steps[0].vtkDataMemory, 0)
+        self.assertEqual(profile.steps[0].vtkDataMemory, profile.steps[0].steps[0].vtkDataMemory)
+
+    def test_trace(self):
+        import json
+        pipeline = makeTestMathPipeline(self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        from _PipelineCreator.PipelineTracing import currentTracer
+        code = createLogic("TestPipeline", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule, tempfile.TemporaryDirectory() as tempDir:
+            logic = tempModule.TestPipelineLogic()
+            path = os.path.join(tempDir, "trace.json")
+            with PipelineTracer(path):
+                with traceSpan("outer", "test"):
+                    self.assertEqual(logic.run("hi", 2, 3), funcTestMathPipeline("hi", 2, 3))
+            # tracing is off again
+            self.assertIsNone(currentTracer())
+            with traceSpan("ignored"):
+                pass
+
+            with open(path) as file:
+                events = json.load(file)["traceEvents"]
+            spans = [(event["ph"], event.get("name")) for event in events if event["ph"] in ("B", "E")]
+            self.assertEqual(spans, [
+                ("B", "outer"),
+                ("B", "strlen"), ("E", None),
+                ("B", "add"), ("E", None),
+                ("B", "multiply"), ("E", None),
+                ("B", "add"), ("E", None),
+                ("E", None),
+            ])
+            self.assertTrue(any(event["ph"] == "M" and event["name"] == "thread_name" for event in events))
+            timestamps = [event["ts"] for event in events if event["ph"] in ("B", "E")]
+            self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_failed_step_is_ended(self):
+        import json
+        self.logic.registerPipeline("failingAdd", failingAdd, [])
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "a"), datatype=int, position=0)
+        pipeline.add_node((1, "add", "a"))
+        pipeline.add_node((1, "add", "b"), fixed_value=1)
+        pipeline.add_node((1, "add", "return"))
+        pipeline.add_node((2, "failingAdd", "a"))
+        pipeline.add_node((2, "failingAdd", "b"), fixed_value=2)
+        pipeline.add_node((2, "failingAdd", "return"))
+        pipeline.add_node((3, None, "value"), datatype=int)
+        pipeline.add_edges_from([
+            ((0, None, "a"), (1, "add", "a")),
+            ((1, "add", "return"), (2, "failingAdd", "a")),
+            ((2, "failingAdd", "return"), (3, None, "value")),
+        ])
+        PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipeline", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule, tempfile.TemporaryDirectory() as tempDir:
+            logic = tempModule.TestPipelineLogic()
+            profile = PipelineProfile()
+            path = os.path.join(tempDir, "trace.json")
+            with PipelineTracer(path):
+                with self.assertRaises(ValueError):
+                    logic.run(1, progress_callback=PipelineProgressCallback(profile=profile))
+
+            # the failed step is in the profile and the next step of the profile is not nested in it
+            self.assertEqual([step.name for step in profile.steps], ["add", "failingAdd"])
+            self.assertEqual(profile.steps[1].vtkDataMemory, 0)
+            profile.beginStep("next", "1")
+            profile.endStep()
+            self.assertEqual([step.name for step in profile.steps], ["add", "failingAdd", "next"])
+
+            with open(path) as file:
+                events = json.load(file)["traceEvents"]
+            spans = [(event["ph"], event.get("name")) for event in events if event["ph"] in ("B", "E")]
+            self.assertEqual(spans, [("B", "add"), ("E", None), ("B", "failingAdd"), ("E", None)])
+
     def test_multiple_overall_outputs(self):
         pipeline = nx.DiGraph()
 
@@ -684,6 +1328,387 @@ class PipelineCreatorCodeGenLogicTests(unittest.TestCase):
             newNumModels = slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLModelNode")
             self.assertEqual(newNumModels - numModels, 2)
 
+    def test_run_batch(self):
+        self.logic.registerPipeline("batchAdd", add, ["add"], batchSetup=batchSetupHook, batchTeardown=batchTeardownHook)
+
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "a"), datatype=int, position=0)
+        pipeline.add_node((0, None, "b"), datatype=int, position=1)
+        pipeline.add_node((1, "batchAdd", "a"))
+        pipeline.add_node((1, "batchAdd", "b"))
+        pipeline.add_node((1, "batchAdd", "return"))
+        pipeline.add_node((2, "add", "a"))
+        pipeline.add_node((2, "add", "b"), fixed_value=1)
+        pipeline.add_node((2, "add", "return"))
+        pipeline.add_node((3, None, "value"), datatype=int)
+        pipeline.add_edges_from([
+            ((0, None, "a"), (1, "batchAdd", "a")),
+            ((0, None, "b"), (1, "batchAdd", "b")),
+            ((1, "batchAdd", "return"), (2, "add", "a")),
+            ((2, "add", "return"), (3, None, "value")),
+        ])
+        PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipelineBatch", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule:
+            logic = tempModule.TestPipelineBatchLogic()
+
+            batchEvents.clear()
+            inputs = [{"a": 1, "b": 2}, {"a": 3, "b": 4}, {"a": -5, "b": 5}]
+            results = logic.run_batch(inputs)
+            # nothing runs until the results are requested
+            self.assertEqual(batchEvents, [])
+            self.assertEqual(list(results), [4, 8, 1])
+            self.assertEqual(batchEvents, ["setup", "teardown"])
+
+            # errors can be skipped
+            batchEvents.clear()
+            errors = []
+            results = list(logic.run_batch([{"a": 1, "b": 2}, {"a": "a", "b": 2}, {"a": 3, "b": 4}],
+                                           on_error=lambda index, e: errors.append(index)))
+            self.assertEqual(results, [4, 8])
+            self.assertEqual(errors, [1])
+            self.assertEqual(batchEvents, ["setup", "teardown"])
+
+            # or end the batch, but the teardown still happens
+            batchEvents.clear()
+            with self.assertRaises(TypeError):
+                list(logic.run_batch([{"a": "a", "b": 2}]))
+            self.assertEqual(batchEvents, ["setup", "teardown"])
+
+    def test_batch_setup_failure(self):
+        # only the hooks whose setup ran are torn down, in reverse order
+        batchEvents.clear()
+        with self.assertRaises(RuntimeError):
+            setupBatchHooks([(batchSetupHook, batchTeardownHook),
+                             (None, lambda: batchEvents.append("teardown only")),
+                             (failingBatchSetupHook, failingBatchTeardownHook),
+                             (batchSetupHook, batchTeardownHook)])
+        self.assertEqual(batchEvents, ["setup", "failing setup", "teardown only", "teardown"])
+
+        self.logic.registerPipeline("batchAdd", add, ["add"], batchSetup=batchSetupHook, batchTeardown=batchTeardownHook)
+        self.logic.registerPipeline("failingBatchAdd", add, ["add"], batchSetup=failingBatchSetupHook,
+                                    batchTeardown=failingBatchTeardownHook)
+
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "a"), datatype=int, position=0)
+        pipeline.add_node((1, "batchAdd", "a"))
+        pipeline.add_node((1, "batchAdd", "b"), fixed_value=1)
+        pipeline.add_node((1, "batchAdd", "return"))
+        pipeline.add_node((2, "failingBatchAdd", "a"))
+        pipeline.add_node((2, "failingBatchAdd", "b"), fixed_value=1)
+        pipeline.add_node((2, "failingBatchAdd", "return"))
+        pipeline.add_node((3, None, "value"), datatype=int)
+        pipeline.add_edges_from([
+            ((0, None, "a"), (1, "batchAdd", "a")),
+            ((1, "batchAdd", "return"), (2, "failingBatchAdd", "a")),
+            ((2, "failingBatchAdd", "return"), (3, None, "value")),
+        ])
+        PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipelineBatchFailure", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule:
+            logic = tempModule.TestPipelineBatchFailureLogic()
+            batchEvents.clear()
+            with self.assertRaises(RuntimeError):
+                list(logic.run_batch([{"a": 1}]))
+            self.assertEqual(batchEvents, ["setup", "failing setup", "teardown"])
+
+            # a later batch starts from scratch
+            batchEvents.clear()
+            with self.assertRaises(RuntimeError):
+                list(logic.run_batch([{"a": 1}]))
+            self.assertEqual(batchEvents, ["setup", "failing setup", "teardown"])
+
+    def test_registered_run_batch(self):
+        self.logic.registerPipeline("batchAdd", add, ["add"], batchSetup=batchSetupHook, batchTeardown=batchTeardownHook)
+        info = self.logic.registeredPipelines["batchAdd"]
+        self.assertIs(info.batchSetup, batchSetupHook)
+        self.assertIs(info.batchTeardown, batchTeardownHook)
+
+        batchEvents.clear()
+        self.assertEqual(list(info.runBatch([{"a": 1, "b": 1}, {"a": 2, "b": 2}])), [2, 4])
+        self.assertEqual(batchEvents, ["setup", "teardown"])
+
+        # pipelines without hooks can still be batched
+        self.assertEqual(list(self.logic.registeredPipelines["multiply"].runBatch([{"a": 2, "b": 3}])), [6])
+
+    def test_owned_inputs(self):
+        self.logic.registerPipeline("translateOwned", translateOwned, ["translateOwned"])
+        info = self.logic.registeredPipelines["translateOwned"]
+        self.assertEqual(info.ownedInputsName, "ownedInputs")
+        self.assertEqual(list(info.parameters.keys()), ["mesh", "x"])
+
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "mesh"), datatype=vtkMRMLModelNode)
+        pipeline.add_node((1, "translateOwned", "mesh"))
+        pipeline.add_node((1, "translateOwned", "x"), fixed_value=1.0)
+        pipeline.add_node((1, "translateOwned", "return"))
+        pipeline.add_node((2, "translateOwned", "mesh"))
+        pipeline.add_node((2, "translateOwned", "x"), fixed_value=2.0)
+        pipeline.add_node((2, "translateOwned", "return"))
+        pipeline.add_node((3, "translateOwned", "mesh"))
+        pipeline.add_node((3, "translateOwned", "x"), fixed_value=3.0)
+        pipeline.add_node((3, "translateOwned", "return"))
+        pipeline.add_node((4, None, "outputMesh"), datatype=vtkMRMLModelNode)
+        pipeline.add_edges_from([
+            ((0, None, "mesh"), (1, "translateOwned", "mesh")),
+            ((1, "translateOwned", "return"), (2, "translateOwned", "mesh")),
+            ((2, "translateOwned", "return"), (3, "translateOwned", "mesh")),
+            ((3, "translateOwned", "return"), (4, None, "outputMesh")),
+        ])
+        PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipelineOwnedInputs", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule:
+            logic = tempModule.TestPipelineOwnedInputsLogic()
+            model = makeSphereModel(self)
+            numModels = slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLModelNode")
+
+            # the user's input is never owned, the intermediates are
+            ownedCalls.clear()
+            output = logic.run(model)
+            self.assertEqual(ownedCalls, [False, True, True])
+            self.assertEqual(model.GetMesh().GetCenter(), (0.0, 0.0, 0.0))
+            self.assertAlmostEqual(output.GetMesh().GetCenter()[0], 6.0)
+            # the intermediate that was modified in place is the output, so it is not deleted
+            self.assertEqual(slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLModelNode") - numModels, 1)
+            self.assertTrue(slicer.mrmlScene.IsNodePresent(output))
+
+            # intermediates the user wants to keep must not be modified
+            ownedCalls.clear()
+            logic.run(model, delete_intermediate_nodes=False)
+            self.assertEqual(ownedCalls, [False, False, False])
+
+    def test_list_of_nodes(self):
+        self.logic.registerPipeline("copies", copies, [])
+        self.logic.registerPipeline("last", last, [])
+
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "mesh"), datatype=vtkMRMLModelNode, position=0)
+        pipeline.add_node((1, "copies", "mesh"))
+        pipeline.add_node((1, "copies", "count"), fixed_value=3)
+        pipeline.add_node((1, "copies", "return"))
+        pipeline.add_node((2, "last", "models"))
+        pipeline.add_node((2, "last", "return"))
+        pipeline.add_node((3, None, "outputMesh"), datatype=vtkMRMLModelNode)
+        pipeline.add_edges_from([
+            ((0, None, "mesh"), (1, "copies", "mesh")),
+            ((1, "copies", "return"), (2, "last", "models")),
+            ((2, "last", "return"), (3, None, "outputMesh")),
+        ])
+        PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipelineListOfNodes", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule:
+            logic = tempModule.TestPipelineListOfNodesLogic()
+            model = makeSphereModel(self)
+            numModels = slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLModelNode")
+
+            # the intermediate list is deleted, except for the node that is returned
+            output = logic.run(model)
+            self.assertTrue(slicer.mrmlScene.IsNodePresent(output))
+            self.assertEqual(slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLModelNode") - numModels, 1)
+
+            logic.run(model, delete_intermediate_nodes=False)
+            self.assertEqual(slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLModelNode") - numModels, 4)
+
+    def test_required_representations(self):
+        binaryLabelmap = slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName()
+        closedSurface = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+        with self.assertRaises(RuntimeError):
+            self.logic.registerPipeline("badRepresentations", labelmapOnly, [],
+                                        requiredRepresentations={"notAParameter": [binaryLabelmap]})
+        self.logic.registerPipeline("segmentationWithSurface", segmentationWithSurface, [])
+        self.logic.registerPipeline("labelmapOnly", labelmapOnly, [],
+                                    requiredRepresentations={"segmentation": [binaryLabelmap]})
+        self.assertEqual(self.logic.registeredPipelines["labelmapOnly"].requiredRepresentations,
+                         {"segmentation": [binaryLabelmap]})
+        self.assertEqual(self.logic.registeredPipelines["segmentationWithSurface"].requiredRepresentations, {})
+
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "mesh"), datatype=vtkMRMLModelNode)
+        pipeline.add_node((1, "segmentationWithSurface", "mesh"))
+        pipeline.add_node((1, "segmentationWithSurface", "return"))
+        pipeline.add_node((2, "labelmapOnly", "segmentation"))
+        pipeline.add_node((2, "labelmapOnly", "return"))
+        pipeline.add_node((3, None, "output"), datatype=vtkMRMLSegmentationNode)
+        pipeline.add_edges_from([
+            ((0, None, "mesh"), (1, "segmentationWithSurface", "mesh")),
+            ((1, "segmentationWithSurface", "return"), (2, "labelmapOnly", "segmentation")),
+            ((2, "labelmapOnly", "return"), (3, None, "output")),
+        ])
+        PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipelineRequiredRepresentations", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        with TempPythonModule(fullCode) as tempModule:
+            logic = tempModule.TestPipelineRequiredRepresentationsLogic()
+            model = makeSphereModel(self)
+
+            # the closed surface is not needed by the next step, so it is dropped
+            seenRepresentations.clear()
+            logic.run(model)
+            self.assertEqual(seenRepresentations, [[binaryLabelmap]])
+
+            # intermediates the user wants to keep are left as they are
+            seenRepresentations.clear()
+            logic.run(model, delete_intermediate_nodes=False)
+            self.assertEqual(seenRepresentations, [sorted([binaryLabelmap, closedSurface])])
+
+    def test_execution_settings(self):
+        def addWithSettings(a: int, b: int, settings: Optional[PipelineExecutionSettings] = None) -> int:
+            return a + b
+        self.logic.registerPipeline("addWithSettings", addWithSettings, [])
+        self.assertEqual(list(self.logic.registeredPipelines["addWithSettings"].parameters.keys()), ["a", "b"])
+
+        with self.assertRaises(ValueError):
+            PipelineExecutionSettings(numberOfThreads=-1)
+        with self.assertRaises(ValueError):
+            PipelineExecutionSettings(smpBackend="NotAnSMPBackend").apply()
+
+        pipeline = makeTestMathPipeline(self.logic.registeredPipelines)
+
+        from _PipelineCreator.PipelineCreation.CodeGeneration.logic import \
+            createLogic
+        code = createLogic("TestPipelineExecutionSettings", pipeline, [], [], self.logic.registeredPipelines, "", tab=" "*4)
+        fullCode = "\n".join([code.imports, code.code])
+
+        previous = PipelineExecutionSettings.current()
+        try:
+            with TempPythonModule(fullCode) as tempModule:
+                logic = tempModule.TestPipelineExecutionSettingsLogic()
+                numberOfThreads = 3 if previous.numberOfThreads == 2 else 2
+                settings = PipelineExecutionSettings(smpBackend=previous.smpBackend, numberOfThreads=numberOfThreads)
+                with settings.applied():
+                    if previous.smpBackend != "Sequential":
+                        self.assertEqual(vtk.vtkSMPTools.GetEstimatedNumberOfThreads(), numberOfThreads)
+                self.assertEqual(PipelineExecutionSettings.current(), previous)
+
+                # the settings of the caller are restored after the run
+                self.assertEqual(logic.run("hi", 2, 3, execution_settings=settings), funcTestMathPipeline("hi", 2, 3))
+                self.assertEqual(PipelineExecutionSettings.current(), previous)
+                self.assertEqual(list(logic.run_batch([{"string": "hi", "additive": 2, "factor": 3}], execution_settings=settings)),
+                                 [funcTestMathPipeline("hi", 2, 3)])
+                self.assertEqual(PipelineExecutionSettings.current(), previous)
+                self.assertEqual(list(self.logic.registeredPipelines["addWithSettings"].runBatch(
+                    [{"a": 1, "b": 2}], executionSettings=settings)), [3])
+                self.assertEqual(PipelineExecutionSettings.current(), previous)
+
+                # generated pipelines can be used as steps, so the settings must not become a pipeline input
+                self.logic.registerPipeline("generated", tempModule.TestPipelineExecutionSettingsLogic.run, [])
+                self.assertNotIn("execution_settings", self.logic.registeredPipelines["generated"].parameters)
+        finally:
+            previous.apply()
+
+    def test_inline_generated_pipeline(self):
+        childName = "PipelineCreatorInlinedChild"
+        codeObject = self.logic.compilePipeline(childName, [], makeTestMathPipeline(self.logic.registeredPipelines))
+        # the called child is pickled by reference, so it has to stay importable during the test
+        self.addCleanup(sys.modules.pop, childName, None)
+        child = self.logic.loadCompiledPipeline(childName, codeObject)
+        self.logic.registerPipeline("childMath", getattr(child, f"{childName}Logic").run, [], sourceGraph=child._sourceGraph)
+        self.assertIs(self.logic.registeredPipelines["childMath"].sourceGraph, child._sourceGraph)
+
+        # (len(string) + additive) * factor + 1 + 10
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "string"), datatype=str, position=0)
+        pipeline.add_node((0, None, "additive"), datatype=int, position=1)
+        pipeline.add_node((0, None, "factor"), datatype=int, position=2)
+        pipeline.add_node((1, "childMath", "string"))
+        pipeline.add_node((1, "childMath", "additive"))
+        pipeline.add_node((1, "childMath", "factor"))
+        pipeline.add_node((1, "childMath", "delete_intermediate_nodes"), fixed_value=True)
+        pipeline.add_node((1, "childMath", "return"))
+        pipeline.add_node((2, "add", "a"))
+        pipeline.add_node((2, "add", "b"), fixed_value=10)
+        pipeline.add_node((2, "add", "return"))
+        pipeline.add_node((3, None, "value"), datatype=int)
+        pipeline.add_edges_from([
+            ((0, None, "string"),        (1, "childMath", "string")),
+            ((0, None, "additive"),      (1, "childMath", "additive")),
+            ((0, None, "factor"),        (1, "childMath", "factor")),
+            ((1, "childMath", "return"), (2, "add", "a")),
+            ((2, "add", "return"),       (3, None, "value")),
+        ])
+        PipelineCreation.validation.validatePipeline(pipeline, self.logic.registeredPipelines)
+
+        inlined = PipelineCreation.inlinePipelines(pipeline, self.logic.registeredPipelines)
+        self.assertEqual(PipelineCreation.util.numSteps(inlined), 7)
+        self.assertNotIn("childMath", [node[1] for node in inlined.nodes])
+        # the steps report progress where they would have if the child was called
+        self.assertEqual(inlined.nodes[(1, "strlen", "return")]["progress"], ((0, 2), (0, 4)))
+        self.assertEqual(inlined.nodes[(4, "add", "b")]["fixed_value"], 1)
+        self.assertEqual(inlined.nodes[(5, "add", "return")]["progress"], ((1, 2),))
+        PipelineCreation.validation.validatePipeline(inlined, self.logic.registeredPipelines)
+
+        def runAndRecordProgress(name, optimize):
+            code = PipelineCreation.createPipelineCode(name, [], pipeline, self.logic.registeredPipelines, optimize=optimize)
+            reports = []
+            def recordProgress(totalProgress, pieceName, pieceNumber, numberOfPieces):
+                reports.append((round(totalProgress, 6), pieceName))
+            with TempPythonModule(code) as tempModule:
+                value = getattr(tempModule, f"{name}Logic")().run(
+                    "hello", 2, 3, progress_callback=PipelineProgressCallback(recordProgress))
+            return code, value, reports
+
+        inlinedCode, inlinedValue, inlinedReports = runAndRecordProgress("PipelineCreatorInlinedParent", optimize=True)
+        calledCode, calledValue, calledReports = runAndRecordProgress("PipelineCreatorCalledParent", optimize=False)
+
+        self.assertNotIn("childMath", inlinedCode)
+        self.assertIn("step_1_1_strlen_return", inlinedCode)
+        self.assertIn("step_2_add_return", inlinedCode)
+        self.assertIn("step_1_childMath_return", calledCode)
+        self.assertEqual(inlinedValue, funcTestMathPipeline("hello", 2, 3) + 10)
+        self.assertEqual(calledValue, inlinedValue)
+        # inlining only skips the reports of the child starting and finishing
+        self.assertTrue(set(inlinedReports) <= set(calledReports), (inlinedReports, calledReports))
+        self.assertEqual(inlinedReports[-1], (1.0, ""))
+
+        # a child whose run was edited after it was generated is called, its graph may not describe it anymore
+        editedName = "PipelineCreatorEditedChild"
+        editedCode = PipelineCreation.createPipelineCode(editedName, [], makeTestMathPipeline(self.logic.registeredPipelines),
+                                                         self.logic.registeredPipelines)
+        marker = "progress_callback.reportProgress(\"\", 0, 0,"
+        self.assertIn(marker, editedCode)
+        editedCode = editedCode.replace(marker, "print(\"edited\")\n" + " " * 8 + marker, 1)
+        with tempfile.TemporaryDirectory() as tempDir:
+            path = os.path.join(tempDir, f"{editedName}.py")
+            with open(path, "w") as file:
+                file.write(editedCode)
+            spec = importlib.util.spec_from_file_location(editedName, path)
+            edited = importlib.util.module_from_spec(spec)
+            sys.modules[editedName] = edited
+            self.addCleanup(sys.modules.pop, editedName, None)
+            spec.loader.exec_module(edited)
+            self.logic.registerPipeline("editedChildMath", getattr(edited, f"{editedName}Logic").run, [],
+                                        sourceGraph=edited._sourceGraph)
+
+            editedPipeline = nx.relabel_nodes(
+                pipeline, {node: (node[0], "editedChildMath", node[2]) for node in pipeline.nodes if node[1] == "childMath"})
+            inlined = PipelineCreation.inlinePipelines(editedPipeline, self.logic.registeredPipelines)
+            self.assertEqual(PipelineCreation.util.numSteps(inlined), PipelineCreation.util.numSteps(pipeline))
+            self.assertIn("editedChildMath", [node[1] for node in inlined.nodes])
+
     def test_gather_dependencies(self):
         # Pipeline for testing
         pipeline = nx.DiGraph()
@@ -843,6 +1868,27 @@ class PipelineCreatorFullTests(unittest.TestCase):
              # make sure there are no intermediate results hanging.
              # note: we gave an output node so there should be _no_ new nodes
             self.assertEqual(slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLModelNode"), numModels)
+
+            # outputs are moved by reference, unless the node types differ
+            src = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+            src.SetAndObserveMesh(model.GetMesh())
+            widget._copyNode(src, outputModel)
+            self.assertIs(outputModel.GetMesh(), model.GetMesh())
+
+            imageData = vtk.vtkImageData()
+            imageData.SetDimensions(2, 2, 2)
+            imageData.AllocateScalars(vtk.VTK_SHORT, 1)
+            srcVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode")
+            srcVolume.SetAndObserveImageData(imageData)
+            srcVolume.SetSpacing(2, 2, 2)
+            destVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLLabelMapVolumeNode")
+            widget._copyNode(srcVolume, destVolume)
+            self.assertIs(destVolume.GetImageData(), imageData)
+            self.assertEqual(destVolume.GetSpacing(), (2, 2, 2))
+            destScalarVolume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+            widget._copyNode(srcVolume, destScalarVolume)
+            self.assertIsNot(destScalarVolume.GetImageData(), imageData)
+            self.assertEqual(destScalarVolume.GetImageData().GetDimensions(), (2, 2, 2))
         testWidget()
 
     def test_the_whole_shebang(self):
@@ -971,6 +2017,35 @@ class PipelineCreatorFullTests(unittest.TestCase):
             self.assertEqual(slicer.mrmlScene.GetNumberOfNodes(), numNodes)
             # import pdb; pdb.set_trace()
 
+    def test_compile_pipeline(self):
+        pipeline = makeTestMathPipeline(self.logic.registeredPipelines)
+
+        moduleName = "PipelineCreatorCompiledMathModule"
+
+        codeObject = self.logic.compilePipeline(moduleName, [], pipeline)
+        # same graph, same code object
+        self.assertIs(self.logic.compilePipeline(moduleName, [], pipeline.copy()), codeObject)
+
+        # any change to the graph is a new code object
+        changed = pipeline.copy()
+        changed.nodes[(4, "add", "b")]["fixed_value"] = 2
+        self.assertIsNot(self.logic.compilePipeline(moduleName, [], changed), codeObject)
+        self.assertIs(self.logic.compilePipeline(moduleName, [], pipeline), codeObject)
+
+        # re-registering a step's pipeline invalidates the cached code
+        self.logic.registrar.removePipeline("strlen")
+        self.logic.registerPipeline("strlen", strlen, [])
+        self.assertIsNot(self.logic.compilePipeline(moduleName, [], pipeline), codeObject)
+
+        try:
+            module = self.logic.loadCompiledPipeline(moduleName, codeObject)
+            self.assertIs(sys.modules[moduleName], module)
+            logic = getattr(module, f"{moduleName}Logic")()
+            self.assertEqual(logic.run("hi", 2, 3), funcTestMathPipeline("hi", 2, 3))
+            self.assertEqual(logic.run("", 0, 0), funcTestMathPipeline("", 0, 0))
+        finally:
+            sys.modules.pop(moduleName, None)
+
     def test_the_whole_shebang_multiple_output(self):
         slicer.mrmlScene.Clear()
 
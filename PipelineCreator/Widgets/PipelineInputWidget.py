@@ -48,6 +48,9 @@ class PipelineInputParameterWidget(qt.QWidget):
         self._mainLayout.addWidget(self.typeLabel)
         self._mainLayout.addWidget(self.deleteButton)
 
+        if type_ is not None:
+            self.type = type_
+
     def addReferencing(self, pipelineParameter: PipelineParameter):
         """Adds a reference _from_ widget to this, types have to match"""
         if (self.type != type(None) and unannotatedType(self.type) != unannotatedType(pipelineParameter.type)):
@@ -233,6 +236,16 @@ class PipelineInputWidget(qt.QWidget):
 
         self.valueChanged.emit()
 
+    def setParameters(self, parameters: list[tuple[str, type]]) -> None:
+        """
+        Replaces all the input parameters by new ones.
+        parameters - The (name, type) of the new parameters, in order.
+        """
+        for widget in self._parameterWidgets:
+            self._removeParameter(widget)
+        for name, type_ in parameters:
+            self._addParameter(name, type_)
+
     def _removeParameter(self, widget: PipelineInputParameterWidget):
         """
         Removes a parameter.
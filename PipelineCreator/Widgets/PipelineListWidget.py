@@ -1,3 +1,4 @@
+import contextlib
 import dataclasses
 import typing
 from typing import Optional
@@ -21,6 +22,7 @@ from slicer.parameterNodeWrapper import (
     Default,
 )
 
+from _PipelineCreator.PipelineCreation.util import groupNodesByStep
 from _PipelineCreator.PipelineRegistrar import PipelineRegistrar, PipelineInfo
 
 from Widgets.Types import Reference
@@ -42,6 +44,9 @@ class PipelineListWidget(qt.QWidget):
         super().__init__(parent)
 
         self.registrar = registrar
+        # see _batchUpdates
+        self._batchDepth = 0
+        self._updatePending = False
 
         self.setLayout(qt.QVBoxLayout())
         self.styleSheet = '[PipelineStepCollapsible="true"]{background-color: palette(dark)}'
@@ -111,6 +116,61 @@ class PipelineListWidget(qt.QWidget):
 
         return pipeline
 
+    def setPipeline(self, pipeline: nx.DiGraph) -> None:
+        """
+        Replaces the inputs, steps and outputs by the ones of the pipeline, e.g. one made by computePipeline
+        or read from a file. The pipelines of the steps must be registered.
+        """
+        if len(pipeline.nodes) == 0:
+            raise ValueError("Cannot load an empty pipeline")
+
+        def byPosition(nodes):
+            return sorted(nodes, key=lambda node: pipeline.nodes[node].get("position", 0))
+
+        lastStepIndex = max(node[0] for node in pipeline.nodes)
+        inputs = byPosition(node for node in pipeline.nodes if node[0] == 0)
+        outputs = byPosition(node for node in pipeline.nodes if node[0] == lastStepIndex and node[1] is None and node[0] != 0)
+        steps = [step for step in groupNodesByStep(pipeline) if step[0][1] is not None]
+
+        unregistered = sorted(set(step[0][1] for step in steps if not self.registrar.isRegistered(step[0][1])))
+        if unregistered:
+            raise ValueError(f"Cannot load a pipeline using unregistered pipelines: {', '.join(unregistered)}")
+
+        with self._batchUpdates():
+            for stepWidget in self._stepWidgets:
+                self._deleteStep(stepWidget)
+            self._inputsWidget.setParameters([(node[2], pipeline.nodes[node].get("datatype", type(None))) for node in inputs])
+            for step in steps:
+                self._appendStep(self.registrar.registeredPipelines[step[0][1]])
+            self._outputsWidget.setParameters([node[2] for node in outputs])
+            self._updatePending = True
+
+        # the widgets number the steps from 1 without gaps
+        widgetStepNumbers = {0: 0, lastStepIndex: len(steps) + 1}
+        widgetStepNumbers.update({step[0][0]: index + 1 for index, step in enumerate(steps)})
+
+        def referenceTo(node):
+            source = next(iter(pipeline.predecessors(node)), None)
+            if source is None:
+                return None
+            key = (widgetStepNumbers[source[0]], source[1], source[2])
+            # references are rebuilt as values get their types, so look them up every time
+            return next(r for r in self._pipelineOutputs() if (r.step, r.stepName, r.referenceName) == key)
+
+        for stepWidget, step in zip(self._stepWidgets, steps):
+            for parameterWidget in stepWidget.inputs:
+                node = (step[0][0], step[0][1], parameterWidget.name)
+                if node not in pipeline.nodes:
+                    continue
+                if "fixed_value" in pipeline.nodes[node]:
+                    parameterWidget.setFixedValue(pipeline.nodes[node]["fixed_value"])
+                elif referenceTo(node) is not None:
+                    parameterWidget.setReference(referenceTo(node))
+        for outputWidget, node in zip(self._outputsWidget.inputs, outputs):
+            reference = referenceTo(node)
+            if reference is not None:
+                outputWidget.referenceWidget.currentReference = reference
+
     def _pipelineOutputs(self) -> list[Reference]:
         refs = self._inputsWidget.stepOutputs
         layout = self._stepsContainer.layout()
@@ -120,36 +180,75 @@ class PipelineListWidget(qt.QWidget):
         # The overall outputs don't have step outputs since nothing is below it
         return refs
 
+    @contextlib.contextmanager
+    def _batchUpdates(self):
+        """
+        Defers _updateSteps to the end of the with block, so changing many steps and parameters
+        only updates the references once.
+        """
+        self._batchDepth += 1
+        try:
+            yield
+        finally:
+            self._batchDepth -= 1
+            if self._batchDepth == 0 and self._updatePending:
+                self._updatePending = False
+                self._updateSteps()
+
     def _updateSteps(self) -> None:
-        layout = self._stepsContainer.layout()
-        numRows = layout.count()
+        """
+        Renumbers the steps and gives every step and the outputs the references they can use.
+
+        The reference combo boxes only repopulate when their choices actually changed (see
+        ReferenceComboBox.references), so this is cheap when e.g. an input is renamed.
+        """
+        if self._batchDepth > 0:
+            self._updatePending = True
+            return
 
-        for stepNum in range(1, numRows + 1):
-            stepWidget = layout.itemAt(stepNum - 1).widget()
-            stepWidget.stepNumber = stepNum
+        # the combo boxes signal changes while they are updated, handle those once afterwards
+        with self._batchUpdates():
+            layout = self._stepsContainer.layout()
+            numRows = layout.count()
 
-        newOutputs = self._pipelineOutputs()
+            for stepNum in range(1, numRows + 1):
+                stepWidget = layout.itemAt(stepNum - 1).widget()
+                stepWidget.stepNumber = stepNum
 
-        for stepNum in range(1, numRows + 1):
-            stepWidget = layout.itemAt(stepNum - 1).widget()
-            stepWidget.updateInputReferences([r for r in newOutputs if r.step < stepNum])
+            newOutputs = self._pipelineOutputs()
 
-        self._outputsWidget.stepNumber = numRows + 1
-        self._outputsWidget.updateInputReferences(newOutputs)
+            # the outputs are ordered by step, so the references of a step are a prefix of them
+            available = 0
+            for stepNum in range(1, numRows + 1):
+                while available < len(newOutputs) and newOutputs[available].step < stepNum:
+                    available += 1
+                stepWidget = layout.itemAt(stepNum - 1).widget()
+                stepWidget.updateInputReferences(newOutputs[:available])
+
+            self._outputsWidget.stepNumber = numRows + 1
+            self._outputsWidget.updateInputReferences(newOutputs)
 
     def _insertPipelineStep(self) -> None:
-        popUp = SelectPipelinePopUp(self.registrar.registeredPipelines, parent=slicer.util.mainWindow())
+        # new steps are added at the end, so they can use any of the current values
+        availableTypes = [r.type for r in self._pipelineOutputs() if r.type != type(None)]
+        popUp = SelectPipelinePopUp(self.registrar, availableTypes=availableTypes, parent=slicer.util.mainWindow())
         popUp.accepted.connect(lambda: self._onInsertPipelineStepAccepted(popUp))
         popUp.rejected.connect(lambda: popUp.deleteLater())
         popUp.open()
 
-    def _onInsertPipelineStepAccepted(self, popUp) -> None:
+    def _appendStep(self, info: PipelineInfo) -> None:
+        """
+        Adds a step at the end. The caller is responsible for calling _updateSteps.
+        """
         layout = self._stepsContainer.layout()
-        stepWidget = PipelineStepWidget("Temp - will be filled by _updateSteps", layout.count() + 1, info = popUp.selectedPipeline, inputsWidget = self._inputsWidget)
+        stepWidget = PipelineStepWidget("Temp - will be filled by _updateSteps", layout.count() + 1, info = info, inputsWidget = self._inputsWidget)
         layout.addWidget(stepWidget)
         stepWidget.requestedMoveUp.connect(lambda: self._moveStep(stepWidget, -1))
         stepWidget.requestedMoveDown.connect(lambda: self._moveStep(stepWidget, 1))
         stepWidget.requestedDelete.connect(lambda: self._deleteStep(stepWidget))
+
+    def _onInsertPipelineStepAccepted(self, popUp) -> None:
+        self._appendStep(popUp.selectedPipeline)
         self._updateSteps()
         popUp.deleteLater()
 
@@ -138,6 +138,15 @@ class PipelineOutputWidget(qt.QWidget):
         layout.addWidget(paramWidget)
         self.valueChanged.emit()
 
+    def setParameters(self, names: list[str]) -> None:
+        """
+        Replaces all the output parameters by new ones with the given names, in order.
+        """
+        for widget in self._parameterWidgets:
+            self._removeParameter(widget)
+        for name in names:
+            self._addParameter(name)
+
     def _removeParameter(self, widget) -> None:
         layout = self._parameterContainer.layout()
         widget.hide()
@@ -1,9 +1,22 @@
-import typing
+import time
+from typing import Optional
 
 import qt
 import slicer
 
-from slicer.parameterNodeWrapper import unannotatedType
+from _PipelineCreator.PipelineProfiling import PipelineProfile
+from _PipelineCreator.PipelineTracing import currentTracer
+from _PipelineCreator.PipelineTypes import isPossiblyOptional
+
+class PipelineCancelledException(BaseException):
+    """
+    Raised by a pipeline that stopped because its PipelineProgressCallback was cancelled.
+
+    Like KeyboardInterrupt, it is not an Exception so the handlers for pipeline errors (e.g. the onError
+    of runBatch) let it through.
+    """
+    pass
+
 
 class PipelineProgressCallback:
     """
@@ -11,12 +24,17 @@ class PipelineProgressCallback:
 
     Is a class for ease in determining if a parameter is a pipeline progress callback.
     """
-    def __init__(self, cb=None):
+    def __init__(self, cb=None, profile: Optional[PipelineProfile] = None):
         """
         cb is a callable that takes 4 args,
             (totalProgress, currentPipelinePieceName, currentPipelinePieceNumber, numberOfPieces)
+        profile is where generated pipelines record their steps, if given.
         """
         self._cb = cb
+        self._profile = profile
+        self._cancelled = False
+        # sub callbacks are cancelled with the callback they were made from
+        self._parent: Optional[PipelineProgressCallback] = None
         self.totalProgress: float = 0.0
         self.currentPipelinePieceName: str = ""
         self.currentPipelinePieceNumber: int = 0
@@ -54,19 +72,128 @@ class PipelineProgressCallback:
         """
         def cb(totalSubProgress, currentPipelinePieceName, currentPipelineSubPieceNumber, numberOfSubPieces):
             self.reportProgress(currentPipelinePieceName, totalSubProgress, pieceNumber, numberOfPieces)
-        return PipelineProgressCallback(cb)
+        subCallback = PipelineProgressCallback(cb)
+        subCallback._parent = self
+        return subCallback
+
+    @property
+    def profile(self) -> Optional[PipelineProfile]:
+        """
+        Where the steps are recorded. Sub callbacks record in the profile of the callback they were made from.
+        """
+        if self._profile is None and self._parent is not None:
+            return self._parent.profile
+        return self._profile
+
+    @profile.setter
+    def profile(self, profile: Optional[PipelineProfile]) -> None:
+        self._profile = profile
+
+    def beginStep(self, pipelineName: str, label: str) -> None:
+        """
+        Called by generated pipelines before each step. Records the step in the profile, if any,
+        and in the current PipelineTracer, if tracing.
+        """
+        profile = self.profile
+        if profile is not None:
+            profile.beginStep(pipelineName, label)
+        tracer = currentTracer()
+        if tracer is not None:
+            tracer.begin(pipelineName, "step", step=label)
+
+    def endStep(self, result=None) -> None:
+        """
+        Called by generated pipelines after each step with what the step returned.
+        """
+        profile = self.profile
+        if profile is not None:
+            profile.endStep(result)
+        tracer = currentTracer()
+        if tracer is not None:
+            tracer.end()
+
+    def cancel(self) -> None:
+        """
+        Asks the pipeline to stop. Generated pipelines stop before their next step by raising
+        a PipelineCancelledException.
+        """
+        self._cancelled = True
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled or (self._parent is not None and self._parent.cancelled)
+
+    def checkCancelled(self) -> None:
+        """
+        Raises a PipelineCancelledException if the callback was cancelled.
+        Pipelines can call this wherever it is safe for them to stop.
+        """
+        if self.cancelled:
+            raise PipelineCancelledException("The pipeline was cancelled")
+
+
+class PipelineProgressDispatcher:
+    """
+    Coalesces progress reports so whatever shows them (e.g. a progress bar, which has to process events
+    to repaint) runs at most maxRate times per second.
+
+    Is a callable taking the same arguments as the callback of a PipelineProgressCallback. A report is
+    forwarded if enough time passed since the last forwarded one, otherwise it is kept until the next
+    report that is forwarded replaces it, or until flush. The final report (total progress reaching done,
+    or the last piece being reached) is always forwarded.
+    """
+    def __init__(self, cb, maxRate: float = 30.0, done: float = 1.0, clock=time.monotonic):
+        """
+        cb - callable that takes 4 args,
+            (totalProgress, currentPipelinePieceName, currentPipelinePieceNumber, numberOfPieces)
+        maxRate - maximum number of reports forwarded per second. 0 or None forwards everything.
+        done - total progress of the final report.
+        clock - returns the current time in seconds.
+        """
+        self._cb = cb
+        self.maxRate = maxRate
+        self._done = done
+        self._clock = clock
+        self._lastDispatchTime = None
+        self._pending = None
+        # for profiling how much the throttling saves
+        self.dispatchedUpdates = 0
+        self.droppedUpdates = 0
+
+    def __call__(self, totalProgress, currentPipelinePieceName, currentPipelinePieceNumber, numberOfPieces):
+        report = (totalProgress, currentPipelinePieceName, currentPipelinePieceNumber, numberOfPieces)
+        now = self._clock()
+        if self._pending is not None:
+            # this report supersedes it either way
+            self.droppedUpdates += 1
+            self._pending = None
+
+        final = totalProgress >= self._done or currentPipelinePieceNumber >= numberOfPieces
+        if (final or not self.maxRate or self._lastDispatchTime is None
+                or now - self._lastDispatchTime >= 1.0 / self.maxRate):
+            self._dispatch(report, now)
+        else:
+            self._pending = report
+
+    def flush(self) -> None:
+        """
+        Forwards the report being held back, if any.
+        """
+        if self._pending is not None:
+            self._dispatch(self._pending, self._clock())
+
+    def _dispatch(self, report, now) -> None:
+        self._pending = None
+        self._lastDispatchTime = now
+        self.dispatchedUpdates += 1
+        self._cb(*report)
 
 
 def isPipelineProgressCallback(param):
     """
     Determines if a type is a possibly Optional PipelineProgressCallback.
     """
-    param = unannotatedType(param)
-    args = typing.get_args(param)
-    # remove Optional if it exists
-    if typing.get_origin(param) == typing.Union and len(args) == 2 and args[1] == type(None):
-        param = typing.get_args(param)[0]
-    return unannotatedType(param) == PipelineProgressCallback
+    return isPossiblyOptional(param, PipelineProgressCallback)
 
 class PipelineProgressBar(qt.QWidget):
     """
@@ -74,15 +201,22 @@ class PipelineProgressBar(qt.QWidget):
 
     Shows extra information like the current pipeline name.
     """
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, maxUpdateRate: float = 30.0):
+        """
+        maxUpdateRate - maximum number of repaints per second, see PipelineProgressDispatcher.
+        """
         super().__init__(parent)
         self.setLayout(qt.QVBoxLayout())
         self._progressBar = qt.QProgressBar()
         self._progressBar.maximum = 100
         self.layout().addWidget(self._progressBar)
+        self.maxUpdateRate = maxUpdateRate
+        # dispatcher of the last callback given out, e.g. to look at its droppedUpdates
+        self.dispatcher = None
 
     def getProgressCallback(self) -> PipelineProgressCallback:
-        return PipelineProgressCallback(self.setProgress)
+        self.dispatcher = PipelineProgressDispatcher(self.setProgress, self.maxUpdateRate)
+        return PipelineProgressCallback(self.dispatcher)
 
     def setProgress(self, totalProgress: float, currentPipelinePieceName: str, currentPipelinePieceNumber: int, numberOfPieces: int):
         self._progressBar.value = int(totalProgress * 100)
@@ -91,3 +225,11 @@ class PipelineProgressBar(qt.QWidget):
         # need to process events so it updates on the screen.
         slicer.app.processEvents()
 
+    def setCancelled(self):
+        """
+        Shows that the pipeline was cancelled.
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.flush()
+        self._progressBar.setFormat("%p% (Cancelled)")
+
@@ -126,11 +126,28 @@ class PipelineStepParameterWidget(qt.QWidget):
     def currentReference(self) -> typing.Optional[Reference]:
         return self._currentReference
 
-    def computeFixedValue(self) -> typing.Any:
+    def _fixedValueConnector(self):
         # to get a generic value from a generic widget, make a GUI connector!
         if not hasattr(self, "_connector"):
             self._connector = createGuiConnector(self.fixedValueWidget, self.type)
-        return self._connector.read()
+        return self._connector
+
+    def computeFixedValue(self) -> typing.Any:
+        return self._fixedValueConnector().read()
+
+    def setFixedValue(self, value) -> None:
+        """
+        Makes the parameter fixed to value.
+        """
+        self.fixedCheckBox.checked = True
+        self._fixedValueConnector().write(value)
+
+    def setReference(self, reference: Reference) -> None:
+        """
+        Makes the parameter use reference, which must be one of the choices of its combo box.
+        """
+        self.fixedCheckBox.checked = False
+        self.referenceComboBox.currentReference = reference
 
 
 class PipelineStepWidget(qt.QWidget):
@@ -5,6 +5,7 @@ import dataclasses
 import qt
 
 from Widgets.Types import Reference
+from _PipelineCreator.PipelineCreation.util import isCompatibleType
 from slicer.parameterNodeWrapper import unannotatedType
 
 
@@ -27,6 +28,7 @@ class ReferenceComboBox(qt.QWidget):
 
         self._paramType = paramType
         self._inputReferences = [None]
+        self._referencesSnapshot = None
 
         self._layout = qt.QVBoxLayout(self)
         self._combobox = qt.QComboBox()
@@ -58,13 +60,24 @@ class ReferenceComboBox(qt.QWidget):
     def _onComboBoxIndexChanged(self, index):
         self.referenceChanged.emit()
 
+    @staticmethod
+    def _snapshot(references: list[Reference]) -> list[tuple]:
+        # references are rebuilt on every update, so compare what they hold rather than the objects
+        return [(id(r.owner), r.id, r.name, r.type) for r in references]
+
     @references.setter
     def references(self, references: list[Reference]):
         """
         Sets the new references choices.
         If the currentReferences is in the new list, it will still be chosen.
         If the currentReference is not in the new list, None will be chosen.
+        Setting the same choices again does nothing.
         """
+        snapshot = self._snapshot(references)
+        if snapshot == self._referencesSnapshot:
+            return
+        self._referencesSnapshot = snapshot
+
         currentRef = self.currentReference
         isBlocking = self._combobox.blockSignals(True)
 
@@ -92,9 +105,18 @@ class ReferenceComboBox(qt.QWidget):
                 elif self.currentReference == r:
                     inputReferences.append(r)
                 else:
-                    if (issubclass(unannotatedType(r.type), unannotatedParamType)):
+                    if isCompatibleType(unannotatedType(r.type), unannotatedParamType):
                         inputReferences.append(r)
 
+        if inputReferences == self._inputReferences:
+            # same choices, maybe renamed, no need to repopulate
+            for index, ref in enumerate(inputReferences[1:], start=1):
+                if self._combobox.itemText(index) != ref.name:
+                    self._combobox.setItemText(index, ref.name)
+            self._inputReferences = inputReferences
+            self._combobox.blockSignals(isBlocking)
+            return
+
         self._inputReferences = inputReferences
 
         self._combobox.clear()
@@ -117,4 +139,13 @@ class ReferenceComboBox(qt.QWidget):
         """
         The currently chosen reference, if one is chosen. Otherwise None.
         """
-        return self._inputReferences[self._combobox.currentIndex]
\ No newline at end of file
+        return self._inputReferences[self._combobox.currentIndex]
+
+    @currentReference.setter
+    def currentReference(self, reference: Optional[Reference]) -> None:
+        """
+        Chooses the reference, which must be one of the references choices (or None).
+        """
+        if reference not in self._inputReferences:
+            raise ValueError(f"'{reference.name}' is not one of the choices")
+        self._combobox.currentIndex = self._inputReferences.index(reference)
\ No newline at end of file
@@ -3,12 +3,21 @@ import os
 import qt
 import slicer
 
+from slicer.parameterNodeWrapper import unannotatedType
+
 
 class SelectPipelinePopUp(qt.QDialog):
-    def __init__(self, registeredPipelines, parent=None):
+    def __init__(self, registrar, availableTypes=None, parent=None):
+        """
+        registrar: The PipelineRegistrar to choose a pipeline from
+        availableTypes: Optional types of the values the chosen pipeline could use. If given, the
+            pipelines can be filtered down to the ones with a parameter accepting one of those.
+        """
         qt.QDialog.__init__(self, parent)
 
-        self._registeredPipelines = registeredPipelines
+        self._registrar = registrar
+        self._registeredPipelines = registrar.registeredPipelines
+        self._availableTypes = set(unannotatedType(t) for t in availableTypes or [])
         self._selectedPipeline = None
 
         self._mainLayout = qt.QVBoxLayout(self)
@@ -36,16 +45,28 @@ class SelectPipelinePopUp(qt.QDialog):
         # double click same as accept
         self.ui.PipelineList.itemDoubleClicked.connect(self._updateAndAccept)
 
-        categories = sorted(list(set(c for info in registeredPipelines.values() for c in info.categories)))
         self.ui.CategoryComboBox.addItem("All")
-        for category in categories:
+        for category in self._registrar.categories:
             self.ui.CategoryComboBox.addItem(category)
-        self.ui.CategoryComboBox.currentIndexChanged.connect(self._filterByCategory)
+        self.ui.CategoryComboBox.currentIndexChanged.connect(self._filterPipelines)
+
+        self.ui.CompatibleOnlyCheckBox.visible = availableTypes is not None
+        self.ui.CompatibleOnlyCheckBox.toggled.connect(self._filterPipelines)
+
+    def _filterPipelines(self):
+        shown = set(self._registeredPipelines.keys())
+        if self.ui.CategoryComboBox.currentText != "All":
+            shown &= self._registrar.pipelinesInCategory(self.ui.CategoryComboBox.currentText)
+        if self.ui.CompatibleOnlyCheckBox.checked:
+            compatible = set()
+            for type_ in self._availableTypes:
+                compatible |= self._registrar.pipelinesConsuming(type_)
+            shown &= compatible
 
-    def _filterByCategory(self):
         self.ui.PipelineList.clear()
-        for pipelineName, info in self._registeredPipelines.items():
-            if self.ui.CategoryComboBox.currentText == "All" or self.ui.CategoryComboBox.currentText in info.categories:
+        # keep the registration order
+        for pipelineName in self._registeredPipelines.keys():
+            if pipelineName in shown:
                 self.ui.PipelineList.addItem(pipelineName)
 
 
@@ -0,0 +1,77 @@
+import typing
+
+__all__ = [
+    "runBatch",
+    "setupBatchHooks",
+    "teardownBatchHooks",
+]
+
+
+def setupBatchHooks(hooks: typing.Iterable[tuple[typing.Optional[typing.Callable], typing.Optional[typing.Callable]]]) -> list[typing.Callable]:
+    """
+    Runs the setup of each (setup, teardown) pair in order and returns the teardowns to give to
+    teardownBatchHooks, in the order they must run. Either of a pair can be None.
+
+    If a setup raises, the teardowns of the hooks set up before it are run in reverse order, then the
+    exception propagates.
+    """
+    teardowns = []
+    try:
+        for setup, teardown in hooks:
+            if setup is not None:
+                setup()
+            if teardown is not None:
+                teardowns.insert(0, teardown)
+    except BaseException:
+        teardownBatchHooks(teardowns)
+        raise
+    return teardowns
+
+
+def teardownBatchHooks(teardowns: typing.Iterable[typing.Callable]) -> None:
+    """
+    Runs the teardowns returned by setupBatchHooks. All of them run even if one raises, the first
+    exception then propagates.
+    """
+    error = None
+    for teardown in teardowns:
+        try:
+            teardown()
+        except Exception as e:
+            if error is None:
+                error = e
+    if error is not None:
+        raise error
+
+
+def runBatch(function: typing.Callable,
+             inputs: typing.Iterable[dict[str, typing.Any]],
+             *,
+             setup: typing.Optional[typing.Callable] = None,
+             teardown: typing.Optional[typing.Callable] = None,
+             onError: typing.Optional[typing.Callable] = None,
+             **kwargs):
+    """
+    Calls function once per dictionary of inputs and yields each result as it completes.
+
+    setup: Called once before the first call of function
+    teardown: Called once after the last call of function, or when the generator is closed early
+    onError: If None, any exception raised by function ends the batch. Otherwise it is called as
+        onError(index, exception) and the batch continues with the next inputs.
+    kwargs: Extra keyword arguments given to every call of function (e.g. progress_callback)
+    """
+    if setup is not None:
+        setup()
+    try:
+        for index, parameters in enumerate(inputs):
+            try:
+                result = function(**parameters, **kwargs)
+            except Exception as e:
+                if onError is None:
+                    raise
+                onError(index, e)
+                continue
+            yield result
+    finally:
+        if teardown is not None:
+            teardown()
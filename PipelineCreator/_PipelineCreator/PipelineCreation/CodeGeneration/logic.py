@@ -2,6 +2,7 @@ import itertools
 import pickle
 import re
 import textwrap
+import typing
 from typing import Union
 
 import networkx as nx
@@ -9,8 +10,10 @@ import slicer
 from _PipelineCreator.PipelineCreation.CodeGeneration.util import (
     CodePiece, cleanupImports, importCodeForType, importCodeForTypes,
     typeAsCode, valueAsCode, annotatedAsCode)
-from _PipelineCreator.PipelineCreation.util import (getStep, groupNodesByStep,
-                                                    splitParametersFromReturn)
+from _PipelineCreator.PipelineCreation.inlining import stepProgressPath
+from _PipelineCreator.PipelineCreation.serialization import serializePipeline
+from _PipelineCreator.PipelineCreation.util import (getStep, groupNodesByStep, hashRunSource,
+                                                    numSteps, splitParametersFromReturn)
 from _PipelineCreator.PipelineRegistrar import PipelineInfo
 from slicer.parameterNodeWrapper import unannotatedType
 
@@ -30,13 +33,25 @@ def _makeToplevelFunctionSignature(functionName, fullPipeline, returnType: Union
     params, _ = getStep(0, fullPipeline)
     parameterString = ", ".join(f"{param[2]}: {annotatedAsCode(fullPipeline.nodes[param]['datatype'])}"
                                 for param in params)
-    necessaryImports = "from PipelineCreator import PipelineProgressCallback\n" + importCodeForTypes(params, fullPipeline)
+    necessaryImports = "from typing import Optional\n" \
+        "from PipelineCreator import PipelineExecutionSettings, PipelineProgressCallback\n" + importCodeForTypes(params, fullPipeline)
     if not isinstance(returnType, str):
         necessaryImports += "\n" + importCodeForType(returnType)
-    return f"{functionName}({parameterString}, *, progress_callback: PipelineProgressCallback = PipelineProgressCallback(), delete_intermediate_nodes: bool=True) -> {returnTypeCode}", necessaryImports
+    return f"{functionName}({parameterString}, *, progress_callback: PipelineProgressCallback = PipelineProgressCallback(), delete_intermediate_nodes: bool=True, execution_settings: Optional[PipelineExecutionSettings]=None) -> {returnTypeCode}", necessaryImports
 
 
-def _varName(node) -> str:
+def _stepLabel(node, pipeline: nx.DiGraph) -> str:
+    """
+    The number of the step in variable names. Steps inlined from another pipeline are numbered
+    by where they were, e.g. 3_2 for the second step of the pipeline that was step 3.
+    """
+    path = pipeline.nodes[node].get("progress")
+    if path is None:
+        return str(node[0])
+    return "_".join(str(pieceNumber + 1) for pieceNumber, _ in path)
+
+
+def _varName(node, pipeline: nx.DiGraph) -> str:
     step = node[0]
     if step == 0:
         # function signature gets nicer names
@@ -47,7 +62,7 @@ def _varName(node) -> str:
         #      step_1_somePipe_return.packSubItem
         cleanedPipelineName = _cleanPipelineName(node=node)
         # note: node[2] could have a . to get at a subitem
-        return f"step_{node[0]}_{cleanedPipelineName}_{node[2]}"
+        return f"step_{_stepLabel(node, pipeline)}_{cleanedPipelineName}_{node[2]}"
 
 
 def _cleanPipelineName(step=None, node=None):
@@ -61,10 +76,9 @@ def _cleanPipelineName(step=None, node=None):
     return re.sub('\W|^(?=\d)','_', name)
 
 
-def _stepFunctionName(step) -> str:
-    stepNum = step[0][0]
+def _stepFunctionName(step, pipeline: nx.DiGraph) -> str:
     cleanedPipelineName = _cleanPipelineName(step)
-    return f"function_{stepNum}_{cleanedPipelineName}"
+    return f"function_{_stepLabel(step[0], pipeline)}_{cleanedPipelineName}"
 
 
 def _stepFunctionValue(step, registeredPipelines):
@@ -73,8 +87,8 @@ def _stepFunctionValue(step, registeredPipelines):
     return f"pickle.loads({pickle.dumps(info.function)})"
 
 
-def _returnVarNames(returns) -> list[str]:
-    return [_varName(r) for r in returns]
+def _returnVarNames(returns, pipeline: nx.DiGraph) -> list[str]:
+    return [_varName(r, pipeline) for r in returns]
 
 
 def _getInput(node, pipeline: nx.DiGraph) -> str:
@@ -87,10 +101,115 @@ def _getInput(node, pipeline: nx.DiGraph) -> str:
     else:
         # first [0] assumes there is exactly 1 inbound connection.
         # second [0] is because the tuple is (fromNode, toNode) and node is the toNode
-        return _varName(list(pipeline.in_edges(node))[0][0])
+        return _varName(list(pipeline.in_edges(node))[0][0], pipeline)
+
+
+def _isMRMLNodeType(datatype) -> bool:
+    type_ = unannotatedType(datatype)
+    return isinstance(type_, type) and issubclass(type_, slicer.vtkMRMLNode)
+
+
+def _holdsMRMLNodes(datatype) -> bool:
+    """
+    True for MRML node types and lists of MRML nodes, i.e. the values the pipeline may have to delete.
+    """
+    type_ = unannotatedType(datatype)
+    if typing.get_origin(type_) == list:
+        return _isMRMLNodeType(typing.get_args(type_)[0])
+    return _isMRMLNodeType(type_)
+
+
+def _ownedInputs(parameters, pipeline: nx.DiGraph) -> list[str]:
+    """
+    Returns the names of the step parameters the step can take ownership of.
+
+    Those are the parameters whose value is an intermediate MRML node which is not used anywhere else:
+    it is not returned by the pipeline and no other step reads it. The pipeline would delete it right
+    after this step anyway, so the step may modify it in place instead of copying it.
+    """
+    lastStepIndex = numSteps(pipeline) - 1
+    owned = []
+    for node in parameters:
+        if "fixed_value" in pipeline.nodes[node]:
+            continue
+        source = list(pipeline.in_edges(node))[0][0]
+        if source[0] == 0 or not _isMRMLNodeType(pipeline.nodes[source]["datatype"]):
+            # overall inputs belong to the caller
+            continue
+        if pipeline.out_degree(source) != 1:
+            continue
+        if any(to[0] == lastStepIndex for _, to in pipeline.out_edges(source)):
+            continue
+        if "." in source[2]:
+            # piece of a parameter pack, the pack itself must not be used either
+            pack = (source[0], source[1], source[2].split(".")[0])
+            if pack in pipeline.nodes and pipeline.out_degree(pack) != 0:
+                continue
+        owned.append(node[2])
+    return owned
+
+
+def _isSegmentationType(datatype) -> bool:
+    type_ = unannotatedType(datatype)
+    return isinstance(type_, type) and issubclass(type_, slicer.vtkMRMLSegmentationNode)
+
+
+def _isVolumeType(datatype) -> bool:
+    type_ = unannotatedType(datatype)
+    return isinstance(type_, type) and issubclass(type_, slicer.vtkMRMLVolumeNode)
+
+
+def _requiredRepresentations(node, registeredPipelines: dict[str, PipelineInfo]) -> typing.Optional[list[str]]:
+    """
+    The segmentation representations the step parameter node needs, or None if it did not declare any.
+    """
+    return registeredPipelines[node[1]].requiredRepresentations.get(node[2])
+
+
+def _keptRepresentations(returnNode, pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo]) -> typing.Optional[list[str]]:
+    """
+    Returns the representations to keep on an intermediate segmentation, or None if all must be kept.
+
+    Representations can only be dropped if every step reading the segmentation declared which ones it
+    needs. Anything read by the last step (i.e. returned by the pipeline) keeps everything.
+    """
+    if not _isSegmentationType(pipeline.nodes[returnNode]["datatype"]):
+        return None
+    lastStepIndex = numSteps(pipeline) - 1
+    consumers = [to for _, to in pipeline.out_edges(returnNode)]
+    if not consumers or any(to[0] == lastStepIndex for to in consumers):
+        return None
+    kept = []
+    for to in consumers:
+        required = _requiredRepresentations(to, registeredPipelines)
+        if required is None:
+            return None
+        kept += [r for r in required if r not in kept]
+    return kept
+
+
+def _progressCallbackCode(path) -> tuple[str, int, int]:
+    """
+    Returns (callback, pieceNumber, numberOfPieces) where the step at the progress path reports its
+    progress as piece pieceNumber of numberOfPieces of callback.
 
+    The callback of an inlined step is the sub callback the pipeline it was inlined from would have been given.
+    """
+    callback = "progress_callback" + "".join(f".getSubCallback({p}, {n})" for p, n in path[:-1])
+    return callback, path[-1][0], path[-1][1]
+
+
+def _numberOfPieces(pipeline: nx.DiGraph) -> int:
+    """
+    The number of pieces the pipeline reports its progress in.
+    """
+    steps = groupNodesByStep(pipeline)
+    if len(steps) < 3:
+        return 1
+    return max(1, stepProgressPath(steps[1], pipeline)[0][1])
 
-def _generateStepCode(step, pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo], numSteps, tab: str) -> str:
+
+def _generateStepCode(step, pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo], tab: str) -> str:
     """
     Each output node is given a well known variable name by the
     """
@@ -101,25 +220,64 @@ def _generateStepCode(step, pipeline: nx.DiGraph, registeredPipelines: dict[str,
     stepArgumentsCode = textwrap.indent(",\n".join(stepArguments), tab)
 
     # get the returns, but filter out anything that is a break down of a parameterPack
-    returnVariables = list(set([r.split('.')[0] for r in _returnVarNames(returns)]))
+    returnVariables = list(set([r.split('.')[0] for r in _returnVarNames(returns, pipeline)]))
     if len(returnVariables) != 1:
         raise RuntimeError(f"Unexpected number of returns: {returnVariables}")
 
-    stepFunctionName = _stepFunctionName(step)
+    stepFunctionName = _stepFunctionName(step, pipeline)
     stepFunctionValue = _stepFunctionValue(step, registeredPipelines)
 
+    callback, pieceNumber, numberOfPieces = _progressCallbackCode(stepProgressPath(step, pipeline))
     progressCallbackName = registeredPipelines[step[0][1]].progressCallbackName
     if progressCallbackName is not None:
-        progressStr = f",\n{progressCallbackName}=progress_callback.getSubCallback({step[0][0] - 1}, {numSteps})"
+        progressStr = f",\n{progressCallbackName}={callback}.getSubCallback({pieceNumber}, {numberOfPieces})"
     else:
         progressStr = ""
 
+    # intermediates are only given away if they are going to be deleted
+    ownedInputsName = registeredPipelines[step[0][1]].ownedInputsName
+    if ownedInputsName is not None:
+        ownedInputs = _ownedInputs(parameters, pipeline)
+        ownedStr = f",\n{ownedInputsName}=PipelineOwnedInputs({ownedInputs} if delete_intermediate_nodes else [])"
+    else:
+        ownedStr = ""
+
+    # representations are created right before the step that needs them
+    ensureRepresentationsCode = ""
+    for node in parameters:
+        required = _requiredRepresentations(node, registeredPipelines)
+        if required and "fixed_value" not in pipeline.nodes[node] and _isSegmentationType(pipeline.nodes[node]["datatype"]):
+            ensureRepresentationsCode += f"_ensureRepresentations({_getInput(node, pipeline)}, {required})\n"
+
+    # volumes only holding a geometry get their voxels before a step that may read them
+    materializeVolumesCode = ""
+    geometryOnlyVolumes = registeredPipelines[step[0][1]].geometryOnlyVolumes
+    for node in parameters:
+        if node[2] not in geometryOnlyVolumes and "fixed_value" not in pipeline.nodes[node] and _isVolumeType(pipeline.nodes[node]["datatype"]):
+            materializeVolumesCode += f"materializeVolume({_getInput(node, pipeline)})\n"
+
+    # and representations no later step needs are dropped, so they are not kept up to date for nothing
+    dropRepresentationsCode = ""
+    for node in returns:
+        kept = _keptRepresentations(node, pipeline, registeredPipelines)
+        if kept is not None:
+            dropRepresentationsCode += f"if delete_intermediate_nodes:\n{tab}_dropRepresentations({_varName(node, pipeline)}, {kept})\n"
+
+    callCode = f"""{stepFunctionName} = {stepFunctionValue}
+{ensureRepresentationsCode}{materializeVolumesCode}{returnVariables[0]} = {stepFunctionName}(
+{stepArgumentsCode}{progressStr}{ownedStr})"""
+
+    # the step is ended even if it fails, so the profile and the trace stay balanced
     stepCode = f"""# step {step[0][0]} - {step[0][1]}
-progress_callback.reportProgress("{step[0][1]}", 0, {step[0][0] - 1}, {numSteps})
-{stepFunctionName} = {stepFunctionValue}
-{returnVariables[0]} = {stepFunctionName}(
-{stepArgumentsCode}{progressStr})
-"""
+progress_callback.checkCancelled()
+{callback}.reportProgress("{step[0][1]}", 0, {pieceNumber}, {numberOfPieces})
+progress_callback.beginStep("{step[0][1]}", "{_stepLabel(step[0], pipeline)}")
+{returnVariables[0]} = None
+try:
+{textwrap.indent(callCode, tab)}
+finally:
+{tab}progress_callback.endStep({returnVariables[0]})
+{dropRepresentationsCode}"""
     return stepCode
 
 
@@ -151,8 +309,8 @@ def _splitIntermediatesFromReturns(pipeline: nx.DiGraph):
     mrmlReturnNames = []
     for step in steps:
         _, returns = splitParametersFromReturn(step)
-        mrmlReturns = [ret for ret in returns if issubclass(unannotatedType(pipeline.nodes[ret]["datatype"]), slicer.vtkMRMLNode)]
-        mrmlReturnNames += _returnVarNames(mrmlReturns)
+        mrmlReturns = [ret for ret in returns if _holdsMRMLNodes(pipeline.nodes[ret]["datatype"])]
+        mrmlReturnNames += _returnVarNames(mrmlReturns, pipeline)
 
     # remove returned variables, so we only have intermediates
     returnVars = _getReturnedVariables(steps[-1], pipeline)
@@ -175,10 +333,10 @@ def _generateDeleteIntermediatesCode(pipeline: nx.DiGraph, tab: str):
 
 
     deletion = f"trueReturns = [{','.join(trueReturns)}]\n"
-    deletion += "\n".join(f"slicer.mrmlScene.RemoveNode({name})" for name in intermediateMRMLNodesNotInContainer)
+    deletion += "\n".join(f"_removeIntermediateNode({name}, trueReturns)" for name in intermediateMRMLNodesNotInContainer)
     for i in intermediateMRMLNodesInContainer:
         container = i.split(".")[0]
-        deletion += f"\nif {container} is not None and not _nodeReferencedBy({i}, trueReturns):\n{tab}slicer.mrmlScene.RemoveNode({i})"
+        deletion += f"\nif {container} is not None and not _nodeReferencedBy({i}, trueReturns):\n{tab}_removeIntermediateNode({i}, trueReturns)"
 
     deletion = deletion or "pass"  # if empty, explicitly call pass
 
@@ -196,12 +354,12 @@ def _generateRunFunction(pipeline: nx.DiGraph,
     steps = groupNodesByStep(pipeline)
     returnType = _getReturnType(steps[-1], pipeline, compositeReturnTypeClassName)
     functionSignature, necessaryImports = _makeToplevelFunctionSignature(runFunctionName, pipeline, returnType)
-    body = "\n".join(_generateStepCode(step, pipeline, registeredPipelines, len(steps) - 2, tab) for step in steps[1:-1])
+    body = "\n".join(_generateStepCode(step, pipeline, registeredPipelines, tab) for step in steps[1:-1])
     returnStatement = _generateReturnStatement(steps[-1], pipeline, compositeReturnTypeClassName)
 
     intermediateMRMLNodesDeclaration, intermediateMRMLNodesDeletion = _generateDeleteIntermediatesCode(pipeline, tab)
 
-    numSteps = max(1, len(steps) - 2)
+    numSteps = _numberOfPieces(pipeline)
 
     # note: Tabbing of body is handled by its respective function.
     # note: The extra pass is in case there are no pipeline steps.
@@ -212,14 +370,21 @@ def _generateRunFunction(pipeline: nx.DiGraph,
     code = f"""def {functionSignature}:
 {tab}progress_callback.reportProgress("", 0, 0, {numSteps})
 {tab}# declare needed variables so they exist in the finally clause
+{tab}previous_execution_settings = None
 {textwrap.indent(intermediateMRMLNodesDeclaration, tab)}
 
 {tab}try:
+{tab}{tab}if execution_settings is not None:
+{tab}{tab}{tab}previous_execution_settings = PipelineExecutionSettings.current()
+{tab}{tab}{tab}execution_settings.apply()
 {textwrap.indent(body, tab * 2)}
 {tab}{tab}pass
 {tab}finally:
 {tab}{tab}if delete_intermediate_nodes:
 {textwrap.indent(intermediateMRMLNodesDeletion, tab * 3)}
+{tab}{tab}# the SMP settings are global, so put back the ones of the caller
+{tab}{tab}if previous_execution_settings is not None:
+{tab}{tab}{tab}previous_execution_settings.apply()
 {tab}# Report overall pipeline end
 {tab}progress_callback.reportProgress("", 0, {numSteps}, {numSteps})
 
@@ -231,19 +396,106 @@ def _generateDecorator(
         name: str,
         dependencies: list[str],
         categories: list[str],
-        decoratorName: str="@slicerPipeline") -> str:
+        decoratorName: str="@slicerPipeline",
+        batchSetupName: str=None,
+        batchTeardownName: str=None,
+        sourceGraphName: str=None) -> str:
     """
         Generates the @slicerPipeline decorator.
-        def slicerPipeline(name=None, dependencies=None, categories=None):
+        def slicerPipeline(name=None, dependencies=None, categories=None, batchSetup=None, batchTeardown=None):
         @slicerPipeline(name="Export Segmentation to LabelMap", categories=["Conversions", "Segmentation Operations"])
     """
     name = name.replace('"', '\\"')
     dependencies = dependencies or []
     categories = categories or []
-    decoratorCode = f"{decoratorName}(name=\"{name}\", dependencies={dependencies}, categories={categories})"
+    decoratorCode = f"{decoratorName}(name=\"{name}\", dependencies={dependencies}, categories={categories}"
+    if batchSetupName is not None:
+        decoratorCode += f", batchSetup={batchSetupName}"
+    if batchTeardownName is not None:
+        decoratorCode += f", batchTeardown={batchTeardownName}"
+    if sourceGraphName is not None:
+        decoratorCode += f", sourceGraph={sourceGraphName}"
+    decoratorCode += ")"
 
     return decoratorCode
 
+
+def _batchHooks(pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo]) -> list[str]:
+    """
+    Returns the code for the unique (setup, teardown) batch hook pairs of the steps, in step order.
+    """
+    hooks = []
+    for step in groupNodesByStep(pipeline)[1:-1]:
+        info = registeredPipelines[step[0][1]]
+        if info.batchSetup is None and info.batchTeardown is None:
+            continue
+        setupCode, teardownCode = [f"pickle.loads({pickle.dumps(hook)})" if hook is not None else "None"
+                                   for hook in (info.batchSetup, info.batchTeardown)]
+        hookCode = f"({setupCode}, {teardownCode})"
+        if hookCode not in hooks:
+            hooks.append(hookCode)
+    return hooks
+
+
+def _generateBatchHooksCode(pipeline: nx.DiGraph,
+                            registeredPipelines: dict[str, PipelineInfo],
+                            batchSetupName: str,
+                            batchTeardownName: str,
+                            tab: str) -> str:
+    """
+    Generates the functions that run the batch setup/teardown hooks of all the steps.
+    Teardown happens in the reverse order of setup, and only for the hooks whose setup ran, see setupBatchHooks.
+    """
+    hooks = ",\n".join(_batchHooks(pipeline, registeredPipelines))
+    return f"""_batchHooks = [
+{textwrap.indent(hooks, tab)}
+]
+# the teardowns of each batch being run, batches can be nested
+_batchTeardowns = []
+
+def {batchSetupName}():
+{tab}_batchTeardowns.append(setupBatchHooks(_batchHooks))
+
+def {batchTeardownName}():
+{tab}teardownBatchHooks(_batchTeardowns.pop())
+"""
+
+
+def _generateSourceGraphCode(pipeline: nx.DiGraph, sourceGraphName: str) -> typing.Optional[str]:
+    """
+    Generates the variable holding the graph of the pipeline, so pipelines using this one as a step can
+    inline it. Returns None if the graph can't be serialized, the pipeline is then only usable as a call.
+    """
+    try:
+        serializedGraph = serializePipeline(pipeline)
+    except Exception:
+        return None
+    return f"{sourceGraphName} = deserializePipeline({serializedGraph!r}, trusted=True)\n"
+
+
+def _generateRunBatchFunction(logicName: str,
+                              runFunctionName: str,
+                              batchSetupName: str,
+                              batchTeardownName: str,
+                              tab: str) -> str:
+    return f"""def {runFunctionName}_batch(inputs, *, progress_callback: PipelineProgressCallback = PipelineProgressCallback(), delete_intermediate_nodes: bool=True, execution_settings: Optional[PipelineExecutionSettings]=None, on_error=None):
+{tab}\"\"\"
+{tab}Runs the pipeline once per dictionary in inputs, yielding each result as it completes.
+
+{tab}The setup/teardown hooks of the steps are run once for the whole batch.
+{tab}If on_error is given, it is called as on_error(index, exception) and the batch continues.
+{tab}\"\"\"
+{tab}yield from runBatch(
+{tab}{tab}{logicName}.{runFunctionName},
+{tab}{tab}inputs,
+{tab}{tab}setup={batchSetupName},
+{tab}{tab}teardown={batchTeardownName},
+{tab}{tab}onError=on_error,
+{tab}{tab}progress_callback=progress_callback,
+{tab}{tab}delete_intermediate_nodes=delete_intermediate_nodes,
+{tab}{tab}execution_settings=execution_settings)"""
+
+
 def createLogic(name: str,
                 pipeline: nx.DiGraph,
                 dependencies: list[str],
@@ -258,16 +510,28 @@ def createLogic(name: str,
     Returns a string which is the python code for the module logic.
     """
     logicName = f"{name}Logic"
+    batchSetupName = "_batchSetup"
+    batchTeardownName = "_batchTeardown"
+    sourceGraphCode = _generateSourceGraphCode(pipeline, "_sourceGraph")
     pipelineDecorator = _generateDecorator(name=name,
                                            dependencies=dependencies,
-                                           categories=categories)
+                                           categories=categories,
+                                           batchSetupName=batchSetupName,
+                                           batchTeardownName=batchTeardownName,
+                                           sourceGraphName="_sourceGraph" if sourceGraphCode is not None else None)
     runFunctionCode, runFunctionImports = _generateRunFunction(pipeline, registeredPipelines, runFunctionName, parameterNodeOutputsName, tab)
+    if sourceGraphCode is not None:
+        # pipelines using this one as a step only inline it while run is as generated
+        sourceGraphCode += f"_runSourceHash = \"{hashRunSource(runFunctionCode)}\"\n"
+    batchHooksCode = _generateBatchHooksCode(pipeline, registeredPipelines, batchSetupName, batchTeardownName, tab)
+    runBatchFunctionCode = _generateRunBatchFunction(logicName, runFunctionName, batchSetupName, batchTeardownName, tab)
 
     constantImports = """
 import pickle
 import slicer
 from slicer.ScriptedLoadableModule import ScriptedLoadableModuleLogic
-from PipelineCreator import slicerPipeline
+from PipelineCreator import PipelineOwnedInputs, PipelineProgressCallback, deserializePipeline, runBatch, slicerPipeline
+from PipelineCreator import materializeVolume, setupBatchHooks, teardownBatchHooks
 """.lstrip()
     allImports = cleanupImports(constantImports + runFunctionImports)
 
@@ -276,8 +540,13 @@ from PipelineCreator import slicerPipeline
 #
 
 def _nodeReferencedBy(node, listOfNodes):
+{tab}if isinstance(node, list):
+{tab}{tab}return any(_nodeReferencedBy(item, listOfNodes) for item in node)
 {tab}for option in listOfNodes:
-{tab}{tab}if option is not None:
+{tab}{tab}if isinstance(option, list):
+{tab}{tab}{tab}if _nodeReferencedBy(node, option):
+{tab}{tab}{tab}{tab}return True
+{tab}{tab}elif option is not None:
 {tab}{tab}{tab}roles = []
 {tab}{tab}{tab}option.GetNodeReferenceRoles(roles)
 {tab}{tab}{tab}for role in roles:
@@ -285,6 +554,42 @@ def _nodeReferencedBy(node, listOfNodes):
 {tab}{tab}{tab}{tab}{tab}return True
 {tab}return False
 
+def _removeIntermediateNode(node, trueReturns):
+{tab}# Steps modifying an input in place return the same node, so an intermediate
+{tab}# may also be returned or may have already been removed.
+{tab}if node is None:
+{tab}{tab}return
+{tab}if isinstance(node, list):
+{tab}{tab}for item in node:
+{tab}{tab}{tab}_removeIntermediateNode(item, trueReturns)
+{tab}{tab}return
+{tab}if any(node is r or (isinstance(r, list) and any(node is i for i in r)) for r in trueReturns):
+{tab}{tab}return
+{tab}if slicer.mrmlScene.IsNodePresent(node):
+{tab}{tab}slicer.mrmlScene.RemoveNode(node)
+
+def _ensureRepresentations(segmentation, representationNames):
+{tab}# Converting is a no-op if the representation already exists
+{tab}if segmentation is None:
+{tab}{tab}return
+{tab}for representationName in representationNames:
+{tab}{tab}segmentation.GetSegmentation().CreateRepresentation(representationName)
+
+def _dropRepresentations(segmentation, keptRepresentationNames):
+{tab}# Removes the derived representations the rest of the pipeline does not need. The source
+{tab}# representation is always kept, so nothing can be lost.
+{tab}if segmentation is None:
+{tab}{tab}return
+{tab}segmentationObject = segmentation.GetSegmentation()
+{tab}sourceRepresentationName = segmentationObject.GetMasterRepresentationName()
+{tab}containedRepresentationNames = []
+{tab}segmentationObject.GetContainedRepresentationNames(containedRepresentationNames)
+{tab}for representationName in containedRepresentationNames:
+{tab}{tab}if representationName != sourceRepresentationName and representationName not in keptRepresentationNames:
+{tab}{tab}{tab}segmentationObject.RemoveRepresentation(representationName)
+
+{batchHooksCode}
+{sourceGraphCode or ""}
 class {logicName}(ScriptedLoadableModuleLogic):
 {tab}def __init__(self):
 {tab}{tab}ScriptedLoadableModuleLogic.__init__(self)
@@ -292,6 +597,9 @@ class {logicName}(ScriptedLoadableModuleLogic):
 {tab}@staticmethod
 {tab}{pipelineDecorator}
 {textwrap.indent(runFunctionCode, tab)}
+
+{tab}@staticmethod
+{textwrap.indent(runBatchFunctionCode, tab)}
 """
 
     return CodePiece(imports=allImports, code=logicCode)
@@ -4,7 +4,7 @@ import typing
 
 import networkx as nx
 from slicer import vtkMRMLNode
-from slicer.parameterNodeWrapper import splitAnnotations
+from slicer.parameterNodeWrapper import splitAnnotations, unannotatedType
 
 @dataclasses.dataclass
 class CodePiece:
@@ -17,8 +17,15 @@ def importCodeForType(type_: type) -> str:
     allTypes = splitAnnotations(type_)
     # Import Annotations
     imports.append(("typing", "Annotated"))
-    # First item is an actual type
-    imports.append((allTypes[0].__module__, allTypes[0].__name__))
+    # First item is an actual type. Generic containers (e.g. list[vtkMRMLModelNode]) also need their arguments
+    containedTypes = [allTypes[0]]
+    while containedTypes:
+        containedType = containedTypes.pop()
+        if typing.get_origin(containedType) is not None:
+            imports.append((typing.get_origin(containedType).__module__, typing.get_origin(containedType).__name__))
+            containedTypes += [unannotatedType(arg) for arg in typing.get_args(containedType)]
+        else:
+            imports.append((containedType.__module__, containedType.__name__))
     # All other types are instances e.g. Default(2)
     for subType in allTypes[1]:
         imports.append((subType.__class__.__module__, subType.__class__.__name__))
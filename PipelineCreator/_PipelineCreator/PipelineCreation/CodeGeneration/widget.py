@@ -23,12 +23,24 @@ def _createOnRunFunction(logicRunMethodName: str,
 
     code = f'''
 def _onRun(self):
-{tab}outputValue = self.logic.{logicRunMethodName}(
-{argsCode},
-{tab}{tab}progress_callback=self.progressBar.getProgressCallback())
-
-{tab}# Copy the output. Use CopyContent for nodes and do a normal copy for non-nodes.
-{tab}# For parameterPacks, need to recurse into them though so CopyContent can be used for
+{tab}# the progress bar processes events, so the cancel button stays responsive while the pipeline runs
+{tab}self._progressCallback = self.progressBar.getProgressCallback()
+{tab}self.runButton.enabled = False
+{tab}self.cancelButton.enabled = True
+{tab}try:
+{tab}{tab}outputValue = self.logic.{logicRunMethodName}(
+{textwrap.indent(argsCode, tab)},
+{tab}{tab}{tab}progress_callback=self._progressCallback)
+{tab}except PipelineCancelledException:
+{tab}{tab}self.progressBar.setCancelled()
+{tab}{tab}return
+{tab}finally:
+{tab}{tab}self._progressCallback = None
+{tab}{tab}self.runButton.enabled = True
+{tab}{tab}self.cancelButton.enabled = False
+
+{tab}# Copy the output. Move the data of nodes (see _copyNode) and do a normal copy for non-nodes.
+{tab}# For parameterPacks, need to recurse into them though so _copyNode can be used for
 {tab}# node members.
 {tab}if isinstance(outputValue, {parameterNodeOutputsPackName}):
 {tab}{tab}self._copyParameterPack(outputValue, self._parameterNode.outputs)
@@ -63,6 +75,7 @@ def createWidget(name: str,
     imports = "\n".join([
         "from typing import Optional",
         "import qt",
+        "import vtk",
         "import slicer",
         "from slicer import vtkMRMLNode",
         "from slicer.ScriptedLoadableModule import ScriptedLoadableModuleWidget",
@@ -71,6 +84,8 @@ def createWidget(name: str,
         "from slicer.parameterNodeWrapper import parameterNodeWrapper",
         "from slicer.parameterNodeWrapper import isParameterPack",
         "from Widgets.PipelineProgressBar import PipelineProgressBar",
+        "from PipelineCreator import materializeVolume",
+        "from PipelineCreator import PipelineCancelledException",
     ]) + "\n"
 
     # code
@@ -84,6 +99,7 @@ class {name}Widget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 {tab}{tab}self.logic = None
 {tab}{tab}self._parameterNode = None
 {tab}{tab}self._parameterNodeGuiTag = None
+{tab}{tab}self._progressCallback = None
 {tab}{tab}ScriptedLoadableModuleWidget.__init__(self, parent)
 
 {tab}def setup(self):
@@ -92,10 +108,15 @@ class {name}Widget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 {tab}{tab}self.paramWidget = createGui({parameterNodeClassName})
 {tab}{tab}self.paramWidget.setMRMLScene(slicer.mrmlScene)
 {tab}{tab}self.runButton = qt.QPushButton("Run")
+{tab}{tab}self.cancelButton = qt.QPushButton("Cancel")
+{tab}{tab}self.cancelButton.enabled = False
 {tab}{tab}self.progressBar = PipelineProgressBar()
 
 {tab}{tab}self.layout.addWidget(self.paramWidget)
-{tab}{tab}self.layout.addWidget(self.runButton)
+{tab}{tab}runLayout = qt.QHBoxLayout()
+{tab}{tab}runLayout.addWidget(self.runButton)
+{tab}{tab}runLayout.addWidget(self.cancelButton)
+{tab}{tab}self.layout.addLayout(runLayout)
 {tab}{tab}self.layout.addWidget(self.progressBar)
 {tab}{tab}self.layout.addStretch()
 
@@ -105,6 +126,7 @@ class {name}Widget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
 {tab}{tab}# Connect the run button
 {tab}{tab}self.runButton.clicked.connect(self._onRun)
+{tab}{tab}self.cancelButton.clicked.connect(self._onCancel)
 
 {tab}{tab}# Make sure parameter node is initialized (needed for module reload)
 {tab}{tab}self.initializeParameterNode()
@@ -168,23 +190,53 @@ class {name}Widget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 {tab}{tab}{tab}self._parameterNodeGuiTag = self._parameterNode.connectGui(self.paramWidget)
 
 {tab}def _copyNode(self, src, dest):
-{tab}{tab}# Clones src into dest, but keeps dest's display and storage nodes, if any
+{tab}{tab}# Moves the content of src into dest, but keeps dest's display and storage nodes, if any
 {tab}{tab}# If neither src nor dest has display nodes, the default are created
 {tab}{tab}if src is not None and dest is not None:
-{tab}{tab}{tab}name = dest.GetName()
-{tab}{tab}{tab}if dest.IsA('vtkMRMLDisplayableNode'):
-{tab}{tab}{tab}{tab}displayNodesIDs = [dest.GetNthDisplayNodeID(n) for n in range(dest.GetNumberOfDisplayNodes())]
-{tab}{tab}{tab}{tab}storageNodesIDs = [dest.GetNthStorageNodeID(n) for n in range(dest.GetNumberOfStorageNodes())]
-
-{tab}{tab}{tab}dest.Copy(src)
-{tab}{tab}{tab}dest.SetName(name)
-
-{tab}{tab}{tab}if dest.IsA('vtkMRMLDisplayableNode'):
-{tab}{tab}{tab}{tab}dest.RemoveAllDisplayNodeIDs()
-{tab}{tab}{tab}{tab}for n, displayNodeID in enumerate(displayNodesIDs):
-{tab}{tab}{tab}{tab}{tab}dest.SetAndObserveNthDisplayNodeID(n, displayNodeID)
-{tab}{tab}{tab}{tab}for n, storageNodeID in enumerate(storageNodesIDs):
-{tab}{tab}{tab}{tab}{tab}dest.SetAndObserveNthStorageNodeID(n, storageNodeID)
+{tab}{tab}{tab}# geometry only volumes can't be displayed
+{tab}{tab}{tab}materializeVolume(src)
+{tab}{tab}{tab}if not self._moveData(src, dest):
+{tab}{tab}{tab}{tab}self._copyContent(src, dest)
+
+{tab}{tab}{tab}# pipelines only create the segmentation representations they need, show it in 3D as well
+{tab}{tab}{tab}if dest.IsA('vtkMRMLSegmentationNode'):
+{tab}{tab}{tab}{tab}dest.CreateClosedSurfaceRepresentation()
+
+{tab}def _moveData(self, src, dest) -> bool:
+{tab}{tab}# Gives the data object of src (image data, mesh, segmentation) to dest by reference instead of
+{tab}{tab}# copying it. src is removed right after the run, so the data does not stay shared.
+{tab}{tab}# Returns False if the data can't be moved, e.g. the node types differ.
+{tab}{tab}if src.GetClassName() != dest.GetClassName():
+{tab}{tab}{tab}return False
+{tab}{tab}if src.IsA('vtkMRMLScalarVolumeNode'):
+{tab}{tab}{tab}ijkToRAS = vtk.vtkMatrix4x4()
+{tab}{tab}{tab}src.GetIJKToRASMatrix(ijkToRAS)
+{tab}{tab}{tab}dest.SetIJKToRASMatrix(ijkToRAS)
+{tab}{tab}{tab}dest.SetAndObserveImageData(src.GetImageData())
+{tab}{tab}elif src.IsA('vtkMRMLModelNode'):
+{tab}{tab}{tab}dest.SetAndObserveMesh(src.GetMesh())
+{tab}{tab}elif src.IsA('vtkMRMLSegmentationNode'):
+{tab}{tab}{tab}dest.SetAndObserveSegmentation(src.GetSegmentation())
+{tab}{tab}else:
+{tab}{tab}{tab}return False
+{tab}{tab}return True
+
+{tab}def _copyContent(self, src, dest):
+{tab}{tab}# Clones src into dest, but keeps dest's name, display and storage nodes
+{tab}{tab}name = dest.GetName()
+{tab}{tab}if dest.IsA('vtkMRMLDisplayableNode'):
+{tab}{tab}{tab}displayNodesIDs = [dest.GetNthDisplayNodeID(n) for n in range(dest.GetNumberOfDisplayNodes())]
+{tab}{tab}{tab}storageNodesIDs = [dest.GetNthStorageNodeID(n) for n in range(dest.GetNumberOfStorageNodes())]
+
+{tab}{tab}dest.Copy(src)
+{tab}{tab}dest.SetName(name)
+
+{tab}{tab}if dest.IsA('vtkMRMLDisplayableNode'):
+{tab}{tab}{tab}dest.RemoveAllDisplayNodeIDs()
+{tab}{tab}{tab}for n, displayNodeID in enumerate(displayNodesIDs):
+{tab}{tab}{tab}{tab}dest.SetAndObserveNthDisplayNodeID(n, displayNodeID)
+{tab}{tab}{tab}for n, storageNodeID in enumerate(storageNodesIDs):
+{tab}{tab}{tab}{tab}dest.SetAndObserveNthStorageNodeID(n, storageNodeID)
 
 {tab}def _copyParameterPack(self, from_, to):
 {tab}{tab}for paramName in from_.allParameters:
@@ -195,6 +247,11 @@ class {name}Widget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 {tab}{tab}{tab}else:
 {tab}{tab}{tab}{tab}to.setValue(paramName, from_.getValue(paramName))
 
+{tab}def _onCancel(self):
+{tab}{tab}# the pipeline stops before its next step
+{tab}{tab}if self._progressCallback is not None:
+{tab}{tab}{tab}self._progressCallback.cancel()
+
 {tab}def _removeNodes(self, item):
 {tab}{tab}if isinstance(item, vtkMRMLNode):
 {tab}{tab}{tab}slicer.mrmlScene.RemoveNode(item)
@@ -1,2 +1,6 @@
-from .core import createPipeline
-from .util import fillInDataTypes
+from .core import createPipeline, createPipelineCode
+from .inlining import inlinePipelines
+from .optimization import OptimizationReport, optimizePipeline
+from .serialization import deserializePipeline, loadPipeline, savePipeline, serializePipeline
+from .util import fillInDataTypes, hashPipeline
+from .validation import PipelineValidationError, PipelineValidator
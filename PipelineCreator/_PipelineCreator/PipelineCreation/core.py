@@ -8,10 +8,13 @@ import slicer
 from _PipelineCreator.PipelineCreation import CodeGeneration
 from _PipelineCreator.PipelineRegistrar import PipelineInfo
 
+from .inlining import inlinePipelines
+from .optimization import OptimizationReport, optimizePipeline
 from .validation import validatePipeline
 
 __all__ = [
     "createPipeline",
+    "createPipelineCode",
 ]
 
 
@@ -116,21 +119,62 @@ def _validateIcon(icon):
             f"The output directory '{icon}' should be an existing file")
 
 
+def _validate(pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo], validator) -> None:
+    if validator is not None:
+        validator.validate(pipeline)
+    else:
+        validatePipeline(pipeline, registeredPipelines)
+
+
+def createPipelineCode(name: str,
+                       categories: list[str],
+                       pipeline: nx.DiGraph,
+                       registeredPipelines: dict[str, PipelineInfo],
+                       tab: str = " " * 4,
+                       validator=None,
+                       optimize: bool = True) -> str:
+    """
+    Validates the pipeline and returns the code of its module, without writing anything.
+
+    Unlike createPipeline, this does not check that no module with that name exists.
+    """
+    if not name.isidentifier() or keyword.iskeyword(name):
+        raise ValueError(f"'{name}' is not a valid pipeline module name")
+    _validate(pipeline, registeredPipelines, validator)
+    if optimize:
+        pipeline, _ = optimizePipeline(inlinePipelines(pipeline, registeredPipelines))
+    return _createPythonFileCode(name, pipeline, categories, registeredPipelines, tab)
+
+
 def createPipeline(name: str,
                    categories: list[str],
                    outputDirectory: pathlib.Path,
                    pipeline: nx.DiGraph,
                    registeredPipelines: dict[str, PipelineInfo],
                    icon: pathlib.Path,
-                   tab: str = " " * 4) -> None:
+                   tab: str = " " * 4,
+                   validator=None,
+                   optimize: bool = True) -> OptimizationReport:
+    """
+    validator: Optional PipelineValidator to validate the pipeline with instead of validatePipeline.
+        When the same pipeline is created again after small edits, it only checks what changed.
+    optimize: If True, the steps running other generated pipelines are replaced by their steps (see inlinePipelines),
+        then unused and duplicate steps are removed before generating the code (see optimizePipeline).
 
+    Returns what the optimization removed. Its steps are the ones after inlining.
+    """
 
     # error checking
     _validatePipelineName(name)
     _validateOutputDirectory(outputDirectory)
-    validatePipeline(pipeline, registeredPipelines)
+    _validate(pipeline, registeredPipelines, validator)
     _validateIcon(icon)
 
+    if optimize:
+        pipeline, report = optimizePipeline(inlinePipelines(pipeline, registeredPipelines))
+    else:
+        report = OptimizationReport()
+
     # Python file
     pythonFileCode =_createPythonFileCode(name, pipeline, categories, registeredPipelines, tab)
     with open(os.path.join(outputDirectory, f"{name}.py"), 'w') as pyfile:
@@ -145,3 +189,5 @@ def createPipeline(name: str,
     iconDir = os.path.join(outputDirectory, 'Resources', 'Icons')
     os.makedirs(os.path.join(outputDirectory, 'Resources', 'Icons'))
     shutil.copy(icon, os.path.join(iconDir, f"{name}.png"))
+
+    return report
@@ -0,0 +1,167 @@
+import inspect
+import typing
+
+import networkx as nx
+
+from _PipelineCreator.PipelineRegistrar import PipelineInfo
+
+from .util import groupNodesByStep, hashRunSource, splitParametersFromReturn
+
+__all__ = [
+    "inlinePipelines",
+    "stepProgressPath",
+]
+
+
+def stepProgressPath(step, pipeline: nx.DiGraph) -> tuple[tuple[int, int], ...]:
+    """
+    Where the step reports its progress, as (pieceNumber, numberOfPieces) pairs from the outermost
+    pipeline to the innermost one.
+
+    A step of the pipeline itself is a single piece of the pipeline. A step that was inlined from a
+    child pipeline is a piece of the piece the child pipeline was, which is what the child reported
+    when it was called instead of inlined.
+    """
+    path = pipeline.nodes[step[0]].get("progress")
+    if path is not None:
+        return path
+    numberOfPieces = len(groupNodesByStep(pipeline)) - 2
+    return ((step[0][0] - 1, numberOfPieces),)
+
+
+def _returnSources(step, pipeline: nx.DiGraph, child: nx.DiGraph) -> typing.Optional[dict]:
+    """
+    Returns the nodes of child computing the values of the return nodes of the step calling child,
+    by paramName of the return node. Return nodes nothing reads are left out.
+
+    Returns None if the step can't be replaced by the steps of child.
+    """
+    outputs = {node[2]: list(child.in_edges(node))[0][0] for node in groupNodesByStep(child)[-1]}
+    if any(source[0] == 0 for source in outputs.values()):
+        # an output that is an input of the child, no step of the child computes it
+        return None
+
+    _, returns = splitParametersFromReturn(step)
+    sources = {}
+    for node in returns:
+        if pipeline.out_degree(node) == 0:
+            continue
+        if len(outputs) == 1 and node[2] == "return":
+            sources[node[2]] = next(iter(outputs.values()))
+        elif len(outputs) > 1 and node[2] != "return":
+            sources[node[2]] = outputs[node[2].split(".", maxsplit=1)[1]]
+        else:
+            # the whole parameter pack the child returns, or a piece of the single value it returns
+            return None
+    return sources
+
+
+def _isGeneratedRun(function) -> bool:
+    """
+    True if function is the run of a generated module as it was generated, i.e. its module has the hash
+    of its source and the source still matches it. A run edited afterwards may not do what its graph says.
+    """
+    expectedHash = getattr(function, "__globals__", {}).get("_runSourceHash")
+    if expectedHash is None:
+        return False
+    try:
+        source = inspect.getsource(function)
+    except (OSError, TypeError):
+        return False
+    return hashRunSource(source) == expectedHash
+
+
+def _inlinableGraph(step, pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo]):
+    """
+    Returns (childGraph, returnSources) to replace the step with, or None if the step is kept as a call.
+    """
+    info = registeredPipelines[step[0][1]]
+    if getattr(info, "sourceGraph", None) is None or not _isGeneratedRun(info.function):
+        return None
+    if any(node[1] is not None and node[1] not in registeredPipelines for node in info.sourceGraph.nodes):
+        return None
+    child = inlinePipelines(info.sourceGraph, registeredPipelines)
+    returnSources = _returnSources(step, pipeline, child)
+    if returnSources is None:
+        return None
+    return child, returnSources
+
+
+def _addStep(inlined: nx.DiGraph, graph: nx.DiGraph, step, newIndex: int, path, connect) -> dict:
+    """
+    Adds the nodes of a step of graph to inlined as step newIndex. connect(source, newNode) is called
+    for every edge into the step.
+
+    Returns the nodes of the step -> the nodes added.
+    """
+    renamed = {}
+    for node in step:
+        newNode = (newIndex,) + node[1:]
+        inlined.add_node(newNode, **graph.nodes[node])
+        if path is not None:
+            inlined.nodes[newNode]["progress"] = path
+        for source, _ in graph.in_edges(node):
+            connect(source, newNode)
+        renamed[node] = newNode
+    return renamed
+
+
+def inlinePipelines(pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo]) -> nx.DiGraph:
+    """
+    Returns a copy of the pipeline where every step running a pipeline made by createPipeline is replaced
+    by the steps of that pipeline, recursively. The pipeline itself is not modified.
+
+    This lets the code generation and optimizePipeline see through the child pipelines, and saves the
+    overhead of calling them. A step is kept as a call if the graph of its pipeline is not known, if its run
+    was edited since it was generated, or if one of its values only exists by calling the child (e.g. the
+    parameter pack the child returns).
+
+    The steps of the copy get a "progress" attribute (see stepProgressPath), so the generated code reports
+    the same progress and names its steps the same as if the child pipelines were called.
+
+    Assumes the pipeline has been validated.
+    """
+    steps = groupNodesByStep(pipeline)
+    inlined = nx.DiGraph()
+    inlined.graph.update(pipeline.graph)
+
+    # node of pipeline -> node of inlined holding the same value
+    renamed = {}
+
+    def connect(source, newNode):
+        inlined.add_edge(renamed[source], newNode)
+
+    renamed.update(_addStep(inlined, pipeline, steps[0], 0, None, connect))
+    nextIndex = 1
+    for step in steps[1:-1]:
+        path = stepProgressPath(step, pipeline)
+        inlinable = _inlinableGraph(step, pipeline, registeredPipelines)
+        if inlinable is None:
+            renamed.update(_addStep(inlined, pipeline, step, nextIndex, path, connect))
+            nextIndex += 1
+            continue
+
+        child, returnSources = inlinable
+        # node of child -> node of inlined holding the same value
+        childRenamed = {}
+
+        def connectChild(source, newNode):
+            if source[0] != 0:
+                inlined.add_edge(childRenamed[source], newNode)
+                return
+            # an input of the child is whatever the step was given for that parameter
+            parameter = (step[0][0], step[0][1], source[2])
+            if "fixed_value" in pipeline.nodes[parameter]:
+                inlined.nodes[newNode]["fixed_value"] = pipeline.nodes[parameter]["fixed_value"]
+            else:
+                connect(list(pipeline.in_edges(parameter))[0][0], newNode)
+
+        for childStep in groupNodesByStep(child)[1:-1]:
+            childPath = path + stepProgressPath(childStep, child)
+            childRenamed.update(_addStep(inlined, child, childStep, nextIndex, childPath, connectChild))
+            nextIndex += 1
+        for paramName, childNode in returnSources.items():
+            renamed[(step[0][0], step[0][1], paramName)] = childRenamed[childNode]
+
+    _addStep(inlined, pipeline, steps[-1], nextIndex, None, connect)
+    return inlined
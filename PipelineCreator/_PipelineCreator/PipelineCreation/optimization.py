@@ -0,0 +1,157 @@
+import dataclasses
+
+import networkx as nx
+
+from .util import groupNodesByStep, splitParametersFromReturn
+
+__all__ = [
+    "OptimizationReport",
+    "optimizePipeline",
+]
+
+
+@dataclasses.dataclass
+class OptimizationReport:
+    """
+    What optimizePipeline changed. Steps are identified by their index in the original pipeline.
+    """
+    # (step, pipelineName) of the steps whose outputs never reach the pipeline outputs
+    removedSteps: list[tuple[int, str]] = dataclasses.field(default_factory=list)
+    # (step, keptStep, pipelineName) of the steps that duplicated keptStep and were replaced by it
+    mergedSteps: list[tuple[int, int, str]] = dataclasses.field(default_factory=list)
+    # original step index -> optimized step index, for the steps that were kept
+    stepMapping: dict[int, int] = dataclasses.field(default_factory=dict)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.removedSteps or self.mergedSteps)
+
+    def __str__(self) -> str:
+        if not self.changed:
+            return "Pipeline optimization: nothing to optimize"
+        lines = ["Pipeline optimization:"]
+        lines += [f"  removed step {step} ({name}), its outputs are not used" for step, name in self.removedSteps]
+        lines += [f"  merged step {step} ({name}) into identical step {kept}" for step, kept, name in self.mergedSteps]
+        return "\n".join(lines)
+
+
+# node attributes that are the same for all the nodes of a step
+_stepAttributes = ("progress",)
+
+
+def _sameValue(lhs, rhs) -> bool:
+    try:
+        return type(lhs) is type(rhs) and bool(lhs == rhs)
+    except Exception:
+        # e.g. values that don't compare to a single boolean
+        return False
+
+
+def _stepInputs(parameters, pipeline: nx.DiGraph) -> dict:
+    """
+    paramName -> ("fixed", value) or ("connected", sourceNode) for the parameters of a step.
+    """
+    inputs = {}
+    for node in parameters:
+        attributes = pipeline.nodes[node]
+        if "fixed_value" in attributes:
+            inputs[node[2]] = ("fixed", attributes["fixed_value"])
+        else:
+            inputs[node[2]] = ("connected", list(pipeline.in_edges(node))[0][0])
+    return inputs
+
+
+def _sameInputs(lhs: dict, rhs: dict) -> bool:
+    return lhs.keys() == rhs.keys() and all(
+        lhs[name][0] == rhs[name][0] and (
+            lhs[name][1] == rhs[name][1] if lhs[name][0] == "connected" else _sameValue(lhs[name][1], rhs[name][1]))
+        for name in lhs)
+
+
+def _removeDeadSteps(pipeline: nx.DiGraph, report: OptimizationReport) -> None:
+    """
+    Removes, in place, the steps none of whose returns lead to the last step.
+    """
+    steps = groupNodesByStep(pipeline)
+    liveSteps = {steps[-1][0][0]}
+    # a step can only feed later steps, so going backward every consumer is settled before its producers
+    for step in reversed(steps[1:-1]):
+        _, returns = splitParametersFromReturn(step)
+        if any(to[0] in liveSteps for node in returns for _, to in pipeline.out_edges(node)):
+            liveSteps.add(step[0][0])
+        else:
+            report.removedSteps.insert(0, (step[0][0], step[0][1]))
+            pipeline.remove_nodes_from(step)
+
+
+def _mergeDuplicateSteps(pipeline: nx.DiGraph, report: OptimizationReport) -> None:
+    """
+    Replaces, in place, every step that calls the same pipeline as an earlier step with the same inputs
+    by that earlier step.
+
+    Steps are assumed to only depend on their inputs. Two steps that are both returned by the pipeline are
+    not merged, as the pipeline would return the same object twice where it used to return two.
+    """
+    steps = groupNodesByStep(pipeline)
+    lastStepIndex = steps[-1][0][0]
+    # pipelineName -> [(stepIndex, inputs, returnedByPipeline)]
+    seen = {}
+    stepsByIndex = {step[0][0]: step for step in steps}
+    for step in steps[1:-1]:
+        stepIndex, pipelineName = step[0][0], step[0][1]
+        parameters, returns = splitParametersFromReturn(step)
+        # the sources were already redirected if they were merged, so equal inputs are the same nodes
+        inputs = _stepInputs(parameters, pipeline)
+        returned = any(to[0] == lastStepIndex for node in returns for _, to in pipeline.out_edges(node))
+
+        kept = None
+        for candidateIndex, candidateInputs, candidateReturned in seen.get(pipelineName, []):
+            if _sameInputs(inputs, candidateInputs) and not (returned and candidateReturned):
+                kept = candidateIndex
+                break
+        if kept is None:
+            seen.setdefault(pipelineName, []).append((stepIndex, inputs, returned))
+            continue
+
+        for node in returns:
+            keptNode = (kept, pipelineName, node[2])
+            if keptNode not in pipeline.nodes:
+                # e.g. a piece of a parameter pack only this step used
+                pipeline.add_node(keptNode, **pipeline.nodes[node])
+                # the step attributes (e.g. "progress") are the ones of the kept step
+                keptStepNode = stepsByIndex[kept][0]
+                pipeline.nodes[keptNode].update(
+                    {key: value for key, value in pipeline.nodes[keptStepNode].items() if key in _stepAttributes})
+            pipeline.add_edges_from((keptNode, to) for _, to in list(pipeline.out_edges(node)))
+        pipeline.remove_nodes_from(step)
+        report.mergedSteps.append((stepIndex, kept, pipelineName))
+        if returned:
+            seen[pipelineName] = [(i, n, r or i == kept) for i, n, r in seen[pipelineName]]
+
+
+def _renumberSteps(pipeline: nx.DiGraph, report: OptimizationReport) -> nx.DiGraph:
+    steps = groupNodesByStep(pipeline)
+    report.stepMapping = {step[0][0]: newIndex for newIndex, step in enumerate(steps)}
+    return nx.relabel_nodes(pipeline, {node: (report.stepMapping[node[0]],) + node[1:] for node in pipeline.nodes})
+
+
+def optimizePipeline(pipeline: nx.DiGraph) -> tuple[nx.DiGraph, OptimizationReport]:
+    """
+    Returns (optimizedPipeline, report). The pipeline itself is not modified.
+
+    The optimized pipeline computes the same outputs as the pipeline with less steps:
+     - Steps whose outputs never reach the pipeline outputs are removed.
+     - Steps calling the same pipeline as an earlier step with the same inputs and fixed values (e.g. a step
+       that was copy and pasted) are removed and their consumers read the results of the earlier step.
+    Steps are then renumbered so they stay contiguous.
+
+    Assumes the pipeline has been validated.
+    """
+    optimized = pipeline.copy()
+    report = OptimizationReport()
+    _removeDeadSteps(optimized, report)
+    _mergeDuplicateSteps(optimized, report)
+    if not report.changed:
+        report.stepMapping = {step[0][0]: step[0][0] for step in groupNodesByStep(optimized)}
+        return optimized, report
+    return _renumberSteps(optimized, report), report
@@ -0,0 +1,261 @@
+import base64
+import functools
+import importlib
+import io
+import json
+import pickle
+import types
+import typing
+
+import networkx as nx
+
+from _PipelineCreator.PipelineManifest import LazyPipelineInfo
+from _PipelineCreator.PipelineRegistrar import PipelineInfo
+
+from .util import fillInDataType, knownDataType
+
+__all__ = [
+    "deserializePipeline",
+    "loadPipeline",
+    "savePipeline",
+    "serializePipeline",
+]
+
+_formatName = "SlicerPipelines.Pipeline"
+# bump when the format changes, and keep reading the older versions
+_formatVersion = 2
+
+# values stored as themselves in JSON. bool is listed as JSON tells it apart from int
+_jsonTypes = (bool, int, float, str, type(None))
+
+
+@functools.lru_cache(maxsize=None)
+def _importByName(name: str):
+    moduleName, qualname = name.split(":")
+    obj = importlib.import_module(moduleName)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _nameOf(type_) -> typing.Optional[str]:
+    """
+    "module:qualname" if the type can be imported back by that name, otherwise None.
+    """
+    module = getattr(type_, "__module__", None)
+    qualname = getattr(type_, "__qualname__", None)
+    if not isinstance(type_, type) or module in (None, "__main__") or qualname is None or "<locals>" in qualname:
+        return None
+    name = f"{module}:{qualname}"
+    try:
+        if _importByName(name) is type_:
+            return name
+    except (ImportError, AttributeError):
+        pass
+    return None
+
+
+def _isAllowedModule(moduleName: str, allowedModules) -> bool:
+    return any(moduleName == allowed or moduleName.startswith(allowed + ".") for allowed in allowedModules)
+
+
+def _allowedModules(registeredPipelines) -> frozenset:
+    """
+    The modules whose classes can be rebuilt when reading a pipeline that is not trusted.
+    """
+    modules = {"slicer.parameterNodeWrapper", "typing"}
+    for info in (registeredPipelines or {}).values():
+        modules.add(info.moduleName if isinstance(info, LazyPipelineInfo) else info.function.__module__)
+    return frozenset(modules)
+
+
+class _RestrictedUnpickler(pickle.Unpickler):
+    """
+    Unpickler only loading classes and functions of the allowed modules, as unpickling anything else
+    could run arbitrary code.
+    """
+    def __init__(self, file, allowedModules) -> None:
+        super().__init__(file)
+        self._allowedModules = allowedModules
+
+    def find_class(self, module, name):
+        if not _isAllowedModule(module, self._allowedModules):
+            raise ValueError(f"Serialized value uses '{module}.{name}', which is not allowed")
+        return super().find_class(module, name)
+
+
+def _hasPlainState(cls) -> bool:
+    """
+    Whether pickling instances of cls would only save their __dict__.
+    """
+    customized = ("__slots__", "__reduce__", "__reduce_ex__", "__getstate__", "__setstate__", "__getnewargs__",
+                  "__getnewargs_ex__")
+    return all(name not in vars(base) for base in cls.__mro__[:-1] for name in customized)
+
+
+def _encodeValue(value):
+    """
+    Encodes a value as JSON. Plain values are themselves, everything else is a single key object
+    saying how to decode it.
+    """
+    if type(value) in _jsonTypes:
+        return value
+    if type(value) in (list, tuple):
+        return {type(value).__name__: [_encodeValue(item) for item in value]}
+    name = _nameOf(value)
+    if name is not None:
+        return {"type": name}
+    origin = typing.get_origin(value)
+    if origin is typing.Annotated:
+        return {"annotated": {
+            "type": _encodeValue(value.__origin__),
+            "annotations": [_encodeValue(annotation) for annotation in value.__metadata__],
+        }}
+    if origin in (typing.Union, types.UnionType):
+        # None stands for NoneType, typing.Union turns it back
+        return {"union": [None if arg is type(None) else _encodeValue(arg) for arg in typing.get_args(value)]}
+    if isinstance(value, types.GenericAlias) and _nameOf(origin) is not None:
+        return {"generic": {"type": _nameOf(origin), "args": [_encodeValue(arg) for arg in typing.get_args(value)]}}
+    className = _nameOf(type(value))
+    if (className is not None and not isinstance(value, type) and hasattr(value, "__dict__")
+            and _hasPlainState(type(value))):
+        # e.g. the annotations of annotated types, stored as their fields like pickle would
+        return {"object": {"class": className,
+                           "fields": {key: _encodeValue(field) for key, field in vars(value).items()}}}
+    return {"pickle": base64.b64encode(pickle.dumps(value)).decode("ascii")}
+
+
+def _decodeClass(name: str, allowedModules):
+    if allowedModules is not None and not _isAllowedModule(name.split(":")[0], allowedModules):
+        raise ValueError(f"Serialized value uses '{name}', which is not allowed")
+    cls = _importByName(name)
+    if not isinstance(cls, type):
+        raise ValueError(f"Serialized type '{name}' is not a type")
+    return cls
+
+
+def _decodeValue(value, allowedModules=None):
+    """
+    Decodes a value encoded by _encodeValue. Unless allowedModules is None, only classes of the allowed
+    modules are rebuilt and ValueError is raised for anything else.
+    """
+    if not isinstance(value, dict):
+        return value
+    kind, content = next(iter(value.items()))
+    if kind == "list":
+        return [_decodeValue(item, allowedModules) for item in content]
+    if kind == "tuple":
+        return tuple(_decodeValue(item, allowedModules) for item in content)
+    if kind == "type":
+        # types are only referenced by name, never built
+        return _decodeClass(content, None)
+    if kind == "annotated":
+        annotations = [_decodeValue(annotation, allowedModules) for annotation in content["annotations"]]
+        return typing.Annotated[(_decodeValue(content["type"], allowedModules), *annotations)]
+    if kind == "union":
+        return typing.Union[tuple(_decodeValue(arg, allowedModules) for arg in content)]
+    if kind == "generic":
+        return _decodeClass(content["type"], None)[tuple(_decodeValue(arg, allowedModules) for arg in content["args"])]
+    if kind == "object":
+        cls = _decodeClass(content["class"], allowedModules)
+        obj = cls.__new__(cls)
+        obj.__dict__.update({key: _decodeValue(field, allowedModules) for key, field in content["fields"].items()})
+        return obj
+    if kind == "pickle":
+        data = base64.b64decode(content.encode("ascii"))
+        if allowedModules is None:
+            return pickle.loads(data)
+        try:
+            return _RestrictedUnpickler(io.BytesIO(data), allowedModules).load()
+        except (pickle.UnpicklingError, EOFError) as e:
+            raise ValueError(f"Invalid serialized value: {e}") from e
+    raise ValueError(f"Unknown serialized value kind '{kind}'")
+
+
+def _isKnownDataType(node, attributes: dict, registeredPipelines) -> bool:
+    if registeredPipelines is None or node[1] is None or node[1] not in registeredPipelines:
+        return False
+    try:
+        return attributes.get("datatype") == knownDataType(node[1], node[2], registeredPipelines)
+    except Exception:
+        return False
+
+
+def serializePipeline(pipeline: nx.DiGraph, registeredPipelines: typing.Optional[dict[str, PipelineInfo]]=None) -> str:
+    """
+    Returns the pipeline as JSON text, with its node attributes (datatypes, fixed values, ...) and graph attributes.
+
+    Plain values are stored as JSON values and types importable by name are stored as their name, so the text
+    diffs well. Annotated types, unions and generic aliases are stored as the types making them, and objects
+    of importable classes (e.g. the annotations of annotated types) as their class name and fields. Other values
+    are pickled.
+
+    If registeredPipelines is given, the datatypes of the steps that are the ones of the registered pipelines
+    are left out, deserializePipeline fills them back in.
+    """
+    nodes = sorted(pipeline.nodes, key=lambda node: (node[0], str(node[1]), node[2]))
+    indexes = {node: index for index, node in enumerate(nodes)}
+    serialized = {
+        "format": _formatName,
+        "version": _formatVersion,
+        "graph": {key: _encodeValue(value) for key, value in pipeline.graph.items()},
+        "nodes": [
+            [node[0], node[1], node[2], {
+                key: _encodeValue(value)
+                for key, value in pipeline.nodes[node].items()
+                if not (key == "datatype" and _isKnownDataType(node, pipeline.nodes[node], registeredPipelines))
+            }]
+            for node in nodes
+        ],
+        "edges": sorted([indexes[fromNode], indexes[toNode]] for fromNode, toNode in pipeline.edges),
+    }
+    return json.dumps(serialized, separators=(",", ":"))
+
+
+def deserializePipeline(text: str, registeredPipelines: typing.Optional[dict[str, PipelineInfo]]=None,
+                        trusted: bool=False) -> nx.DiGraph:
+    """
+    Returns the pipeline serialized by serializePipeline.
+
+    If registeredPipelines is given, the datatypes of the steps that were left out are filled in.
+
+    Unless trusted, only objects of the classes of slicer.parameterNodeWrapper, typing and the modules of
+    registeredPipelines are rebuilt, and ValueError is raised for anything else. Only pass trusted=True for text
+    as trusted as code, e.g. the graph embedded in a generated pipeline module.
+    """
+    serialized = json.loads(text)
+    if serialized.get("format") != _formatName:
+        raise ValueError("Not a serialized pipeline")
+    if serialized.get("version", 0) > _formatVersion:
+        raise ValueError(f"Serialized pipeline version {serialized['version']} is newer than the supported"
+                         f" version {_formatVersion}, a newer version of SlicerPipelines is needed to read it")
+
+    allowedModules = None if trusted else _allowedModules(registeredPipelines)
+    pipeline = nx.DiGraph()
+    pipeline.graph.update({key: _decodeValue(value, allowedModules) for key, value in serialized["graph"].items()})
+    nodes = []
+    for step, pipelineName, paramName, attributes in serialized["nodes"]:
+        node = (step, pipelineName, paramName)
+        attributes = {key: _decodeValue(value, allowedModules) for key, value in attributes.items()}
+        if registeredPipelines is not None and "datatype" not in attributes and pipelineName in registeredPipelines:
+            fillInDataType(node, attributes, registeredPipelines)
+        pipeline.add_node(node, **attributes)
+        nodes.append(node)
+    pipeline.add_edges_from((nodes[fromIndex], nodes[toIndex]) for fromIndex, toIndex in serialized["edges"])
+    return pipeline
+
+
+def savePipeline(pipeline: nx.DiGraph, path, registeredPipelines: typing.Optional[dict[str, PipelineInfo]]=None) -> None:
+    """
+    Writes the pipeline to the file at path, see serializePipeline.
+    """
+    with open(path, "w", encoding="utf-8") as file:
+        file.write(serializePipeline(pipeline, registeredPipelines))
+
+
+def loadPipeline(path, registeredPipelines: typing.Optional[dict[str, PipelineInfo]]=None) -> nx.DiGraph:
+    """
+    Reads the pipeline in the file at path, see deserializePipeline. The file is not trusted.
+    """
+    with open(path, encoding="utf-8") as file:
+        return deserializePipeline(file.read(), registeredPipelines)
@@ -1,6 +1,8 @@
 import dataclasses
+import hashlib
 import itertools
 import pickle
+import textwrap
 import typing
 
 import networkx as nx
@@ -13,6 +15,57 @@ from _PipelineCreator.PipelineRegistrar import PipelineInfo
 __all__ = []
 
 
+def isCompatibleType(fromType, toType) -> bool:
+    """
+    True if a value of fromType can be given where toType is expected.
+
+    Both types must be unannotated. Generic containers (e.g. list[vtkMRMLModelNode]) are compatible
+    if they are the same container and their arguments are compatible.
+    """
+    fromOrigin = typing.get_origin(fromType)
+    toOrigin = typing.get_origin(toType)
+    if fromOrigin is None and toOrigin is None:
+        return isinstance(fromType, type) and isinstance(toType, type) and issubclass(fromType, toType)
+    if fromOrigin != toOrigin:
+        return False
+    fromArgs = typing.get_args(fromType)
+    toArgs = typing.get_args(toType)
+    return len(fromArgs) == len(toArgs) and all(isCompatibleType(f, t) for f, t in zip(fromArgs, toArgs))
+
+
+def hashPipeline(pipeline: nx.DiGraph) -> str:
+    """
+    A hash of the nodes, edges and node attributes of the pipeline.
+
+    Pipelines with the same hash generate the same code, as long as the pipelines they use are the same.
+    Attributes are hashed through their repr, so values without a meaningful repr (e.g. objects
+    printed with their address) make equal pipelines hash differently, but never the opposite.
+    """
+    def sortKey(node):
+        return (node[0], str(node[1]), node[2])
+
+    hasher = hashlib.sha256()
+    for node in sorted(pipeline.nodes, key=sortKey):
+        attributes = sorted((key, repr(value)) for key, value in pipeline.nodes[node].items())
+        hasher.update(repr((node, attributes)).encode())
+    for fromNode, toNode in sorted(pipeline.edges, key=lambda edge: (sortKey(edge[0]), sortKey(edge[1]))):
+        hasher.update(repr((fromNode, toNode)).encode())
+    return hasher.hexdigest()
+
+
+def hashRunSource(source: str) -> str:
+    """
+    The hash of the source of a run function, without its decorators, indentation and trailing whitespace.
+    Generated modules store it so a run edited after it was generated can be told apart.
+    """
+    lines = [line.rstrip() for line in textwrap.dedent(source).splitlines()]
+    while lines and not lines[0].startswith("def "):
+        lines.pop(0)
+    while lines and not lines[-1]:
+        lines.pop()
+    return hashlib.sha256("\n".join(lines).encode()).hexdigest()
+
+
 def groupNodesByStep(pipeline: nx.DiGraph) -> list[list[tuple[int, str, str]]]:
     nodes = sorted(pipeline.nodes)
     return [list(group) for _, group in itertools.groupby(nodes, lambda x: x[0])]
@@ -74,22 +127,37 @@ def getStep(stepIndex: int, pipeline: nx.DiGraph):
     return params, returns
 
 
+def knownDataType(pipelineName: str, paramName: str, registeredPipelines: dict[str, PipelineInfo]):
+    """
+    The datatype of a parameter or return of a registered pipeline.
+    """
+    info = registeredPipelines[pipelineName]
+    if isReturnParam(paramName):
+        if '.' in paramName:
+            # piece of a parameter pack
+            return info.returnType.dataType(paramName.split('.', maxsplit=1)[1])
+        else:
+            return info.returnType
+    else:
+        return info.parameters[paramName]
+
+
+def fillInDataType(node, attributes: dict, registeredPipelines: dict[str, PipelineInfo]) -> None:
+    """
+    Sets the datatype of a single node of a step, see fillInDataTypes.
+    """
+    _, pipelineName, paramName = node
+    if pipelineName is not None:
+        datatype = knownDataType(pipelineName, paramName, registeredPipelines)
+        if "datatype" in attributes and attributes["datatype"] != datatype:
+            raise TypeError(f"Found specified datatype that does not match known datatype\n  {attributes['datatype']} vs {datatype}")
+
+        attributes["datatype"] = datatype
+
+
 def fillInDataTypes(pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo]) -> None:
-     for (_, pipelineName, paramName), attributes in pipeline.nodes(data=True):
-        if pipelineName is not None:
-            info = registeredPipelines[pipelineName]
-            if isReturnParam(paramName):
-                if '.' in paramName:
-                    # piece of a parameter pack
-                    datatype = info.returnType.dataType(paramName.split('.', maxsplit=1)[1])
-                else:
-                    datatype = info.returnType
-            else:
-                datatype = info.parameters[paramName]
-            if "datatype" in attributes and attributes["datatype"] != datatype:
-                raise TypeError(f"Found specified datatype that does not match known datatype\n  {attributes['datatype']} vs {datatype}")
-
-            attributes["datatype"] = datatype
+    for node, attributes in pipeline.nodes(data=True):
+        fillInDataType(node, attributes, registeredPipelines)
 
 
 
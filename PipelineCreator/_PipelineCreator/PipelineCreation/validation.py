@@ -1,14 +1,115 @@
+import typing
+
 import networkx as nx
 
 from _PipelineCreator.PipelineRegistrar import PipelineInfo
 from slicer.parameterNodeWrapper import unannotatedType
 
 from .util import (
+    fillInDataType,
     fillInDataTypes,
     groupNodesByStep,
+    isCompatibleType,
     isReturnNode,
 )
 
+__all__ = [
+    "PipelineValidationError",
+    "PipelineValidator",
+    "validatePipeline",
+]
+
+#
+# Checks of a single node, step or edge. They return the error instead of raising it,
+# so they can be shared by validatePipeline and PipelineValidator.
+#
+
+
+def _stepPipelineNameError(node, lastStep: int, registeredPipelines: dict[str, PipelineInfo]) -> typing.Optional[Exception]:
+    stepNum, pipelineName, _ = node
+    if stepNum in (0, lastStep) and pipelineName is not None:
+        return ValueError("The top level and bottom of the pipeline (the overall inputs and outputs of the"
+                          " pipeline) are expected have 'None' for the pipelineName")
+    elif stepNum not in (0, lastStep) and pipelineName not in registeredPipelines:
+        return ValueError(f"Steps > 1 must have a valid pipeline name:\n  '{pipelineName}' is not registered")
+    return None
+
+
+def _nodeFilledOutError(node, attributes) -> typing.Optional[Exception]:
+    if "datatype" not in attributes:
+        return KeyError(f"Pipeline node {node} is missing attribute datatype")
+    return None
+
+
+def _fixedValueError(node, attributes) -> typing.Optional[Exception]:
+    if "fixed_value" in attributes:
+        fixed_value = attributes["fixed_value"]
+        datatype = unannotatedType(attributes["datatype"])
+        if datatype == float and isinstance(fixed_value, int):
+            pass  # all implicit conversion from int to float
+        elif not isinstance(fixed_value, datatype):
+            return TypeError(f"Pipeline node {node} has fixed value '{fixed_value}' that is not required type '{datatype}'")
+    return None
+
+
+def _stepCompleteError(group, registeredPipelines: dict[str, PipelineInfo]) -> typing.Optional[Exception]:
+    if any([g[1] != group[0][1] for g in group]):
+        return ValueError("All nodes with the same step should have the same pipeline name")
+
+    pipelineName = group[0][1]
+    if pipelineName is not None:
+        info = registeredPipelines[pipelineName]
+
+        foundParamNames = sorted([g[2] for g in group if not isReturnNode(g)])
+        expectedParamNames = sorted(info.parameters.keys())
+
+        if foundParamNames != expectedParamNames:
+            return ValueError(f"For step {group[0][0]}, pipeline '{pipelineName}', the parameters did not match."
+                              + f"\n  Expected {expectedParamNames}, found {foundParamNames}")
+    return None
+
+
+def _skippedStepsError(steps: set[int]) -> typing.Optional[Exception]:
+    if list(steps) != [i for i in range(0, len(steps))]:
+        return ValueError("The given pipeline should have no skipped steps."
+                          + f"\nFound steps '{list(steps)}'")
+    return None
+
+
+def _backwardConnectionError(fromKey, toKey) -> typing.Optional[Exception]:
+    if fromKey[0] >= toKey[0]:
+        return ValueError("Cannot connect backwards up a pipeline")
+    return None
+
+
+def _inputConnectionError(nodeKey, attributes, inboundConnections: int) -> typing.Optional[Exception]:
+    step = nodeKey[0]
+    isStepOutput = isReturnNode(nodeKey)
+    isFixed = "fixed_value" in attributes
+    if step > 0 and not isStepOutput and not isFixed and inboundConnections != 1:
+        return ValueError(f"A non-fixed, non-return node must have exactly 1 input connection. Found {inboundConnections} for {nodeKey}")
+    return None
+
+
+def _connectionDataTypeError(fromKey, toKey, fromDataType, toDataType) -> typing.Optional[Exception]:
+    fromType = unannotatedType(fromDataType)
+    toType = unannotatedType(toDataType)
+
+    if fromType == int and toType == float:
+        pass # allow going from int to float
+    elif not isCompatibleType(fromType, toType):
+        return TypeError(f"Cannot connect from type '{fromType}' to type '{toType}' for nodes {fromKey} to {toKey}")
+    return None
+
+
+def _raiseIfError(error: typing.Optional[Exception]) -> None:
+    if error is not None:
+        raise error
+
+#
+# validatePipeline
+#
+
 
 def _validatePipelineIsNotEmpty(pipeline: nx.DiGraph) -> None:
     if len(pipeline.nodes) == 0:
@@ -17,19 +118,12 @@ def _validatePipelineIsNotEmpty(pipeline: nx.DiGraph) -> None:
 
 def _validateEachNodeIsFilledOut(pipeline: nx.DiGraph) -> None:
     for node, attributes in pipeline.nodes(data=True):
-        if "datatype" not in attributes:
-            raise KeyError(f"Pipeline node {node} is missing attribute datatype")
+        _raiseIfError(_nodeFilledOutError(node, attributes))
 
 
 def _validateFixedValuesMatchDataTypes(pipeline: nx.DiGraph) -> None:
     for node, attributes in pipeline.nodes(data=True):
-        if "fixed_value" in attributes:
-            fixed_value = attributes["fixed_value"]
-            datatype = unannotatedType(attributes["datatype"])
-            if datatype == float and isinstance(fixed_value, int):
-                pass  # all implicit conversion from int to float
-            elif not isinstance(fixed_value, datatype):
-                raise TypeError(f"Pipeline node {node} has fixed value '{fixed_value}' that is not required type '{datatype}'")
+        _raiseIfError(_fixedValueError(node, attributes))
 
 
 def _numSteps(pipeline: nx.DiGraph) -> int:
@@ -42,66 +136,33 @@ def _numSteps(pipeline: nx.DiGraph) -> int:
 
 def _validateStepPipelineNames(pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo]) -> None:
     lastStep = _numSteps(pipeline) - 1
-    for stepNum, pipelineName, _ in pipeline.nodes:
-        if stepNum in (0, lastStep) and pipelineName is not None:
-            raise ValueError("The top level and bottom of the pipeline (the overall inputs and outputs of the"
-                             " pipeline) are expected have 'None' for the pipelineName")
-        elif stepNum not in (0, lastStep) and pipelineName not in registeredPipelines:
-            raise ValueError(f"Steps > 1 must have a valid pipeline name:\n  '{pipelineName}' is not registered")
+    for node in pipeline.nodes:
+        _raiseIfError(_stepPipelineNameError(node, lastStep, registeredPipelines))
 
 
 def _validateNoSkippedSteps(pipeline: nx.DiGraph) -> None:
-    steps = set()
-    for stepNum, _1, _2 in pipeline.nodes:
-        steps.add(stepNum)
-    if list(steps) != [i for i in range(0, len(steps))]:
-        raise ValueError("The given pipeline should have no skipped steps."
-                         + f"\nFound steps '{list(steps)}'")
+    _raiseIfError(_skippedStepsError(set(stepNum for stepNum, _1, _2 in pipeline.nodes)))
 
 
 def _validateEachStepIsComplete(pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo]) -> None:
-    grouped = groupNodesByStep(pipeline)
-    for group in grouped:
-        if any([g[1] != group[0][1] for g in group]):
-            raise ValueError("All nodes with the same step should have the same pipeline name")
-
-        pipelineName = group[0][1]
-        if pipelineName is not None:
-            info = registeredPipelines[pipelineName]
-
-            foundParamNames = sorted([g[2] for g in group if not isReturnNode(g)])
-            expectedParamNames = sorted(info.parameters.keys())
-
-            if foundParamNames != expectedParamNames:
-                raise ValueError(f"For step {group[0][0]}, pipeline '{pipelineName}', the parameters did not match."
-                                + f"\n  Expected {expectedParamNames}, found {foundParamNames}")
+    for group in groupNodesByStep(pipeline):
+        _raiseIfError(_stepCompleteError(group, registeredPipelines))
 
 
 def _validateNoBackwardConnections(pipeline: nx.DiGraph) -> None:
-    for (fromStep, _1, _2), (toStep, _3, _4) in pipeline.edges:
-        if fromStep >= toStep:
-            raise ValueError("Cannot connect backwards up a pipeline")
+    for fromKey, toKey in pipeline.edges:
+        _raiseIfError(_backwardConnectionError(fromKey, toKey))
 
 
 def _validateEachNonFixedInputHasConnection(pipeline: nx.DiGraph) -> None:
     for nodeKey, attributes in pipeline.nodes(data=True):
-        step = nodeKey[0]
-        isStepOutput = isReturnNode(nodeKey)
-        isFixed = "fixed_value" in attributes
-        inboundConnections =  len(pipeline.in_edges(nodeKey))
-        if step > 0 and not isStepOutput and not isFixed and inboundConnections != 1:
-            raise ValueError(f"A non-fixed, non-return node must have exactly 1 input connection. Found {inboundConnections} for {nodeKey}")
+        _raiseIfError(_inputConnectionError(nodeKey, attributes, len(pipeline.in_edges(nodeKey))))
 
 
 def _validateConnectionDataTypes(pipeline: nx.DiGraph) -> None:
     for fromKey, toKey in pipeline.edges:
-        fromType = unannotatedType(pipeline.nodes[fromKey]["datatype"])
-        toType = unannotatedType(pipeline.nodes[toKey]["datatype"])
-
-        if fromType == int and toType == float:
-            pass # allow going from int to float
-        elif not issubclass(fromType, toType):
-            raise TypeError(f"Cannot connect from type '{fromType}' to type '{toType}' for nodes {fromKey} to {toKey}")
+        _raiseIfError(_connectionDataTypeError(fromKey, toKey,
+                                               pipeline.nodes[fromKey]["datatype"], pipeline.nodes[toKey]["datatype"]))
 
 
 def validatePipeline(pipeline: nx.DiGraph, registeredPipelines: dict[str, PipelineInfo]) -> None:
@@ -123,3 +184,165 @@ def validatePipeline(pipeline: nx.DiGraph, registeredPipelines: dict[str, Pipeli
     _validateNoBackwardConnections(pipeline)
     _validateEachNonFixedInputHasConnection(pipeline)
     _validateConnectionDataTypes(pipeline)
+
+#
+# PipelineValidator
+#
+
+# The checks in the order validatePipeline runs them. Errors are reported in that order.
+_NAMES, _DATATYPES, _FILLED_OUT, _STEPS_COMPLETE, _FIXED_VALUES, _SKIPPED_STEPS, _BACKWARD, _CONNECTIONS, _CONNECTION_TYPES = range(9)
+
+
+class PipelineValidationError(ValueError):
+    """
+    Raised by PipelineValidator.validate, lists all the errors found in the pipeline.
+    """
+    def __init__(self, errors: list[Exception]) -> None:
+        super().__init__("\n".join(str(e) for e in errors))
+        self.errors = errors
+
+
+def _same(a, b) -> bool:
+    if a is b:
+        return True
+    try:
+        return bool(a == b)
+    except Exception:
+        return False
+
+
+def _sameKey(a: tuple, b: tuple) -> bool:
+    return len(a) == len(b) and all(_same(x, y) for x, y in zip(a, b))
+
+
+class PipelineValidator:
+    """
+    Validates pipelines being edited, like validatePipeline, but only checks again the nodes, steps and
+    edges that changed since the previous validation.
+
+    The pipelines given to validate do not need to be the same graph object: nodes, steps and edges are
+    matched by key and compared by their attributes. All the errors are reported at once, in the order
+    validatePipeline would find them, so the first error is the one validatePipeline raises.
+    """
+    def __init__(self, registeredPipelines: dict[str, PipelineInfo]) -> None:
+        self._registeredPipelines = registeredPipelines
+        # key: node, value: (key of what was checked, filled in datatype or None, errors by check)
+        self._nodes: dict = dict()
+        # key: step number, value: (key of what was checked, error or None)
+        self._steps: dict = dict()
+        # key: edge, value: (key of what was checked, errors by check)
+        self._edges: dict = dict()
+
+    def _checkNode(self, node, attributes, inDegree: int, lastStep: int):
+        # the key is computed on the attributes before filling in, so it matches the next, unfilled, graph
+        info = self._registeredPipelines.get(node[1])
+        key = (info, attributes.get("datatype"), "fixed_value" in attributes, attributes.get("fixed_value"), inDegree, lastStep)
+        previous = self._nodes.get(node)
+        if previous is not None and _sameKey(previous[0], key):
+            if previous[1] is not None:
+                attributes["datatype"] = previous[1]
+            return previous
+
+        errors = {}
+        nameError = _stepPipelineNameError(node, lastStep, self._registeredPipelines)
+        if nameError is not None:
+            errors[_NAMES] = nameError
+        elif node[1] is not None:
+            try:
+                fillInDataType(node, attributes, self._registeredPipelines)
+            except Exception as e:
+                errors[_DATATYPES] = e
+
+        filledOutError = _nodeFilledOutError(node, attributes)
+        if filledOutError is not None:
+            errors[_FILLED_OUT] = filledOutError
+        else:
+            fixedValueError = _fixedValueError(node, attributes)
+            if fixedValueError is not None:
+                errors[_FIXED_VALUES] = fixedValueError
+
+        connectionError = _inputConnectionError(node, attributes, inDegree)
+        if connectionError is not None:
+            errors[_CONNECTIONS] = connectionError
+
+        return (key, attributes.get("datatype") if node[1] is not None else None, errors)
+
+    def _checkStep(self, stepNum: int, group: list):
+        pipelineNames = sorted(set(g[1] for g in group), key=str)
+        key = (frozenset(group), tuple(self._registeredPipelines.get(pipelineName) for pipelineName in pipelineNames))
+        previous = self._steps.get(stepNum)
+        if previous is not None and _sameKey(previous[0], key):
+            return previous
+        error = None
+        # unregistered names are already reported by the name check
+        if all(g[1] is None or g[1] in self._registeredPipelines for g in group):
+            error = _stepCompleteError(group, self._registeredPipelines)
+        return (key, error)
+
+    def _checkEdge(self, edge, fromDataType, toDataType):
+        key = (fromDataType, toDataType)
+        previous = self._edges.get(edge)
+        if previous is not None and _sameKey(previous[0], key):
+            return previous
+        errors = {}
+        backwardError = _backwardConnectionError(*edge)
+        if backwardError is not None:
+            errors[_BACKWARD] = backwardError
+        if fromDataType is not None and toDataType is not None:
+            typeError = _connectionDataTypeError(*edge, fromDataType, toDataType)
+            if typeError is not None:
+                errors[_CONNECTION_TYPES] = typeError
+        return (key, errors)
+
+    def findErrors(self, pipeline: nx.DiGraph) -> list[Exception]:
+        """
+        Fills in the datatypes of the pipeline and returns all its errors, see validatePipeline.
+        """
+        if len(pipeline.nodes) == 0:
+            return [ValueError("Cannot have an empty pipeline")]
+
+        lastStep = max(n[0] for n in pipeline.nodes)
+        # (check, position in the iteration order of validatePipeline, error)
+        found = []
+
+        nodes = {}
+        groups = {}
+        for index, (node, attributes) in enumerate(pipeline.nodes(data=True)):
+            nodes[node] = self._checkNode(node, attributes, pipeline.in_degree(node), lastStep)
+            found += [(check, index, error) for check, error in nodes[node][2].items()]
+            groups.setdefault(node[0], []).append(node)
+        self._nodes = nodes
+
+        steps = {}
+        for stepNum, group in groups.items():
+            steps[stepNum] = self._checkStep(stepNum, group)
+            if steps[stepNum][1] is not None:
+                found.append((_STEPS_COMPLETE, stepNum, steps[stepNum][1]))
+        self._steps = steps
+
+        skippedStepsError = _skippedStepsError(set(groups.keys()))
+        if skippedStepsError is not None:
+            found.append((_SKIPPED_STEPS, 0, skippedStepsError))
+
+        edges = {}
+        for index, edge in enumerate(pipeline.edges):
+            edges[edge] = self._checkEdge(edge, pipeline.nodes[edge[0]].get("datatype"), pipeline.nodes[edge[1]].get("datatype"))
+            found += [(check, index, error) for check, error in edges[edge][1].items()]
+        self._edges = edges
+
+        found.sort(key=lambda f: (f[0], f[1]))
+        errors = []
+        for _, _, error in found:
+            # e.g. all the nodes of a step with an unregistered pipeline give the same error
+            if not any(type(e) == type(error) and str(e) == str(error) for e in errors):
+                errors.append(error)
+        return errors
+
+    def validate(self, pipeline: nx.DiGraph) -> None:
+        """
+        Fills in the datatypes of the pipeline and raises a PipelineValidationError listing all
+        its errors, if any.
+        """
+        errors = self.findErrors(pipeline)
+        if errors:
+            raise PipelineValidationError(errors)
@@ -0,0 +1,67 @@
+import contextlib
+import dataclasses
+import typing
+
+import vtk
+
+from _PipelineCreator.PipelineTypes import isPossiblyOptional
+
+__all__ = [
+    "PipelineExecutionSettings",
+    "isPipelineExecutionSettings",
+]
+
+
+@dataclasses.dataclass(frozen=True)
+class PipelineExecutionSettings:
+    """
+    Settings for how the VTK filters run by a pipeline are executed.
+
+    smpBackend: The vtkSMPTools backend to use ("Sequential", "STDThread", "TBB" or "OpenMP").
+        None keeps the current backend. Only the backends VTK was built with are available.
+    numberOfThreads: The maximum number of threads SMP-parallel filters may use. 0 keeps VTK's default,
+        which is one thread per core (or the VTK_SMP_MAX_THREADS environment variable if set).
+
+    Note that the vtkSMPTools settings are global to the process, so applying them affects
+    every VTK filter that runs afterwards, not only the ones in the pipeline. Use applied() to
+    restore the previous settings afterwards.
+    """
+    smpBackend: typing.Optional[str] = None
+    numberOfThreads: int = 0
+
+    def __post_init__(self):
+        if self.numberOfThreads < 0:
+            raise ValueError(f"numberOfThreads must be positive or 0 for the default, not {self.numberOfThreads}")
+
+    def apply(self) -> None:
+        if self.smpBackend is not None and self.smpBackend != vtk.vtkSMPTools.GetBackend():
+            if not vtk.vtkSMPTools.SetBackend(self.smpBackend):
+                raise ValueError(f"VTK SMP backend '{self.smpBackend}' is not available")
+        if self.numberOfThreads > 0:
+            vtk.vtkSMPTools.Initialize(self.numberOfThreads)
+
+    @contextlib.contextmanager
+    def applied(self):
+        """
+        Applies the settings for the duration of a with block, then restores the previous ones.
+        """
+        previous = PipelineExecutionSettings.current()
+        try:
+            self.apply()
+            yield self
+        finally:
+            previous.apply()
+
+    @staticmethod
+    def current() -> "PipelineExecutionSettings":
+        """
+        The settings VTK is currently using.
+        """
+        return PipelineExecutionSettings(vtk.vtkSMPTools.GetBackend(), vtk.vtkSMPTools.GetEstimatedNumberOfThreads())
+
+
+def isPipelineExecutionSettings(param) -> bool:
+    """
+    Determines if a type is a possibly Optional PipelineExecutionSettings.
+    """
+    return isPossiblyOptional(param, PipelineExecutionSettings)
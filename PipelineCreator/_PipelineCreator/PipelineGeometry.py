@@ -0,0 +1,63 @@
+import typing
+
+import slicer
+import vtk
+
+__all__ = [
+    "createGeometryOnlyVolume",
+    "isGeometryOnlyVolume",
+    "materializeVolume",
+]
+
+_geometryOnlyAttribute = "PipelineCreator.GeometryOnly"
+
+
+def createGeometryOnlyVolume(name: str,
+                             origin: typing.Sequence[float],
+                             spacing: typing.Sequence[float],
+                             dimensions: typing.Sequence[int],
+                             ijkToRASDirections: typing.Optional[vtk.vtkMatrix4x4] = None) -> slicer.vtkMRMLScalarVolumeNode:
+    """
+    Creates a scalar volume node that only records a geometry (origin, spacing, dimensions and directions).
+
+    No voxels are allocated and no display nodes are created, so it costs the same whatever its size.
+    This is enough to use the volume as a reference geometry (e.g. for SetReferenceImageGeometryParameterFromVolumeNode).
+    Anything that needs the voxels must call materializeVolume first.
+    """
+    imageData = vtk.vtkImageData()
+    imageData.SetDimensions(*dimensions)
+    volumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+    volumeNode.SetName(name)
+    volumeNode.SetOrigin(origin)
+    volumeNode.SetSpacing(spacing)
+    if ijkToRASDirections is not None:
+        volumeNode.SetIJKToRASDirectionMatrix(ijkToRASDirections)
+    volumeNode.SetAndObserveImageData(imageData)
+    volumeNode.SetAttribute(_geometryOnlyAttribute, "1")
+    return volumeNode
+
+
+def isGeometryOnlyVolume(node) -> bool:
+    """
+    True if node is a volume made by createGeometryOnlyVolume that has not been materialized yet.
+    """
+    return isinstance(node, slicer.vtkMRMLVolumeNode) and node.GetAttribute(_geometryOnlyAttribute) is not None
+
+
+def materializeVolume(node, scalarType: int = vtk.VTK_UNSIGNED_CHAR):
+    """
+    Allocates the zero filled voxels and creates the display nodes of a geometry only volume.
+
+    Does nothing if node is not a geometry only volume, so it is safe to call on any node.
+    Returns node.
+    """
+    if not isGeometryOnlyVolume(node):
+        return node
+    imageData = node.GetImageData()
+    imageData.AllocateScalars(scalarType, 1)
+    imageData.GetPointData().GetScalars().Fill(0)
+    node.RemoveAttribute(_geometryOnlyAttribute)
+    # re-set the image data so observers see the new scalars
+    node.SetAndObserveImageData(imageData)
+    node.CreateDefaultDisplayNodes()
+    return node
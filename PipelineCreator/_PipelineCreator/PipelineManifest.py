@@ -0,0 +1,261 @@
+import base64
+import importlib
+import importlib.util
+import io
+import json
+import os
+import pickle
+import sys
+import typing
+
+from _PipelineCreator.PipelineRegistrar import PipelineInfo
+
+__all__ = [
+    "LazyPipelineInfo",
+    "manifestEntry",
+    "readManifest",
+    "writeManifest",
+]
+
+# bump when the format of the entries changes, older manifests are then ignored
+_manifestVersion = 4
+
+
+def _importByName(moduleName: str, qualname: str):
+    obj = importlib.import_module(moduleName)
+    for part in qualname.split("."):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _isImportableByName(obj) -> bool:
+    module = getattr(obj, "__module__", None)
+    qualname = getattr(obj, "__qualname__", None)
+    return module not in (None, "__main__") and qualname is not None and "<locals>" not in qualname
+
+
+def _callableReference(function) -> typing.Optional[list[str]]:
+    return None if function is None else [function.__module__, function.__qualname__]
+
+
+class _ModuleRecordingPickler(pickle.Pickler):
+    """
+    A Pickler that records the modules of the classes and functions it pickles by reference.
+    """
+    def __init__(self, file) -> None:
+        super().__init__(file)
+        self.moduleNames: set[str] = set()
+
+    def reducer_override(self, obj):
+        moduleName = getattr(obj, "__module__", None) if isinstance(obj, type) or callable(obj) else None
+        if isinstance(moduleName, str):
+            self.moduleNames.add(moduleName)
+        return NotImplemented
+
+
+def _encode(value, moduleNames: typing.Optional[set[str]] = None) -> str:
+    """
+    Pickles value as text. The modules it references are added to moduleNames, if given.
+    """
+    buffer = io.BytesIO()
+    pickler = _ModuleRecordingPickler(buffer)
+    pickler.dump(value)
+    if moduleNames is not None:
+        moduleNames.update(pickler.moduleNames)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _decode(value: str):
+    return pickle.loads(base64.b64decode(value.encode("ascii")))
+
+
+def _moduleSource(moduleName: str) -> typing.Optional[str]:
+    """
+    The file a module would be imported from, without importing it.
+    """
+    try:
+        spec = importlib.util.find_spec(moduleName)
+    except (ImportError, ValueError):
+        return None
+    if spec is None or spec.origin is None or not os.path.isfile(spec.origin):
+        return None
+    return spec.origin
+
+
+def _fileStamp(moduleName: str) -> typing.Optional[dict]:
+    source = _moduleSource(moduleName)
+    if source is None:
+        return None
+    return {"source": source, "mtime": os.stat(source).st_mtime_ns}
+
+
+def _isStandardLibrary(moduleName: str) -> bool:
+    # those only change with python, which the environment stamp covers
+    return moduleName.split(".")[0] in getattr(sys, "stdlib_module_names", ("builtins", "typing"))
+
+
+def _moduleStamp(moduleName: str, entries: list[dict]) -> typing.Optional[dict]:
+    """
+    Stamps the module and the modules its entries reference (the modules of the pickled types and
+    of the hooks), so the entries are out of date as soon as one of them changes.
+    """
+    stamp = _fileStamp(moduleName)
+    if stamp is None:
+        return None
+    referencedModuleNames = set(name for entry in entries for name in entry["referencedModules"])
+    stamp["referencedModules"] = {
+        name: _fileStamp(name) for name in sorted(referencedModuleNames)
+        if name != moduleName and not _isStandardLibrary(name)
+    }
+    return stamp
+
+
+def _environmentStamp() -> dict:
+    import slicer
+    return {
+        "version": _manifestVersion,
+        "slicerRevision": slicer.app.revision,
+        "python": sys.version,
+    }
+
+
+class LazyPipelineInfo(PipelineInfo):
+    """
+    A PipelineInfo read from a manifest.
+
+    The function and batch hooks are imported the first time they are used, and the parameter and
+    return types and the source graph are unpickled the first time they are used. Until then, the
+    module defining the pipeline is not imported.
+
+    Importing that module registers the real PipelineInfo through @slicerPipeline, which replaces
+    this one in the registrar. Objects already holding this one keep working.
+    """
+    # note: the dataclass __init__ is not used, the lazy fields are properties instead
+    def __init__(self, entry: dict, moduleName: str) -> None:
+        self.name = entry["name"]
+        self.progressCallbackName = entry["progressCallbackName"]
+        self.dependencies = entry["dependencies"]
+        self.categories = entry["categories"]
+        self.ownedInputsName = entry["ownedInputsName"]
+        self.requiredRepresentations = entry["requiredRepresentations"]
+        self.geometryOnlyVolumes = entry["geometryOnlyVolumes"]
+        self._moduleName = moduleName
+        self._entry = entry
+        self._resolved = {}
+
+    @property
+    def moduleName(self) -> str:
+        return self._moduleName
+
+    def _resolve(self, key, makeValue):
+        if key not in self._resolved:
+            self._resolved[key] = makeValue()
+        return self._resolved[key]
+
+    def _resolveCallable(self, key):
+        reference = self._entry[key]
+        return self._resolve(key, lambda: None if reference is None else _importByName(*reference))
+
+    @property
+    def function(self):
+        return self._resolve("function", lambda: _importByName(self._moduleName, self._entry["qualname"]))
+
+    @property
+    def batchSetup(self):
+        return self._resolveCallable("batchSetup")
+
+    @property
+    def batchTeardown(self):
+        return self._resolveCallable("batchTeardown")
+
+    @property
+    def parameters(self):
+        return self._resolve("parameters", lambda: _decode(self._entry["parameters"]))
+
+    @property
+    def returnType(self):
+        return self._resolve("returnType", lambda: _decode(self._entry["returnType"]))
+
+    @property
+    def sourceGraph(self):
+        sourceGraph = self._entry["sourceGraph"]
+        return self._resolve("sourceGraph", lambda: None if sourceGraph is None else _decode(sourceGraph))
+
+
+def manifestEntry(info: PipelineInfo) -> typing.Optional[dict]:
+    """
+    The manifest entry describing the pipeline, or None if it can't be described by one,
+    i.e. if its function or hooks can't be imported by name or if its types can't be pickled.
+    """
+    if isinstance(info, LazyPipelineInfo):
+        return info._entry
+    callables = [info.function, info.batchSetup, info.batchTeardown]
+    if not all(c is None or _isImportableByName(c) for c in callables):
+        return None
+    referencedModules = set(c.__module__ for c in callables if c is not None)
+    try:
+        parameters = _encode(info.parameters, referencedModules)
+        returnType = _encode(info.returnType, referencedModules)
+        sourceGraph = None if info.sourceGraph is None else _encode(info.sourceGraph, referencedModules)
+    except Exception:
+        return None
+    return {
+        "name": info.name,
+        "qualname": info.function.__qualname__,
+        "parameters": parameters,
+        "returnType": returnType,
+        "progressCallbackName": info.progressCallbackName,
+        "dependencies": list(info.dependencies),
+        "categories": list(info.categories),
+        "batchSetup": _callableReference(info.batchSetup),
+        "batchTeardown": _callableReference(info.batchTeardown),
+        "ownedInputsName": info.ownedInputsName,
+        "requiredRepresentations": info.requiredRepresentations,
+        "geometryOnlyVolumes": info.geometryOnlyVolumes,
+        "sourceGraph": sourceGraph,
+        "referencedModules": sorted(referencedModules),
+    }
+
+
+def readManifest(path) -> dict[str, list[dict]]:
+    """
+    Reads the manifest at path.
+
+    Returns the entries of the modules that have not changed since the manifest was written,
+    by module name. A module also counts as changed if one of the modules its entries reference did. Returns nothing if there is no manifest or if it was written by another
+    version of Slicer or of this module.
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("environment") != _environmentStamp():
+        return {}
+    return {
+        moduleName: module["pipelines"]
+        for moduleName, module in manifest.get("modules", {}).items()
+        if module.get("stamp") is not None and module["stamp"] == _moduleStamp(moduleName, module["pipelines"])
+    }
+
+
+def writeManifest(path, modules: dict[str, list[dict]]) -> None:
+    """
+    Adds the entries of the given modules to the manifest at path, replacing the previous
+    entries of those modules.
+    """
+    previous = readManifest(path)
+    previous.update(modules)
+    manifest = {
+        "environment": _environmentStamp(),
+        "modules": {
+            moduleName: {"stamp": _moduleStamp(moduleName, entries), "pipelines": entries}
+            for moduleName, entries in previous.items()
+        },
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    # write then rename, so concurrent Slicer processes never read a partial manifest
+    temporaryPath = f"{path}.{os.getpid()}.tmp"
+    with open(temporaryPath, "w", encoding="utf-8") as file:
+        json.dump(manifest, file)
+    os.replace(temporaryPath, path)
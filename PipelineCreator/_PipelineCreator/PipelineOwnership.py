@@ -0,0 +1,25 @@
+from _PipelineCreator.PipelineTypes import isPossiblyOptional
+
+__all__ = [
+    "PipelineOwnedInputs",
+    "isPipelineOwnedInputs",
+]
+
+
+class PipelineOwnedInputs(frozenset):
+    """
+    The names of the parameters whose values are owned by the caller of a pipeline function.
+
+    An owned input is an intermediate result the caller is going to delete right after the call,
+    so the pipeline function is free to modify it in place instead of working on a copy.
+
+    A pipeline function opts in by declaring a parameter of this type. Like the progress callback,
+    it is not a pipeline input; generated pipelines fill it in.
+    """
+
+
+def isPipelineOwnedInputs(param) -> bool:
+    """
+    Determines if a type is a possibly Optional PipelineOwnedInputs.
+    """
+    return isPossiblyOptional(param, PipelineOwnedInputs)
@@ -0,0 +1,160 @@
+import dataclasses
+import sys
+import time
+import typing
+
+import slicer
+import vtk
+
+from slicer.parameterNodeWrapper import isParameterPack
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak memory is not recorded there
+    resource = None
+
+__all__ = [
+    "PipelineProfile",
+    "PipelineStepProfile",
+    "vtkDataMemory",
+]
+
+
+def _peakRss() -> typing.Optional[int]:
+    """
+    The peak resident memory of the process so far in bytes, or None if it can't be known.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes everywhere but on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+_segmentRepresentationNames = (
+    slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName(),
+    slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName(),
+)
+
+
+def _findDataObjects(value, found: dict) -> None:
+    if isinstance(value, vtk.vtkDataObject):
+        found[id(value)] = value
+    elif isinstance(value, slicer.vtkMRMLSegmentationNode):
+        segmentation = value.GetSegmentation()
+        for index in range(segmentation.GetNumberOfSegments() if segmentation is not None else 0):
+            segment = segmentation.GetNthSegment(index)
+            for name in _segmentRepresentationNames:
+                # segments can share their labelmap, found is keyed by object so it is only counted once
+                _findDataObjects(segment.GetRepresentation(name), found)
+    elif isinstance(value, slicer.vtkMRMLVolumeNode):
+        _findDataObjects(value.GetImageData(), found)
+    elif isinstance(value, slicer.vtkMRMLModelNode):
+        _findDataObjects(value.GetMesh(), found)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _findDataObjects(item, found)
+    elif isParameterPack(value):
+        for paramName in value.allParameters:
+            _findDataObjects(value.getValue(paramName), found)
+
+
+def vtkDataMemory(value) -> int:
+    """
+    The memory in bytes of the VTK data held by value: image data of volumes, meshes of models,
+    representations of segmentations and VTK data objects, also inside lists, tuples and parameter packs.
+    """
+    found = {}
+    _findDataObjects(value, found)
+    # GetActualMemorySize is in kibibytes
+    return sum(dataObject.GetActualMemorySize() for dataObject in found.values()) * 1024
+
+
+@dataclasses.dataclass
+class PipelineStepProfile:
+    """
+    The measurements of one step of a pipeline run. Times are in seconds and memory in bytes.
+    """
+    # the pipeline the step ran
+    name: str
+    # the number of the step, e.g. "3_2" for the second step of the pipeline inlined as step 3
+    label: str
+    wallTime: float = 0.0
+    cpuTime: float = 0.0
+    # the peak resident memory of the process at the end of the step, and how much the step raised it.
+    # None where it can't be measured (Windows)
+    peakRss: typing.Optional[int] = None
+    peakRssIncrease: typing.Optional[int] = None
+    # the memory of the VTK data the step returned
+    vtkDataMemory: int = 0
+    # the steps of the pipeline run by this step, if it is a generated pipeline
+    steps: list["PipelineStepProfile"] = dataclasses.field(default_factory=list)
+
+
+class PipelineProfile:
+    """
+    Per step measurements of pipeline runs.
+
+    Set it as the profile of the PipelineProgressCallback given to a generated pipeline, the pipeline then
+    records each of its steps, and the steps of the pipelines its steps run as their children:
+
+        profile = PipelineProfile()
+        logic.run(..., progress_callback=PipelineProgressCallback(profile=profile))
+        print(profile)
+
+    Use one profile per run, a run stopped by an exception leaves its current steps unfinished.
+    """
+    def __init__(self):
+        self.steps: list[PipelineStepProfile] = []
+        # (step, wallStart, cpuStart, peakRssStart) of the steps that are running, innermost last
+        self._running = []
+
+    def beginStep(self, name: str, label: str) -> None:
+        step = PipelineStepProfile(name, label)
+        (self._running[-1][0].steps if self._running else self.steps).append(step)
+        self._running.append((step, time.perf_counter(), time.process_time(), _peakRss()))
+
+    def endStep(self, result=None) -> None:
+        """
+        Finishes the innermost running step. result is what the step returned.
+        """
+        step, wallStart, cpuStart, peakRssStart = self._running.pop()
+        step.wallTime = time.perf_counter() - wallStart
+        step.cpuTime = time.process_time() - cpuStart
+        step.peakRss = _peakRss()
+        if step.peakRss is not None:
+            step.peakRssIncrease = step.peakRss - peakRssStart
+        step.vtkDataMemory = vtkDataMemory(result)
+
+    @property
+    def wallTime(self) -> float:
+        return sum(step.wallTime for step in self.steps)
+
+    @property
+    def cpuTime(self) -> float:
+        return sum(step.cpuTime for step in self.steps)
+
+    def toDict(self) -> dict:
+        """
+        The profile as plain values, e.g. for saving as JSON.
+        """
+        return {
+            "wallTime": self.wallTime,
+            "cpuTime": self.cpuTime,
+            "steps": [dataclasses.asdict(step) for step in self.steps],
+        }
+
+    def __str__(self) -> str:
+        lines = [f"Pipeline profile: {self.wallTime:.3f}s wall, {self.cpuTime:.3f}s CPU"]
+
+        def addLines(steps, indent):
+            for step in steps:
+                memory = f", {step.vtkDataMemory / 2**20:.1f} MiB VTK data"
+                if step.peakRssIncrease:
+                    memory += f", peak memory +{step.peakRssIncrease / 2**20:.1f} MiB"
+                lines.append(f"{indent}step {step.label} ({step.name}): {step.wallTime:.3f}s wall,"
+                             f" {step.cpuTime:.3f}s CPU{memory}")
+                addLines(step.steps, indent + "  ")
+        addLines(self.steps, "  ")
+        return "\n".join(lines)
@@ -1,4 +1,6 @@
+import collections
 import dataclasses
+import functools
 import inspect
 import typing
 
@@ -20,6 +22,45 @@ class PipelineInfo:
     progressCallbackName: typing.Optional[str]
     dependencies: list[str]
     categories: list[str]
+    # Optional callables taking no arguments. They are run once before and once after a batch of runs
+    # so expensive per-call setup (widgets, logic objects, parameter nodes) can be shared across the batch.
+    batchSetup: typing.Optional[typing.Callable] = None
+    batchTeardown: typing.Optional[typing.Callable] = None
+    # Name of the PipelineOwnedInputs parameter, if the function accepts one
+    ownedInputsName: typing.Optional[str] = None
+    # key: name of a segmentation parameter, value: names of the segmentation representations
+    # (e.g. "Binary labelmap") the function needs. Generated pipelines create them only when needed.
+    requiredRepresentations: dict[str, list[str]] = dataclasses.field(default_factory=dict)
+    # Names of the volume parameters the function only reads the geometry of. Generated pipelines
+    # materialize geometry only volumes (see createGeometryOnlyVolume) given to any other volume parameter.
+    geometryOnlyVolumes: list[str] = dataclasses.field(default_factory=list)
+    # The nx.DiGraph the pipeline was generated from, for pipelines made by createPipeline.
+    # Pipelines using this one as a step inline it instead of calling function.
+    sourceGraph: typing.Optional[typing.Any] = None
+
+    def runBatch(self, inputs, progressCallback=None, onError=None, executionSettings=None):
+        """
+        Runs the pipeline once per dictionary of inputs, yielding each result as it completes.
+
+        The batch setup/teardown hooks are run once for the entire batch.
+        See PipelineBatch.runBatch for the meaning of onError.
+        If given, the PipelineExecutionSettings are applied for the duration of the batch.
+        """
+        from _PipelineCreator.PipelineBatch import runBatch
+
+        extraKwargs = {}
+        if self.progressCallbackName is not None and progressCallback is not None:
+            extraKwargs[self.progressCallbackName] = progressCallback
+        batch = runBatch(self.function, inputs,
+                         setup=self.batchSetup, teardown=self.batchTeardown, onError=onError, **extraKwargs)
+        if executionSettings is None:
+            return batch
+        return _runWithExecutionSettings(batch, executionSettings)
+
+
+def _runWithExecutionSettings(batch, executionSettings):
+    with executionSettings.applied():
+        yield from batch
 
 
 class PipelineRegistrar:
@@ -27,6 +68,48 @@ class PipelineRegistrar:
         # Users outside this class should only read this, not write directly to it
         self.registeredPipelines: dict[str, PipelineInfo] = dict()
 
+        # Indexes, kept up to date by _addPipeline and removePipeline.
+        # Indexing by type needs the types of the pipelines, which for pipelines read from a manifest
+        # may import the module defining them, so it is deferred until the first query by type.
+        self._unindexedPipelines: set[str] = set()
+        self._byInputType: dict[typing.Any, set[str]] = collections.defaultdict(set)
+        self._byReturnType: dict[typing.Any, set[str]] = collections.defaultdict(set)
+        self._byCategory: dict[str, set[str]] = collections.defaultdict(set)
+        # key: unannotated type, value: number of parameters and returns of that type
+        self._typeCounts: collections.Counter = collections.Counter()
+        # key: unannotated type, value: names of the pipelines with a parameter accepting it
+        self._consumersCache: dict[typing.Any, frozenset[str]] = dict()
+
+    @staticmethod
+    def _indexedTypes(info: PipelineInfo) -> tuple[set, typing.Any]:
+        #TODO: break apart parameter packs?
+        return set(unannotatedType(param) for param in info.parameters.values()), unannotatedType(info.returnType)
+
+    def _addPipeline(self, info: PipelineInfo) -> None:
+        if info.name in self.registeredPipelines:
+            self.removePipeline(info.name)
+        self.registeredPipelines[info.name] = info
+        for category in info.categories:
+            self._byCategory[category].add(info.name)
+        self._unindexedPipelines.add(info.name)
+        self._consumersCache.clear()
+
+    def _updateTypeIndexes(self) -> None:
+        for name in self._unindexedPipelines:
+            inputTypes, returnType = self._indexedTypes(self.registeredPipelines[name])
+            for type_ in inputTypes:
+                self._byInputType[type_].add(name)
+                self._typeCounts[type_] += 1
+            self._byReturnType[returnType].add(name)
+            self._typeCounts[returnType] += 1
+        self._unindexedPipelines.clear()
+
+    @staticmethod
+    def _removeFromIndex(index: dict, key, name: str) -> None:
+        index[key].discard(name)
+        if not index[key]:
+            del index[key]
+
     def isRegistered(self, pipelineName: str) -> bool:
         return pipelineName in self.registeredPipelines
 
@@ -53,29 +136,94 @@ class PipelineRegistrar:
         """
         Get all types used as inputs or outputs for all pipelines
         """
-        types = set()
-        for info in self.registeredPipelines.values():
-            #TODO: break apart parameter packs?
-            for param in info.parameters.values():
-                types.add(unannotatedType(param))
-            types.add(unannotatedType(info.returnType))
-        return types
-    
+        self._updateTypeIndexes()
+        return set(self._typeCounts.keys())
+
+    @property
+    def categories(self) -> list[str]:
+        """
+        All the categories of the registered pipelines, sorted.
+        """
+        return sorted(self._byCategory.keys())
+
+    def pipelinesInCategory(self, category: str) -> set[str]:
+        """
+        Names of the pipelines in the category.
+        """
+        return set(self._byCategory.get(category, set()))
+
+    def pipelinesWithInputType(self, type_) -> set[str]:
+        """
+        Names of the pipelines with a parameter of exactly the given (unannotated) type.
+        """
+        self._updateTypeIndexes()
+        return set(self._byInputType.get(type_, set()))
+
+    def pipelinesWithReturnType(self, type_) -> set[str]:
+        """
+        Names of the pipelines returning exactly the given (unannotated) type.
+        """
+        self._updateTypeIndexes()
+        return set(self._byReturnType.get(type_, set()))
+
+    def pipelinesConsuming(self, type_) -> frozenset[str]:
+        """
+        Names of the pipelines with a parameter that a value of the given (unannotated) type can be given to.
+
+        The result is cached until a pipeline is registered or removed.
+        """
+        from _PipelineCreator.PipelineCreation.util import isCompatibleType
+
+        self._updateTypeIndexes()
+        if type_ not in self._consumersCache:
+            consumers = set()
+            # one compatibility check per distinct parameter type, not per pipeline parameter
+            for inputType, names in self._byInputType.items():
+                if isCompatibleType(type_, inputType):
+                    consumers.update(names)
+            self._consumersCache[type_] = frozenset(consumers)
+        return self._consumersCache[type_]
+
     def removePipeline(self, name):
         """
         Remove a pipeline from the registry
         """
-        del self.registeredPipelines[name]
+        info = self.registeredPipelines.pop(name)
+        for category in info.categories:
+            self._removeFromIndex(self._byCategory, category, name)
+        if name in self._unindexedPipelines:
+            self._unindexedPipelines.discard(name)
+        else:
+            inputTypes, returnType = self._indexedTypes(info)
+            for type_ in inputTypes:
+                self._removeFromIndex(self._byInputType, type_, name)
+            self._removeFromIndex(self._byReturnType, returnType, name)
+            self._typeCounts.subtract(list(inputTypes) + [returnType])
+            self._typeCounts += collections.Counter()  # drops the types no pipeline uses anymore
+        self._consumersCache.clear()
 
-    def registerPipeline(self, name: str, function, dependencies, categories=None) -> None:
+    def registerPipeline(self, name: str, function, dependencies, categories=None,
+                         batchSetup=None, batchTeardown=None, requiredRepresentations=None, sourceGraph=None,
+                         geometryOnlyVolumes=None) -> None:
         """
         Registers a pipeline for use.
 
         function: A type annotated function to make a pipeline of
+        batchSetup: Optional callable run once before a batch of calls to function
+        batchTeardown: Optional callable run once after a batch of calls to function
+        requiredRepresentations: Optional dictionary from segmentation parameter names to the
+            names of the segmentation representations function needs
+        geometryOnlyVolumes: Optional names of the volume parameters function only reads the geometry of
+        sourceGraph: Optional pipeline graph function was generated from
         """
         from PipelineCreator import isPipelineProgressCallback
+        from _PipelineCreator.PipelineExecution import isPipelineExecutionSettings
+        from _PipelineCreator.PipelineOwnership import isPipelineOwnedInputs
+
+        from _PipelineCreator.PipelineManifest import LazyPipelineInfo
 
-        if name in self.registeredPipelines:
+        # the real registration replaces the one read from a manifest
+        if name in self.registeredPipelines and not isinstance(self.registeredPipelines[name], LazyPipelineInfo):
             raise RuntimeError(f"Cannot register pipeline with duplicate name '{name}'")
 
         self.validatePipelineFunction(function)
@@ -92,5 +240,79 @@ class PipelineRegistrar:
         else:
             progressCallbackName = next(iter(progressCallbacks.keys()))
 
-        info = PipelineInfo(name, function, parameterHints, returnHint, progressCallbackName, dependencies, categories or [])
-        self.registeredPipelines[name] = info
+        ownedInputs = [key for key, value in parameterHints.items() if isPipelineOwnedInputs(value)]
+        parameterHints = {key: value for key, value in parameterHints.items() if not isPipelineOwnedInputs(value)}
+        ownedInputsName = ownedInputs[0] if ownedInputs else None
+
+        # execution settings are process wide, so when a pipeline is used as a step the
+        # settings given to the outer pipeline already apply to it
+        parameterHints = {key: value for key, value in parameterHints.items() if not isPipelineExecutionSettings(value)}
+
+        requiredRepresentations = {key: list(value) for key, value in (requiredRepresentations or {}).items()}
+        for parameterName in requiredRepresentations:
+            if parameterName not in parameterHints:
+                raise RuntimeError(f"Pipelined function {function} requires representations for unknown parameter '{parameterName}'")
+
+        geometryOnlyVolumes = list(geometryOnlyVolumes or [])
+        for parameterName in geometryOnlyVolumes:
+            if parameterName not in parameterHints:
+                raise RuntimeError(f"Pipelined function {function} declares unknown parameter '{parameterName}' as geometry only")
+
+        info = PipelineInfo(name, function, parameterHints, returnHint, progressCallbackName, dependencies, categories or [],
+                            batchSetup=batchSetup, batchTeardown=batchTeardown, ownedInputsName=ownedInputsName,
+                            requiredRepresentations=requiredRepresentations, sourceGraph=sourceGraph,
+                            geometryOnlyVolumes=geometryOnlyVolumes)
+        self._addPipeline(info)
+
+    def loadManifest(self, path, moduleNames: list[str], callAfterLoaded=None) -> list[str]:
+        """
+        Registers the pipelines of the given modules from the manifest at path, without importing the modules.
+
+        The modules are imported the first time one of their pipelines is called (see LazyPipelineInfo).
+        Returns the names of the modules that are missing from the manifest or changed since it was written.
+        Those must be imported to register their pipelines.
+
+        callAfterLoaded: Optional callable taking (callback, dependencies) that calls callback once the
+            dependencies of a pipeline are loaded, like @slicerPipeline waits for them. By default the
+            pipelines are registered right away.
+        """
+        from _PipelineCreator.PipelineManifest import readManifest
+
+        manifest = readManifest(path)
+        missingModuleNames = []
+        for moduleName in moduleNames:
+            if moduleName not in manifest:
+                missingModuleNames.append(moduleName)
+                continue
+            for entry in manifest[moduleName]:
+                addPipeline = functools.partial(self._addLazyPipeline, entry, moduleName)
+                if callAfterLoaded is None:
+                    addPipeline()
+                else:
+                    callAfterLoaded(addPipeline, entry["dependencies"])
+        return missingModuleNames
+
+    def _addLazyPipeline(self, entry: dict, moduleName: str) -> None:
+        from _PipelineCreator.PipelineManifest import LazyPipelineInfo
+
+        # the module may have been imported, registering the real pipeline, while waiting for the dependencies
+        if entry["name"] not in self.registeredPipelines:
+            self._addPipeline(LazyPipelineInfo(entry, moduleName))
+
+    def updateManifest(self, path, moduleNames: list[str]) -> None:
+        """
+        Writes the registered pipelines of the given modules to the manifest at path.
+
+        Modules with a pipeline that can't be described by the manifest are left out of it,
+        so they are always imported.
+        """
+        from _PipelineCreator.PipelineManifest import LazyPipelineInfo, manifestEntry, writeManifest
+
+        modules = {moduleName: [] for moduleName in moduleNames}
+        for info in self.registeredPipelines.values():
+            moduleName = info.moduleName if isinstance(info, LazyPipelineInfo) else info.function.__module__
+            if moduleName in modules and modules[moduleName] is not None:
+                entry = manifestEntry(info)
+                modules[moduleName] = None if entry is None else modules[moduleName] + [entry]
+        # a module without pipelines in the manifest would never be imported
+        writeManifest(path, {moduleName: entries for moduleName, entries in modules.items() if entries})
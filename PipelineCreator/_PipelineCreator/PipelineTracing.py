@@ -0,0 +1,113 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import typing
+
+__all__ = [
+    "PipelineTracer",
+    "currentTracer",
+    "traceSpan",
+]
+
+# the tracer spans are recorded in, None when tracing is off
+_currentTracer: typing.Optional["PipelineTracer"] = None
+
+
+def currentTracer() -> typing.Optional["PipelineTracer"]:
+    return _currentTracer
+
+
+def traceSpan(name: str, category: str = "pipeline", **args):
+    """
+    A with block recorded as a span of the current tracer. Does nothing if tracing is off.
+    """
+    if _currentTracer is None:
+        return contextlib.nullcontext()
+    return _currentTracer.span(name, category, **args)
+
+
+def _now() -> float:
+    # microseconds since the epoch, so the traces of several processes line up
+    return time.time() * 1e6
+
+
+class PipelineTracer:
+    """
+    Records spans as Chrome trace events, which chrome://tracing and Perfetto open from a local file.
+
+    While the tracer is used as a context manager it is the current tracer: the steps of generated pipelines
+    (through their PipelineProgressCallback), the Pipeline Case Iterator and traceSpan record their spans in
+    it, one track per process and thread. The file is written when the with block ends:
+
+        with PipelineTracer("trace.json"):
+            logic.run(...)
+    """
+    def __init__(self, path: typing.Optional[str] = None, processName: str = "Slicer"):
+        """
+        path - Where __exit__ writes the trace, if given.
+        processName - The name of the track of this process.
+        """
+        self.path = path
+        self.processName = processName
+        self.events: list[dict] = []
+        self._namedThreads = set()
+        self._previousTracer = None
+
+    def _event(self, phase: str, **fields) -> dict:
+        pid, tid = os.getpid(), threading.get_ident()
+        if tid not in self._namedThreads:
+            self._namedThreads.add(tid)
+            self.events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid,
+                                "args": {"name": threading.current_thread().name}})
+        event = {"ph": phase, "pid": pid, "tid": tid, **fields}
+        self.events.append(event)
+        return event
+
+    def begin(self, name: str, category: str = "pipeline", **args) -> None:
+        """
+        Starts a span on the current thread. Spans of a thread must end in the reverse order they began.
+        """
+        self._event("B", name=name, cat=category, ts=_now(), args=args)
+
+    def end(self) -> None:
+        """
+        Ends the last span that began on the current thread.
+        """
+        self._event("E", ts=_now())
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "pipeline", **args):
+        self.begin(name, category, **args)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def addSpan(self, name: str, start: float, end: float, category: str = "pipeline", **args) -> None:
+        """
+        Records a span that already happened. start and end are time.time() values.
+        """
+        self._event("X", name=name, cat=category, ts=start * 1e6, dur=(end - start) * 1e6, args=args)
+
+    def write(self, path: typing.Optional[str] = None) -> None:
+        """
+        Writes the trace event JSON to path, or to the path given at construction.
+        """
+        processNameEvent = {"ph": "M", "name": "process_name", "pid": os.getpid(), "args": {"name": self.processName}}
+        with open(path or self.path, "w") as file:
+            json.dump({"traceEvents": [processNameEvent] + self.events, "displayTimeUnit": "ms"}, file)
+
+    def __enter__(self) -> "PipelineTracer":
+        global _currentTracer
+        self._previousTracer = _currentTracer
+        _currentTracer = self
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _currentTracer
+        _currentTracer = self._previousTracer
+        self._previousTracer = None
+        if self.path is not None:
+            self.write()
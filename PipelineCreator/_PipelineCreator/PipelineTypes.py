@@ -0,0 +1,19 @@
+import typing
+
+from slicer.parameterNodeWrapper import unannotatedType
+
+__all__ = [
+    "isPossiblyOptional",
+]
+
+
+def isPossiblyOptional(param, cls) -> bool:
+    """
+    Determines if a type is cls or Optional[cls], ignoring Annotated.
+    """
+    param = unannotatedType(param)
+    args = typing.get_args(param)
+    # remove Optional if it exists
+    if typing.get_origin(param) == typing.Union and len(args) == 2 and args[1] == type(None):
+        param = args[0]
+    return unannotatedType(param) == cls
@@ -1,12 +1,16 @@
 from slicer.ScriptedLoadableModule import *
 
-#import all the default wrappings. doing the import will register them with the pipeline creator
-from _PipelineModules import (
-    SegmentationsWrapping,
-    SegmentEditorWrapping,
-    SurfaceToolboxWrapping,
-    vtkWrapping,
-)
+from PipelineCreator import registerPipelineModules
+
+# register all the default wrappings. they are imported (which registers them with the pipeline creator)
+# only if the pipeline manifest is out of date, otherwise on the first call of one of their pipelines
+registerPipelineModules([
+    "_PipelineModules.LabelmapWrapping",
+    "_PipelineModules.SegmentationsWrapping",
+    "_PipelineModules.SegmentEditorWrapping",
+    "_PipelineModules.SurfaceToolboxWrapping",
+    "_PipelineModules.vtkWrapping",
+])
 
 #
 # PipelineModules
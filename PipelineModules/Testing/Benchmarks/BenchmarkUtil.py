@@ -0,0 +1,160 @@
+"""
+Small helpers shared by the PipelineModules benchmark scripts.
+
+The benchmarks are not part of the test suite. Run them inside Slicer, e.g.
+
+  Slicer --no-main-window --python-script SurfaceToolboxBenchmark.py
+"""
+
+import statistics
+import time
+
+import numpy as np
+import slicer
+import vtk
+from slicer.parameterNodeWrapper import isParameterPack
+
+# the synthetic volumes are this many millimeters wide whatever their number of voxels, so models and
+# volumes of any size overlap
+syntheticExtent = 128.0
+# (center, radius) in millimeters of the spheres of the synthetic data: one large sphere and two small ones
+# apart from it, so the connectivity and island pipelines have several components to work on
+syntheticSpheres = [
+    ((64.0, 64.0, 64.0), 40.0),
+    ((14.0, 14.0, 14.0), 8.0),
+    ((114.0, 114.0, 14.0), 6.0),
+]
+
+
+def makeSphereModel(resolution: int) -> "slicer.vtkMRMLModelNode":
+    """
+    Makes a model of a sphere with about 2 * resolution * resolution triangles.
+    """
+    sphereSource = vtk.vtkSphereSource()
+    sphereSource.SetThetaResolution(resolution)
+    sphereSource.SetPhiResolution(resolution)
+    sphereSource.Update()
+    model = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+    model.SetAndObservePolyData(sphereSource.GetOutput())
+    return model
+
+
+def makeSyntheticModel(resolution: int) -> "slicer.vtkMRMLModelNode":
+    """
+    Makes a model of the synthetic spheres with a little more than 2 * resolution * resolution triangles.
+    """
+    append = vtk.vtkAppendPolyData()
+    for center, radius in syntheticSpheres:
+        sphereSource = vtk.vtkSphereSource()
+        sphereSource.SetCenter(center)
+        sphereSource.SetRadius(radius)
+        # the small spheres get less triangles, in proportion to their radius
+        sphereResolution = max(8, int(resolution * radius / syntheticSpheres[0][1]))
+        sphereSource.SetThetaResolution(sphereResolution)
+        sphereSource.SetPhiResolution(sphereResolution)
+        append.AddInputConnection(sphereSource.GetOutputPort())
+    append.Update()
+    model = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+    model.SetAndObservePolyData(append.GetOutput())
+    return model
+
+
+def _syntheticLabels(size: int, seed: int = 0):
+    """
+    Yields (k, labels) for each slice of a size^3 volume covering syntheticExtent: 1 inside the large sphere,
+    2 inside the small ones and 3 for scattered single voxel islands, 0 elsewhere.
+    """
+    rng = np.random.default_rng(seed)
+    spacing = syntheticExtent / size
+    j, i = np.mgrid[0:size, 0:size] * spacing
+    for k in range(size):
+        labels = np.zeros((size, size), dtype=np.int16)
+        z = k * spacing
+        for label, (center, radius) in enumerate(syntheticSpheres):
+            inside = (i - center[0]) ** 2 + (j - center[1]) ** 2 + (z - center[2]) ** 2 <= radius ** 2
+            labels[inside] = min(label + 1, 2)
+        islands = rng.random((size, size)) < 0.0005
+        labels[islands & (labels == 0)] = 3
+        yield k, labels
+
+
+def _makeVolumeNode(className: str, size: int, makeSlice) -> "slicer.vtkMRMLVolumeNode":
+    # filled slice by slice to avoid large temporaries for the large sizes
+    voxels = np.empty((size, size, size), dtype=np.int16)
+    for k, labels in _syntheticLabels(size):
+        voxels[k] = makeSlice(labels)
+    volume = slicer.mrmlScene.AddNewNodeByClass(className)
+    spacing = syntheticExtent / size
+    volume.SetSpacing(spacing, spacing, spacing)
+    slicer.util.updateVolumeFromArray(volume, voxels)
+    return volume
+
+
+def makeSyntheticVolume(size: int, seed: int = 0) -> "slicer.vtkMRMLScalarVolumeNode":
+    """
+    Makes a size^3 int16 scalar volume of the synthetic spheres: about 1000 in the large sphere, 500 in the
+    small ones and the islands and 0 around them, with noise.
+    """
+    rng = np.random.default_rng(seed)
+    intensities = np.array([0, 1000, 500, 1000], dtype=np.int16)
+    return _makeVolumeNode("vtkMRMLScalarVolumeNode", size,
+                           lambda labels: intensities[labels] + rng.integers(-50, 50, size=labels.shape, dtype=np.int16))
+
+
+def makeSyntheticLabelMap(size: int) -> "slicer.vtkMRMLLabelMapVolumeNode":
+    """
+    Makes a size^3 labelmap of the synthetic spheres, see _syntheticLabels.
+    """
+    return _makeVolumeNode("vtkMRMLLabelMapVolumeNode", size, lambda labels: labels)
+
+
+# names of the segments of the synthetic segmentations, by label
+syntheticSegmentNames = ["sphere", "smallSpheres", "islands"]
+
+
+def makeSyntheticSegmentation(size: int) -> "slicer.vtkMRMLSegmentationNode":
+    """
+    Makes a segmentation of the synthetic spheres with a size^3 binary labelmap and the segments of
+    syntheticSegmentNames.
+    """
+    labelMap = makeSyntheticLabelMap(size)
+    segmentation = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
+    slicer.modules.segmentations.logic().ImportLabelmapToSegmentationNode(labelMap, segmentation)
+    slicer.mrmlScene.RemoveNode(labelMap)
+    for index in range(segmentation.GetSegmentation().GetNumberOfSegments()):
+        segmentation.GetSegmentation().GetNthSegment(index).SetName(syntheticSegmentNames[index])
+    return segmentation
+
+
+def removeNodes(value) -> None:
+    """
+    Removes the MRML nodes in value from the scene, also inside lists, tuples and parameter packs.
+    """
+    if isinstance(value, slicer.vtkMRMLNode):
+        slicer.mrmlScene.RemoveNode(value)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            removeNodes(item)
+    elif isParameterPack(value):
+        for paramName in value.allParameters:
+            removeNodes(value.getValue(paramName))
+
+
+def timeCall(function, repeats: int) -> list[float]:
+    """
+    Calls function repeats times and returns the wall time of each call in seconds.
+
+    Any MRML node the function returns is removed from the scene so the scene does not
+    grow while timing.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+        removeNodes(result)
+    return times
+
+
+def formatTimes(times: list[float]) -> str:
+    return f"median {statistics.median(times) * 1000:9.3f} ms  min {min(times) * 1000:9.3f} ms"
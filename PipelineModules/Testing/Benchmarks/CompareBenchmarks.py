@@ -0,0 +1,100 @@
+"""
+Compares two result files of PipelineBenchmark.py and lists the benchmarks that got slower.
+
+  python CompareBenchmarks.py baseline.json current.json [--threshold 1.1] [--all]
+
+A benchmark is flagged as slower when its median time is more than threshold times the baseline median,
+and its fastest run is still slower than the baseline median, so a few noisy runs are not enough to flag it.
+Exits with 1 if a benchmark got slower, so it can be used in scripts. Does not need Slicer.
+"""
+
+import argparse
+import json
+import sys
+
+formatName = "SlicerPipelines.Benchmark"
+
+
+def loadResults(path: str) -> dict:
+    with open(path) as file:
+        results = json.load(file)
+    if results.get("format") != formatName:
+        raise ValueError(f"{path} is not a PipelineBenchmark.py result file")
+    return results
+
+
+def benchmarkKey(result: dict) -> tuple:
+    return result["pipeline"], result["size"], json.dumps(result["parameters"], sort_keys=True)
+
+
+def compare(baseline: dict, current: dict, threshold: float = 1.1) -> list[tuple[str, tuple, dict, dict]]:
+    """
+    Returns (status, key, baselineResult, currentResult) for each benchmark of either file, where status is
+    "slower", "faster", "same", "error" (it failed or was skipped in the current results), "new" (it is not in
+    the baseline or failed there) or "removed". Errors first, then the slowest.
+    """
+    baselineResults = {benchmarkKey(result): result for result in baseline["results"]}
+    currentResults = {benchmarkKey(result): result for result in current["results"]}
+
+    comparisons = []
+    for key, result in currentResults.items():
+        before = baselineResults.get(key)
+        if "median" not in result:
+            comparisons.append(("error", key, before, result))
+        elif before is None or "median" not in before:
+            comparisons.append(("new", key, before, result))
+        elif result["median"] > before["median"] * threshold and result["min"] > before["median"]:
+            comparisons.append(("slower", key, before, result))
+        elif before["median"] > result["median"] * threshold and before["min"] > result["median"]:
+            comparisons.append(("faster", key, before, result))
+        else:
+            comparisons.append(("same", key, before, result))
+    comparisons += [("removed", key, result, None) for key, result in baselineResults.items() if key not in currentResults]
+
+    def ratio(comparison):
+        _, _, before, after = comparison
+        if before is None or after is None or "median" not in before or "median" not in after:
+            return 0.0
+        return after["median"] / max(before["median"], 1e-12)
+    order = ["error", "slower", "faster", "new", "removed", "same"]
+    return sorted(comparisons, key=lambda comparison: (order.index(comparison[0]), -ratio(comparison)))
+
+
+def _describe(status: str, key: tuple, before: dict, after: dict) -> str:
+    pipeline, size, parameters = key
+    name = f"{pipeline} [{size}] {parameters}"
+    if status in ("slower", "faster", "same"):
+        return (f"{status:8} x{after['median'] / max(before['median'], 1e-12):5.2f}  {name}:"
+                f" {before['median'] * 1000:.3f} ms -> {after['median'] * 1000:.3f} ms")
+    if status == "error":
+        return f"{status:8}         {name}: {after.get('error') or after.get('skipped')}"
+    return f"{status:8}         {name}"
+
+
+def main(argv) -> int:
+    parser = argparse.ArgumentParser(description="Compares two PipelineBenchmark.py result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=1.1,
+                        help="Ratio of the medians above which a benchmark is slower")
+    parser.add_argument("--all", action="store_true", help="Also list the benchmarks that did not change")
+    args = parser.parse_args(argv)
+
+    baseline = loadResults(args.baseline)
+    current = loadResults(args.current)
+    for name in ("platform", "cpuCount", "slicer", "vtk"):
+        if baseline["environment"].get(name) != current["environment"].get(name):
+            print(f"Note: {name} differs: {baseline['environment'].get(name)} -> {current['environment'].get(name)}")
+
+    comparisons = compare(baseline, current, args.threshold)
+    for status, key, before, after in comparisons:
+        if status != "same" or args.all:
+            print(_describe(status, key, before, after))
+    slower = [comparison for comparison in comparisons if comparison[0] == "slower"]
+    print(f"{len(slower)} slower, {sum(1 for comparison in comparisons if comparison[0] == 'faster')} faster"
+          f" out of {len(comparisons)} benchmarks")
+    return 1 if slower else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,282 @@
+"""
+Times every pipeline registered by the PipelineModules wrappings on synthetic models, volumes, labelmaps
+and segmentations of several sizes, over a grid of parameter values, and writes the results as JSON.
+
+  Slicer --no-main-window --python-script PipelineBenchmark.py [--output results.json] [--sizes small medium]
+         [--pipelines "vtk*" ...] [--repeats 5] [--warmup 1]
+
+Each combination of pipeline, size and parameters is run warmup + repeats times in a single batch, so the
+batch setup of the pipeline is only in the warmup runs, and the times of the repeats are recorded with
+their statistics. Compare two result files with CompareBenchmarks.py.
+"""
+
+import argparse
+import datetime
+import enum
+import fnmatch
+import importlib
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+import slicer
+import vtk
+from slicer.parameterNodeWrapper import Choice, Default, findFirstAnnotation, splitAnnotations, unannotatedType
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from BenchmarkUtil import (
+    makeSyntheticLabelMap,
+    makeSyntheticModel,
+    makeSyntheticSegmentation,
+    makeSyntheticVolume,
+    removeNodes,
+    syntheticSegmentNames,
+)
+from PipelineCreator import PipelineCreatorLogic
+
+formatName = "SlicerPipelines.Benchmark"
+formatVersion = 1
+
+benchmarkedModules = [
+    "_PipelineModules.LabelmapWrapping",
+    "_PipelineModules.SegmentationsWrapping",
+    "_PipelineModules.SegmentEditorWrapping",
+    "_PipelineModules.SurfaceToolboxWrapping",
+    "_PipelineModules.vtkWrapping",
+]
+
+# name -> (sphere resolution of the models, number of voxels along each axis of the volumes)
+sizes = {
+    "small": (32, 64),
+    "medium": (128, 128),
+    "large": (512, 256),
+}
+
+# input node class -> function making the synthetic input of a size. Subclasses first, the first match is used
+syntheticInputs = [
+    (slicer.vtkMRMLLabelMapVolumeNode, lambda size: makeSyntheticLabelMap(sizes[size][1])),
+    (slicer.vtkMRMLScalarVolumeNode, lambda size: makeSyntheticVolume(sizes[size][1])),
+    (slicer.vtkMRMLSegmentationNode, lambda size: makeSyntheticSegmentation(sizes[size][1])),
+    (slicer.vtkMRMLModelNode, lambda size: makeSyntheticModel(sizes[size][0])),
+]
+
+# pipeline name -> parameter name -> the values to benchmark. The parameters not listed here are benchmarked
+# with every value of enums and choices, their default otherwise
+parameterGrids = {
+    "SegmentEditor.Smoothing": {"kernelSize": [3, 7]},
+    "SegmentEditor.Margin": {"marginSize": [1.0, 4.0]},
+    "SegmentEditor.Hollow": {"thickness": [1.0, 4.0]},
+    "SurfaceToolbox.Decimate": {"reduction": [0.5, 0.9]},
+    "SurfaceToolbox.Smoothing.Taubin": {"iterations": [10, 30]},
+    "SurfaceToolbox.Smoothing.Laplace": {"iterations": [20, 100]},
+    "SurfaceToolbox.ScaleMesh": {"scaleX": [1.5], "scaleY": [1.5], "scaleZ": [1.5]},
+    "SurfaceToolbox.TranslateMesh": {"translateX": [10.0], "translateY": [10.0], "translateZ": [10.0]},
+    "SurfaceToolbox.Mirror": {"mirrorX": [True]},
+    "vtkQuadricDecimation": {"targetReduction": [0.5, 0.9]},
+    "vtkDecimatePro": {"targetReduction": [0.5, 0.9]},
+    "vtkSmoothPolyDataFilter": {"iterations": [10, 30]},
+    "vtkWindowedSincPolyDataFilter": {"iterations": [10, 30]},
+    "vtkConstrainedSmoothingFilter": {"iterations": [10, 30]},
+    "vtkBinnedDecimation": {"numberOfDivisions": [64, 256]},
+    "Export Segment to Model - Name": {"segmentName": [syntheticSegmentNames[0]]},
+    # the default spacing of 0.1 mm would make volumes of a billion voxels of the synthetic models
+    "Export Model to Segmentation - Spacing": {"spacingX": [1.0], "spacingY": [1.0], "spacingZ": [1.0]},
+}
+
+
+def benchmarkedPipelines(patterns: list[str]) -> list:
+    """
+    The PipelineInfo of the pipelines of benchmarkedModules whose name matches one of the fnmatch patterns.
+    """
+    for moduleName in benchmarkedModules:
+        # imported so the pipelines read from the manifest are registered with their real PipelineInfo
+        importlib.import_module(moduleName)
+    pipelines = [
+        info for info in PipelineCreatorLogic().registeredPipelines.values()
+        if info.function.__module__ in benchmarkedModules
+        and any(fnmatch.fnmatchcase(info.name, pattern) for pattern in patterns)
+    ]
+    return sorted(pipelines, key=lambda info: info.name)
+
+
+def _isNodeType(paramType) -> bool:
+    actualType = unannotatedType(paramType)
+    return isinstance(actualType, type) and issubclass(actualType, slicer.vtkMRMLNode)
+
+
+def parameterValues(pipelineName: str, paramName: str, paramType) -> list:
+    grid = parameterGrids.get(pipelineName, {})
+    if paramName in grid:
+        return grid[paramName]
+    actualType, annotations = splitAnnotations(paramType)
+    if isinstance(actualType, type) and issubclass(actualType, enum.Enum):
+        return list(actualType)
+    choice = findFirstAnnotation(annotations, Choice)
+    if choice is not None:
+        return list(choice.choices)
+    default = findFirstAnnotation(annotations, Default)
+    if default is not None:
+        return [default.value]
+    # e.g. False for bool, 0 for int, "" for str
+    return [actualType()]
+
+
+def parameterGrid(info) -> list[dict]:
+    """
+    Every combination of the benchmarked values of the parameters of the pipeline that are not nodes.
+    """
+    names = [name for name, paramType in info.parameters.items() if not _isNodeType(paramType)]
+    values = [parameterValues(info.name, name, info.parameters[name]) for name in names]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def makeInputs(info, size: str) -> dict:
+    """
+    The synthetic node inputs of the pipeline. Raises ValueError if there is no synthetic data for one of them.
+    """
+    inputs = {}
+    for name, paramType in info.parameters.items():
+        if not _isNodeType(paramType):
+            continue
+        for nodeClass, makeInput in syntheticInputs:
+            if issubclass(unannotatedType(paramType), nodeClass):
+                inputs[name] = makeInput(size)
+                break
+        else:
+            raise ValueError(f"no synthetic data for {unannotatedType(paramType).__name__}")
+    return inputs
+
+
+def describeInput(node) -> str:
+    if isinstance(node, slicer.vtkMRMLModelNode):
+        return f"{node.GetPolyData().GetNumberOfPolys()} triangles"
+    if isinstance(node, slicer.vtkMRMLVolumeNode):
+        return "x".join(str(dimension) for dimension in node.GetImageData().GetDimensions()) + " voxels"
+    if isinstance(node, slicer.vtkMRMLSegmentationNode):
+        return f"{node.GetSegmentation().GetNumberOfSegments()} segments"
+    return node.GetClassName()
+
+
+def _jsonValue(value):
+    if isinstance(value, enum.Enum):
+        return value.name
+    if isinstance(value, (bool, int, float, str)) or value is None:
+        return value
+    return str(value)
+
+
+def timeBatch(info, parameters: dict, repeats: int, warmup: int) -> list[float]:
+    """
+    Runs the pipeline warmup + repeats times in one batch and returns the wall time of the repeats in seconds.
+    The results are removed from the scene between the runs, outside of the timing.
+    """
+    starts = []
+
+    def inputs():
+        for _ in range(warmup + repeats):
+            starts.append(time.perf_counter())
+            yield parameters
+
+    times = []
+    for result in info.runBatch(inputs()):
+        times.append(time.perf_counter() - starts[-1])
+        removeNodes(result)
+    return times[warmup:]
+
+
+def benchmark(info, size: str, repeats: int, warmup: int) -> list[dict]:
+    """
+    The results of the pipeline for each combination of its parameter grid, on the synthetic inputs of size.
+    """
+    results = []
+    dataNodesBefore = set(node.GetID() for node in slicer.util.getNodesByClass("vtkMRMLDisplayableNode"))
+    try:
+        inputs = makeInputs(info, size)
+    except ValueError as e:
+        return [{"pipeline": info.name, "size": size, "parameters": {}, "inputs": {}, "skipped": str(e)}]
+
+    try:
+        for parameters in parameterGrid(info):
+            result = {
+                "pipeline": info.name,
+                "size": size,
+                "parameters": {name: _jsonValue(value) for name, value in parameters.items()},
+                "inputs": {name: describeInput(node) for name, node in inputs.items()},
+            }
+            try:
+                times = timeBatch(info, {**inputs, **parameters}, repeats, warmup)
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+                print(f"{info.name:50} {size:7} {result['parameters']}  error: {result['error']}")
+            else:
+                result.update({
+                    "times": times,
+                    "median": statistics.median(times),
+                    "mean": statistics.mean(times),
+                    "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+                    "min": min(times),
+                    "max": max(times),
+                })
+                print(f"{info.name:50} {size:7} {result['parameters']}  median {result['median'] * 1000:9.3f} ms"
+                      f"  stdev {result['stdev'] * 1000:8.3f} ms")
+            results.append(result)
+    finally:
+        # the inputs and any data the pipelines left behind. Other nodes (e.g. the parameter nodes of the
+        # Segment Editor helpers) are kept, they are reused by the next batches
+        for node in slicer.util.getNodesByClass("vtkMRMLDisplayableNode"):
+            if node.GetID() not in dataNodesBefore:
+                slicer.mrmlScene.RemoveNode(node)
+    return results
+
+
+def environment() -> dict:
+    return {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "slicer": slicer.app.applicationVersion,
+        "slicerRevision": slicer.app.repositoryRevision,
+        "vtk": vtk.vtkVersion.GetVTKVersion(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpuCount": os.cpu_count(),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmarks the PipelineModules pipelines on synthetic data")
+    parser.add_argument("--output", default=f"benchmark-{datetime.datetime.now():%Y%m%d-%H%M%S}.json",
+                        help="The JSON file the results are written to")
+    parser.add_argument("--sizes", nargs="+", choices=list(sizes), default=list(sizes))
+    parser.add_argument("--pipelines", nargs="+", default=["*"], help="fnmatch patterns of the pipeline names")
+    parser.add_argument("--repeats", type=int, default=5, help="The number of timed runs of each combination")
+    parser.add_argument("--warmup", type=int, default=1, help="The number of untimed runs before them")
+    args = parser.parse_args(argv)
+
+    pipelines = benchmarkedPipelines(args.pipelines)
+    print(f"Benchmarking {len(pipelines)} pipelines, sizes {', '.join(args.sizes)}, {args.repeats} repeats")
+    results = []
+    for size in args.sizes:
+        for info in pipelines:
+            results += benchmark(info, size, args.repeats, args.warmup)
+
+    with open(args.output, "w") as file:
+        json.dump({
+            "format": formatName,
+            "version": formatVersion,
+            "environment": environment(),
+            "repeats": args.repeats,
+            "warmup": args.warmup,
+            "sizes": {size: {"modelResolution": sizes[size][0], "volumeSize": sizes[size][1]} for size in args.sizes},
+            "results": results,
+        }, file, indent=2)
+    print(f"Results written to {args.output}")
+
+
+main(sys.argv[1:])
+if slicer.app.commandOptions().noMainWindow:
+    slicer.app.exit()
@@ -0,0 +1,67 @@
+"""
+Compares the classic single threaded VTK pipelines with their SMP-parallel equivalents,
+with one thread and with all the threads of the machine.
+
+  Slicer --no-main-window --python-script SMPFilterBenchmark.py [numberOfTriangles ...]
+
+By default the meshes have 100k, 1M and 10M triangles.
+"""
+
+import math
+import os
+import sys
+
+import slicer
+import vtk
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from BenchmarkUtil import formatTimes, makeSphereModel, timeCall
+from PipelineCreator import PipelineExecutionSettings
+from _PipelineModules import vtkWrapping as vw
+
+
+def filterPairs(mesh):
+    """
+    (name, classic call, SMP call) for each filter with an SMP-parallel equivalent in this VTK.
+    """
+    pairs = []
+    if hasattr(vw, "binnedDecimation"):
+        pairs.append(("decimation",
+                      lambda: vw.decimatePro(mesh, 0.9, False, True, False, 75.0, 15.0, 25),
+                      lambda: vw.binnedDecimation(mesh, 256, True, "BinAverages")))
+    if hasattr(vw, "constrainedSmoothingFilter"):
+        pairs.append(("smoothing",
+                      lambda: vw.smoothPolyDataFilter(mesh, 0.8, True, 30, 45.0, 15.0),
+                      lambda: vw.constrainedSmoothingFilter(mesh, 0.8, 30, 1.0)))
+    if hasattr(vw, "triangleMeshPointNormals"):
+        pairs.append(("normals",
+                      lambda: vw.polyDataNormals(mesh, False, False, 30.0, True, True, False, False, True),
+                      lambda: vw.triangleMeshPointNormals(mesh)))
+    return pairs
+
+
+def main(triangleCounts):
+    backend = "STDThread" if vtk.vtkSMPTools.SetBackend("STDThread") else vtk.vtkSMPTools.GetBackend()
+    vtk.vtkSMPTools.Initialize(0)
+    maxThreads = vtk.vtkSMPTools.GetEstimatedNumberOfThreads()
+    threadCounts = sorted({1, maxThreads})
+    print(f"VTK {vtk.vtkVersion.GetVTKVersion()}, SMP backend {backend}, up to {maxThreads} threads")
+
+    for triangleCount in triangleCounts:
+        # a sphere source makes about 2 * resolution^2 triangles
+        mesh = makeSphereModel(int(math.sqrt(triangleCount / 2)))
+        repeats = 5 if triangleCount < 1_000_000 else 2
+        print(f"--- {mesh.GetPolyData().GetNumberOfPolys()} triangles, {repeats} repeats")
+        for name, classic, smp in filterPairs(mesh):
+            for numberOfThreads in threadCounts:
+                PipelineExecutionSettings(backend, numberOfThreads).apply()
+                classicTimes = timeCall(classic, repeats)
+                smpTimes = timeCall(smp, repeats)
+                print(f"{name:12} {numberOfThreads:3} threads  classic: {formatTimes(classicTimes)} | SMP: {formatTimes(smpTimes)}")
+        slicer.mrmlScene.RemoveNode(mesh)
+
+
+main([int(arg) for arg in sys.argv[1:]] or [100_000, 1_000_000, 10_000_000])
+if slicer.app.commandOptions().noMainWindow:
+    slicer.app.exit()
@@ -0,0 +1,70 @@
+"""
+Compares the direct VTK implementation of the SurfaceToolbox pipelines with going through
+SurfaceToolboxLogic and a parameter node.
+
+  Slicer --no-main-window --python-script SurfaceToolboxBenchmark.py
+"""
+
+import os
+import sys
+
+import slicer
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from BenchmarkUtil import formatTimes, makeSphereModel, timeCall
+from _PipelineModules import SurfaceToolboxWrapping as stw
+
+
+def operations(mesh):
+    """
+    (name, direct call, SurfaceToolboxLogic call) for each operation with a direct implementation.
+    """
+    return [
+        ("clean",
+         lambda: stw.clean(mesh),
+         lambda: stw._surfaceToolboxRun(mesh, "cleaner", {})),
+        ("taubinSmoothing",
+         lambda: stw.taubinSmoothing(mesh, 30, 0.1, True),
+         lambda: stw._surfaceToolboxRun(mesh, "smoothing", {
+             "smoothingMethod": "Taubin",
+             "smoothingTaubinIterations": "30",
+             "smoothingTaubinPassBand": "0.1",
+             "smoothingBoundarySmoothing": "true",
+         })),
+        ("fillHoles",
+         lambda: stw.fillHoles(mesh, 1000.0),
+         lambda: stw._surfaceToolboxRun(mesh, "fillHoles", {"fillHolesSize": "1000.0"})),
+        ("normals",
+         lambda: stw.normals(mesh, True, False, False, 30.0),
+         lambda: stw._surfaceToolboxRun(mesh, "normals", {
+             "normalsOrient": "true",
+             "normalsFlip": "false",
+             "normalsSplitting": "false",
+             "normalsFeatureAngle": "30.0",
+         })),
+        ("translateMesh",
+         lambda: stw.translateMesh(mesh, 1.0, 2.0, 3.0),
+         lambda: stw._surfaceToolboxRun(mesh, "translate", {"translateX": "1.0", "translateY": "2.0", "translateZ": "3.0"})),
+        ("extractLargestComponent",
+         lambda: stw.extractLargestComponent(mesh),
+         lambda: stw._surfaceToolboxRun(mesh, "connectivity", {})),
+    ]
+
+
+def main():
+    # (label, sphere resolution, repeats)
+    sizes = [("small", 16, 200), ("large", 512, 5)]
+    for label, resolution, repeats in sizes:
+        mesh = makeSphereModel(resolution)
+        print(f"--- {label} mesh: {mesh.GetPolyData().GetNumberOfPolys()} triangles, {repeats} repeats")
+        for name, direct, logic in operations(mesh):
+            directTimes = timeCall(direct, repeats)
+            logicTimes = timeCall(logic, repeats)
+            print(f"{name:25} direct: {formatTimes(directTimes)} | SurfaceToolboxLogic: {formatTimes(logicTimes)}")
+        slicer.mrmlScene.RemoveNode(mesh)
+
+
+main()
+if slicer.app.commandOptions().noMainWindow:
+    slicer.app.exit()
@@ -0,0 +1,46 @@
+"""
+Compares the NumPy thresholding pipeline with the Segment Editor Threshold effect.
+
+  Slicer --no-main-window --python-script ThresholdingBenchmark.py [size ...]
+
+By default the volumes are 128^3, 256^3 and 512^3 voxels. Pass 1024 to benchmark a CT sized volume.
+"""
+
+import os
+import sys
+
+import numpy as np
+import slicer
+from slicer.parameterNodeWrapper import FloatRange
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from BenchmarkUtil import formatTimes, timeCall
+from _PipelineModules import LabelmapWrapping, SegmentEditorWrapping
+
+
+def makeVolume(size: int):
+    volume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+    rng = np.random.default_rng(0)
+    voxels = np.empty((size, size, size), dtype=np.int16)
+    # fill slab by slab to avoid a large int64 temporary
+    for k in range(size):
+        voxels[k] = rng.integers(-1000, 1000, size=(size, size), dtype=np.int16)
+    slicer.util.updateVolumeFromArray(volume, voxels)
+    return volume
+
+
+def main(sizes):
+    thresholdRange = FloatRange(-100, 300)
+    for size in sizes:
+        volume = makeVolume(size)
+        repeats = 5 if size <= 256 else 2
+        numpyTimes = timeCall(lambda: LabelmapWrapping.thresholding(volume, thresholdRange), repeats)
+        effectTimes = timeCall(lambda: SegmentEditorWrapping.thresholding(volume, thresholdRange), repeats)
+        print(f"{size}^3 voxels, {repeats} repeats  NumPy: {formatTimes(numpyTimes)} | Threshold effect: {formatTimes(effectTimes)}")
+        slicer.mrmlScene.RemoveNode(volume)
+
+
+main([int(arg) for arg in sys.argv[1:]] or [128, 256, 512])
+if slicer.app.commandOptions().noMainWindow:
+    slicer.app.exit()
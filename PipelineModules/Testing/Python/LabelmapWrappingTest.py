@@ -0,0 +1,153 @@
+import unittest
+
+import numpy as np
+import slicer
+import vtk
+from slicer.parameterNodeWrapper import FloatRange
+
+from PipelineCreator import PipelineOwnedInputs
+from _PipelineModules import LabelmapWrapping, SegmentEditorWrapping
+
+
+def makeVolume(shape=(20, 30, 40), dtype=np.int16):
+    """
+    Volume with random voxels and a geometry that is not the identity.
+    """
+    volume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+    rng = np.random.default_rng(0)
+    slicer.util.updateVolumeFromArray(volume, rng.integers(-500, 500, size=shape).astype(dtype))
+    volume.SetOrigin(10, -20, 5)
+    volume.SetSpacing(0.5, 0.75, 2)
+    directions = vtk.vtkMatrix4x4()
+    directions.SetElement(0, 0, -1)
+    directions.SetElement(1, 1, -1)
+    volume.SetIJKToRASDirectionMatrix(directions)
+    return volume
+
+
+class LabelmapThresholdingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        slicer.mrmlScene.Clear()
+
+    def tearDown(self) -> None:
+        slicer.mrmlScene.Clear()
+
+    def assertSameSegmentation(self, segmentation, reference, volume):
+        self.assertEqual(segmentation.GetSegmentation().GetNumberOfSegments(), 1)
+        self.assertEqual(reference.GetSegmentation().GetNumberOfSegments(), 1)
+        self.assertEqual(
+            segmentation.GetSegmentation().GetConversionParameter(
+                slicer.vtkSegmentationConverter.GetReferenceImageGeometryParameterName()),
+            reference.GetSegmentation().GetConversionParameter(
+                slicer.vtkSegmentationConverter.GetReferenceImageGeometryParameterName()))
+        segmentId = segmentation.GetSegmentation().GetNthSegmentID(0)
+        referenceId = reference.GetSegmentation().GetNthSegmentID(0)
+        np.testing.assert_array_equal(
+            slicer.util.arrayFromSegmentBinaryLabelmap(segmentation, segmentId, volume),
+            slicer.util.arrayFromSegmentBinaryLabelmap(reference, referenceId, volume))
+
+    def test_sameAsThresholdEffect(self):
+        volume = makeVolume()
+        for thresholdRange in (FloatRange(-100, 100), FloatRange(-100, -100), FloatRange(0, 499.5), FloatRange(600, 700)):
+            self.assertSameSegmentation(LabelmapWrapping.thresholding(volume, thresholdRange),
+                                        SegmentEditorWrapping.thresholding(volume, thresholdRange),
+                                        volume)
+
+    def test_floatVolume(self):
+        volume = makeVolume(dtype=np.float32)
+        thresholdRange = FloatRange(-10.5, 250.25)
+        self.assertSameSegmentation(LabelmapWrapping.thresholding(volume, thresholdRange),
+                                    SegmentEditorWrapping.thresholding(volume, thresholdRange),
+                                    volume)
+
+    def test_chunking(self):
+        volume = makeVolume(shape=(17, 5, 7))
+        voxels = slicer.util.arrayFromVolume(volume)
+        expected = np.logical_and(voxels >= -100, voxels <= 100)
+        # chunk sizes smaller than a slice, not dividing the number of slices, and bigger than the volume
+        for chunkVoxels in (1, 35 * 3, 35 * 4, 35 * 100):
+            labelmap = LabelmapWrapping._thresholdToLabelmap(volume, -100, 100, chunkVoxels)
+            np.testing.assert_array_equal(LabelmapWrapping._arrayFromImage(labelmap), expected)
+            self.assertEqual(labelmap.GetExtent(), volume.GetImageData().GetExtent())
+
+
+def makeIslands(shape, offset):
+    """
+    Binary array with islands of 1, 2, 8, 27 and 64 voxels, and two islands of 1 voxel that only touch by a corner.
+    """
+    voxels = np.zeros(shape, dtype=np.uint8)
+    k, j, i = offset
+    voxels[k, j, i] = 1
+    voxels[k, j + 2, i:i + 2] = 1
+    voxels[k + 3:k + 5, j:j + 2, i:i + 2] = 1
+    voxels[k + 6:k + 9, j:j + 3, i:i + 3] = 1
+    voxels[k + 10:k + 14, j + 4:j + 8, i + 4:i + 8] = 1
+    voxels[k, j + 5, i + 5] = 1
+    voxels[k + 1, j + 6, i + 6] = 1
+    return voxels
+
+
+def makeSegmentation(volume, segmentArrays):
+    segmentation = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
+    segmentation.CreateDefaultDisplayNodes()
+    segmentation.SetReferenceImageGeometryParameterFromVolumeNode(volume)
+    for index, voxels in enumerate(segmentArrays):
+        segmentId = segmentation.GetSegmentation().AddEmptySegment(f"segment_{index}")
+        slicer.util.updateSegmentBinaryLabelmapFromArray(voxels, segmentation, segmentId, volume)
+    # make the segments share labelmaps
+    segmentation.GetSegmentation().CollapseBinaryLabelmaps(False)
+    return segmentation
+
+
+def segmentArrays(segmentation, volume):
+    return [slicer.util.arrayFromSegmentBinaryLabelmap(segmentation, segmentId, volume)
+            for segmentId in segmentation.GetSegmentation().GetSegmentIDs()]
+
+
+class LabelmapIslandsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        slicer.mrmlScene.Clear()
+        self.volume = makeVolume()
+
+    def tearDown(self) -> None:
+        slicer.mrmlScene.Clear()
+
+    def test_sameAsIslandsEffect(self):
+        islands = makeIslands((20, 30, 40), (1, 2, 3))
+        for minimumSize in (0, 1, 2, 8, 9, 64, 65):
+            for fast, effect in ((LabelmapWrapping.islandsKeepLargest, SegmentEditorWrapping.islandsKeepLargest),
+                                 (LabelmapWrapping.islandsRemoveSmall, SegmentEditorWrapping.islandsRemoveSmall)):
+                segmentation = makeSegmentation(self.volume, [islands])
+                fastArrays = segmentArrays(fast(segmentation, minimumSize), self.volume)
+                effectArrays = segmentArrays(effect(segmentation, minimumSize), self.volume)
+                np.testing.assert_array_equal(fastArrays[0], effectArrays[0])
+
+    def test_allSegments(self):
+        segments = [
+            makeIslands((20, 30, 40), (1, 2, 3)),
+            makeIslands((20, 30, 40), (4, 16, 22)),
+            np.zeros((20, 30, 40), dtype=np.uint8),
+        ]
+        segmentation = makeSegmentation(self.volume, segments)
+        self.assertLess(segmentation.GetSegmentation().GetNumberOfLayers(), len(segments))
+
+        results = segmentArrays(LabelmapWrapping.islandsRemoveSmall(segmentation, 8), self.volume)
+        for segment, result in zip(segments, results):
+            expected = segmentArrays(LabelmapWrapping.islandsRemoveSmall(makeSegmentation(self.volume, [segment]), 8), self.volume)
+            np.testing.assert_array_equal(result, expected[0])
+
+    def test_ownedInputs(self):
+        islands = makeIslands((20, 30, 40), (1, 2, 3))
+        segmentation = makeSegmentation(self.volume, [islands])
+
+        output = LabelmapWrapping.islandsKeepLargest(segmentation, 0)
+        self.assertIsNot(output, segmentation)
+        np.testing.assert_array_equal(segmentArrays(segmentation, self.volume)[0], islands)
+
+        output = LabelmapWrapping.islandsKeepLargest(segmentation, 0, ownedInputs=PipelineOwnedInputs(["segmentation"]))
+        self.assertIs(output, segmentation)
+        self.assertEqual(segmentArrays(segmentation, self.volume)[0].sum(), 64)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import slicer
+
+from _PipelineModules.SegmentEditorWrapping import SegmentEditorHelperPool
+
+
+class SegmentEditorHelperPoolTest(unittest.TestCase):
+    def setUp(self) -> None:
+        slicer.mrmlScene.Clear()
+        self.pool = SegmentEditorHelperPool()
+
+    def tearDown(self) -> None:
+        self.pool.clear()
+        slicer.mrmlScene.Clear()
+
+    def test_reuse(self):
+        with self.pool.helper("Smoothing") as helper:
+            pass
+        with self.pool.helper("Smoothing") as reused:
+            self.assertIs(reused, helper)
+
+    def test_resetFailure(self):
+        def failingReset():
+            raise RuntimeError("reset failed")
+
+        # the error of the step is kept, and the helper that could not be reset is not reused
+        with self.assertRaises(ValueError):
+            with self.pool.helper("Smoothing") as helper:
+                helper.reset = failingReset
+                raise ValueError("step failed")
+        self.assertFalse(helper.isValid())
+        with self.pool.helper("Smoothing") as other:
+            self.assertIsNot(other, helper)
+
+        # without an error in the step, the reset failure is not raised either
+        with self.pool.helper("Smoothing") as helper:
+            helper.reset = failingReset
+        self.assertFalse(helper.isValid())
+
+
+if __name__ == '__main__':
+    unittest.main()
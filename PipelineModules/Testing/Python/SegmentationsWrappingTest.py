@@ -0,0 +1,218 @@
+import sys
+import unittest
+
+import networkx as nx
+import numpy as np
+import slicer
+import vtk
+from slicer.parameterNodeWrapper import FloatRange
+
+from _PipelineCreator import PipelineCreation
+from PipelineCreator import PipelineCreatorLogic, isGeometryOnlyVolume, materializeVolume
+from _PipelineModules import SegmentationsWrapping
+
+
+def makeSphereModel():
+    sphereSource = vtk.vtkSphereSource()
+    sphereSource.SetRadius(5)
+    sphereSource.SetCenter(1, 2, 3)
+    sphereSource.Update()
+    model = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+    model.SetAndObservePolyData(sphereSource.GetOutput())
+    return model
+
+
+class ExportModelToSegmentationSpacingTest(unittest.TestCase):
+    def setUp(self) -> None:
+        slicer.mrmlScene.Clear()
+
+    def tearDown(self) -> None:
+        slicer.mrmlScene.Clear()
+
+    def test_geometryOnlyReferenceVolume(self):
+        model = makeSphereModel()
+        output = SegmentationsWrapping.exportModelToSegmentationSpacing(model, 0.5, 0.25, 1, 1, 2, 0.5)
+        referenceVolume = output.referenceVolume
+
+        # the reference volume has a geometry, but no voxels or display nodes
+        self.assertTrue(isGeometryOnlyVolume(referenceVolume))
+        self.assertIsNone(referenceVolume.GetImageData().GetPointData().GetScalars())
+        self.assertEqual(referenceVolume.GetNumberOfDisplayNodes(), 0)
+        bounds = [0.0] * 6
+        model.GetBounds(bounds)
+        expectedDimensions = (int((bounds[1] - bounds[0] + 2) / 0.5),
+                              int((bounds[3] - bounds[2] + 4) / 0.25),
+                              int((bounds[5] - bounds[4] + 1) / 1))
+        self.assertEqual(referenceVolume.GetImageData().GetDimensions(), expectedDimensions)
+        np.testing.assert_allclose(referenceVolume.GetOrigin(), (bounds[0] - 1, bounds[2] - 2, bounds[4] - 0.5))
+        self.assertEqual(referenceVolume.GetSpacing(), (0.5, 0.25, 1))
+
+        # the segmentation uses the same geometry as with an allocated reference volume
+        allocated = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+        allocated.CopyOrientation(referenceVolume)
+        imageData = vtk.vtkImageData()
+        imageData.SetDimensions(referenceVolume.GetImageData().GetDimensions())
+        imageData.AllocateScalars(vtk.VTK_UNSIGNED_CHAR, 1)
+        allocated.SetAndObserveImageData(imageData)
+        self.assertEqual(
+            output.segmentation.GetSegmentation().GetConversionParameter(
+                slicer.vtkSegmentationConverter.GetReferenceImageGeometryParameterName()),
+            slicer.vtkSegmentationConverter.SerializeImageGeometry(allocated))
+        self.assertEqual(output.segmentation.GetSegmentation().GetNumberOfSegments(), 1)
+
+        # once materialized it is a regular empty volume
+        self.assertIs(materializeVolume(referenceVolume), referenceVolume)
+        self.assertFalse(isGeometryOnlyVolume(referenceVolume))
+        self.assertEqual(slicer.util.arrayFromVolume(referenceVolume).shape, expectedDimensions[::-1])
+        self.assertEqual(slicer.util.arrayFromVolume(referenceVolume).max(), 0)
+        self.assertGreater(referenceVolume.GetNumberOfDisplayNodes(), 0)
+
+        # materializing anything else does nothing
+        self.assertIs(materializeVolume(model), model)
+
+
+class GeometryOnlyReferenceVolumePipelineTest(unittest.TestCase):
+    """
+    Generated pipelines giving the geometry only reference volume of Export Model to Segmentation - Spacing
+    to another step.
+    """
+    spacingPipelineName = "Export Model to Segmentation - Spacing"
+
+    def setUp(self) -> None:
+        slicer.mrmlScene.Clear()
+        self.logic = PipelineCreatorLogic()
+
+    def tearDown(self) -> None:
+        slicer.mrmlScene.Clear()
+
+    def makePipeline(self, stepName: str, connections: dict, fixedValues: dict) -> nx.DiGraph:
+        """
+        mesh -> Export Model to Segmentation - Spacing -> stepName -> segmentation
+
+        connections - key: parameter of stepName, value: "mesh" or "referenceVolume"
+        """
+        spacingStep = (1, self.spacingPipelineName)
+        step = (2, stepName)
+        sources = {"mesh": (0, None, "mesh"), "referenceVolume": (*spacingStep, "return.referenceVolume")}
+
+        pipeline = nx.DiGraph()
+        pipeline.add_node((0, None, "mesh"), datatype=slicer.vtkMRMLModelNode, position=0)
+        pipeline.add_node((*spacingStep, "model"))
+        for name in ["spacingX", "spacingY", "spacingZ", "marginX", "marginY", "marginZ"]:
+            pipeline.add_node((*spacingStep, name), fixed_value=1.0)
+        for name in ["return", "return.segmentation", "return.referenceVolume"]:
+            pipeline.add_node((*spacingStep, name))
+        for name in self.logic.registeredPipelines[stepName].parameters:
+            pipeline.add_node((*step, name))
+            if name in fixedValues:
+                pipeline.nodes[(*step, name)]["fixed_value"] = fixedValues[name]
+        pipeline.add_node((*step, "return"))
+        pipeline.add_node((3, None, "segmentation"), datatype=slicer.vtkMRMLSegmentationNode)
+
+        pipeline.add_edge((0, None, "mesh"), (*spacingStep, "model"))
+        for name, source in connections.items():
+            pipeline.add_edge(sources[source], (*step, name))
+        pipeline.add_edge((*step, "return"), (3, None, "segmentation"))
+        return pipeline
+
+    def runPipeline(self, name: str, pipeline: nx.DiGraph, model):
+        codeObject = self.logic.compilePipeline(name, [], pipeline)
+        self.addCleanup(sys.modules.pop, name, None)
+        module = self.logic.loadCompiledPipeline(name, codeObject)
+        self.addCleanup(self.logic.registrar.removePipeline, name)
+        return getattr(module, f"{name}Logic")().run(model)
+
+    def test_thresholdReferenceVolume(self):
+        model = makeSphereModel()
+        bounds = [0.0] * 6
+        model.GetBounds(bounds)
+        # spacing and margins of 1, see makePipeline
+        voxelCount = np.prod([int(bounds[axis * 2 + 1] - bounds[axis * 2] + 2) for axis in range(3)])
+
+        for stepName in ["Labelmap.Thresholding", "SegmentEditor.Thresholding"]:
+            with self.subTest(stepName):
+                pipeline = self.makePipeline(stepName, {"volume": "referenceVolume"},
+                                             {"thresholdRange": FloatRange(-1, 1)})
+                name = "GeometryOnlyThreshold" + stepName.split(".")[0]
+                segmentation = self.runPipeline(name, pipeline, model)
+
+                # the empty volume is materialized for the step, so all its voxels are in the threshold range
+                self.assertEqual(segmentation.GetSegmentation().GetNumberOfSegments(), 1)
+                segmentId = segmentation.GetSegmentation().GetNthSegmentID(0)
+                self.assertEqual(slicer.util.arrayFromSegmentBinaryLabelmap(segmentation, segmentId).sum(), voxelCount)
+
+    def test_referenceVolumeStaysGeometryOnly(self):
+        stepName = "Export Model to Segmentation - Reference Volume"
+        pipeline = self.makePipeline(stepName, {"model": "mesh", "referenceVolume": "referenceVolume"}, {})
+
+        # the step declares it only needs the geometry of the reference volume
+        code = PipelineCreation.createPipelineCode("GeometryOnlyReference", [], pipeline, self.logic.registeredPipelines)
+        self.assertNotIn("materializeVolume(", code)
+
+        segmentation = self.runPipeline("GeometryOnlyReference", pipeline, makeSphereModel())
+        self.assertEqual(segmentation.GetSegmentation().GetNumberOfSegments(), 1)
+
+
+class ExportSegmentsToModelsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        slicer.mrmlScene.Clear()
+        volume = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
+        slicer.util.updateVolumeFromArray(volume, np.zeros((20, 20, 30), dtype=np.uint8))
+        self.segmentation = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
+        self.segmentation.SetReferenceImageGeometryParameterFromVolumeNode(volume)
+        for index, name in enumerate(["liver", "left kidney", "right kidney"]):
+            voxels = np.zeros((20, 20, 30), dtype=np.uint8)
+            voxels[5:15, 5:15, 2 + index * 9:8 + index * 9] = 1
+            segmentId = self.segmentation.GetSegmentation().AddEmptySegment(name)
+            slicer.util.updateSegmentBinaryLabelmapFromArray(voxels, self.segmentation, segmentId, volume)
+        self.closedSurfaceName = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+
+    def tearDown(self) -> None:
+        slicer.mrmlScene.Clear()
+
+    def referenceModels(self):
+        """
+        The models made by exporting all the segments with the Segmentations module.
+        """
+        shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+        folder = shNode.CreateFolderItem(shNode.GetSceneItemID(), "reference")
+        slicer.modules.segmentations.logic().ExportAllSegmentsToModels(self.segmentation, folder)
+        children = vtk.vtkIdList()
+        shNode.GetItemChildren(folder, children)
+        return [shNode.GetItemDataNode(children.GetId(i)) for i in range(children.GetNumberOfIds())]
+
+    def assertSameModel(self, model, reference):
+        self.assertEqual(model.GetName(), reference.GetName())
+        self.assertEqual(model.GetPolyData().GetNumberOfPoints(), reference.GetPolyData().GetNumberOfPoints())
+        self.assertEqual(model.GetPolyData().GetNumberOfCells(), reference.GetPolyData().GetNumberOfCells())
+        np.testing.assert_allclose(slicer.util.arrayFromModelPoints(model), slicer.util.arrayFromModelPoints(reference))
+        self.assertEqual(model.GetDisplayNode().GetColor(), reference.GetDisplayNode().GetColor())
+
+    def test_selectiveExport(self):
+        first = SegmentationsWrapping.exportFirstSegmentToModel(self.segmentation)
+        byIndex = SegmentationsWrapping.exportSegmentToModelByIndex(self.segmentation, 2)
+        byName = SegmentationsWrapping.exportSegmentToModelByName(self.segmentation, "left kidney")
+        byPattern = SegmentationsWrapping.exportSegmentsToModelsByNamePattern(self.segmentation, "*kidney")
+
+        # the input segmentation did not get closed surfaces for all its segments
+        for segmentId in self.segmentation.GetSegmentation().GetSegmentIDs():
+            self.assertFalse(self.segmentation.GetSegmentation().GetSegment(segmentId).GetRepresentation(self.closedSurfaceName))
+
+        references = self.referenceModels()
+        self.assertSameModel(first, references[0])
+        self.assertSameModel(byIndex, references[2])
+        self.assertSameModel(byName, references[1])
+        self.assertEqual(len(byPattern), 2)
+        self.assertSameModel(byPattern[0], references[1])
+        self.assertSameModel(byPattern[1], references[2])
+
+    def test_noMatch(self):
+        with self.assertRaises(ValueError):
+            SegmentationsWrapping.exportSegmentToModelByIndex(self.segmentation, 3)
+        with self.assertRaises(ValueError):
+            SegmentationsWrapping.exportSegmentToModelByName(self.segmentation, "spleen")
+        self.assertEqual(SegmentationsWrapping.exportSegmentsToModelsByNamePattern(self.segmentation, "spleen*"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import unittest
+
+import numpy as np
+import slicer
+import vtk
+
+from _PipelineModules import SurfaceToolboxWrapping
+from _PipelineModules.SurfaceToolboxWrapping import _surfaceToolboxRun
+
+
+def makeSphereModel(resolution=32):
+    sphereSource = vtk.vtkSphereSource()
+    sphereSource.SetThetaResolution(resolution)
+    sphereSource.SetPhiResolution(resolution)
+    sphereSource.Update()
+    # cut the sphere open so there are holes and boundary edges to work with
+    clip = vtk.vtkClipPolyData()
+    clip.SetInputConnection(sphereSource.GetOutputPort())
+    plane = vtk.vtkPlane()
+    plane.SetOrigin(0, 0, 0.3)
+    plane.SetNormal(0, 0, -1)
+    clip.SetClipFunction(plane)
+    clip.Update()
+    model = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+    model.SetAndObservePolyData(clip.GetOutput())
+    return model
+
+
+class SurfaceToolboxDirectTest(unittest.TestCase):
+    """
+    The direct VTK implementations must give the same results as going through SurfaceToolboxLogic.
+    """
+    def setUp(self) -> None:
+        slicer.mrmlScene.Clear()
+        self.mesh = makeSphereModel()
+
+    def tearDown(self) -> None:
+        slicer.mrmlScene.Clear()
+
+    def assertSameMesh(self, direct, reference):
+        directPolyData = direct.GetPolyData()
+        referencePolyData = reference.GetPolyData()
+        self.assertEqual(directPolyData.GetNumberOfPoints(), referencePolyData.GetNumberOfPoints())
+        self.assertEqual(directPolyData.GetNumberOfCells(), referencePolyData.GetNumberOfCells())
+        self.assertEqual(directPolyData.GetNumberOfPolys(), referencePolyData.GetNumberOfPolys())
+        self.assertEqual(directPolyData.GetNumberOfLines(), referencePolyData.GetNumberOfLines())
+        if directPolyData.GetNumberOfPoints() > 0:
+            np.testing.assert_array_equal(slicer.util.arrayFromModelPoints(direct),
+                                          slicer.util.arrayFromModelPoints(reference))
+        if directPolyData.GetNumberOfPolys() > 0:
+            np.testing.assert_array_equal(slicer.util.arrayFromModelPolyIds(direct),
+                                          slicer.util.arrayFromModelPolyIds(reference))
+
+    def test_clean(self):
+        self.assertSameMesh(SurfaceToolboxWrapping.clean(self.mesh),
+                            _surfaceToolboxRun(self.mesh, "cleaner", {}))
+
+    def test_taubinSmoothing(self):
+        for boundarySmoothing in (True, False):
+            self.assertSameMesh(
+                SurfaceToolboxWrapping.taubinSmoothing(self.mesh, 20, 0.05, boundarySmoothing),
+                _surfaceToolboxRun(self.mesh, "smoothing", {
+                    "smoothingMethod": "Taubin",
+                    "smoothingTaubinIterations": "20",
+                    "smoothingTaubinPassBand": "0.05",
+                    "smoothingBoundarySmoothing": SurfaceToolboxWrapping.formatBool(boundarySmoothing),
+                }))
+
+    def test_laplaceSmoothing(self):
+        for boundarySmoothing in (True, False):
+            self.assertSameMesh(
+                SurfaceToolboxWrapping.laplaceSmoothing(self.mesh, 50, 0.3, boundarySmoothing),
+                _surfaceToolboxRun(self.mesh, "smoothing", {
+                    "smoothingMethod": "Laplace",
+                    "smoothingLaplaceIterations": "50",
+                    "smoothingLaplaceRelaxation": "0.3",
+                    "smoothingBoundarySmoothing": SurfaceToolboxWrapping.formatBool(boundarySmoothing),
+                }))
+
+    def test_fillHoles(self):
+        self.assertSameMesh(SurfaceToolboxWrapping.fillHoles(self.mesh, 1000.0),
+                            _surfaceToolboxRun(self.mesh, "fillHoles", {"fillHolesSize": "1000.0"}))
+
+    def test_normals(self):
+        for splitting in (True, False):
+            self.assertSameMesh(
+                SurfaceToolboxWrapping.normals(self.mesh, True, True, splitting, 45.0),
+                _surfaceToolboxRun(self.mesh, "normals", {
+                    "normalsOrient": "true",
+                    "normalsFlip": "true",
+                    "normalsSplitting": SurfaceToolboxWrapping.formatBool(splitting),
+                    "normalsFeatureAngle": "45.0",
+                }))
+
+    def test_mirror(self):
+        for mirror in ((True, False, False), (True, True, False), (False, False, False)):
+            self.assertSameMesh(
+                SurfaceToolboxWrapping.mirrorMesh(self.mesh, *mirror),
+                _surfaceToolboxRun(self.mesh, "mirror", {
+                    "mirrorX": SurfaceToolboxWrapping.formatBool(mirror[0]),
+                    "mirrorY": SurfaceToolboxWrapping.formatBool(mirror[1]),
+                    "mirrorZ": SurfaceToolboxWrapping.formatBool(mirror[2]),
+                }))
+
+    def test_scale(self):
+        self.assertSameMesh(SurfaceToolboxWrapping.scaleMesh(self.mesh, 0.5, 2.0, 3.0),
+                            _surfaceToolboxRun(self.mesh, "scale", {"scaleX": "0.5", "scaleY": "2.0", "scaleZ": "3.0"}))
+
+    def test_translate(self):
+        self.assertSameMesh(SurfaceToolboxWrapping.translateMesh(self.mesh, 1.5, -2.0, 10.0),
+                            _surfaceToolboxRun(self.mesh, "translate", {"translateX": "1.5", "translateY": "-2.0", "translateZ": "10.0"}))
+
+    def test_extractEdges(self):
+        self.assertSameMesh(
+            SurfaceToolboxWrapping.extractEdges(self.mesh, True, True, 20.0, False, True),
+            _surfaceToolboxRun(self.mesh, "extractEdges", {
+                "extractEdgesBoundary": "true",
+                "extractEdgesFeature": "true",
+                "extractEdgesFeatureAngle": "20.0",
+                "extractEdgesManifold": "false",
+                "extractEdgesNonManifold": "true",
+            }))
+
+    def test_extractLargestComponent(self):
+        self.assertSameMesh(SurfaceToolboxWrapping.extractLargestComponent(self.mesh),
+                            _surfaceToolboxRun(self.mesh, "connectivity", {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
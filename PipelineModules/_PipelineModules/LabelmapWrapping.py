@@ -0,0 +1,174 @@
+from typing import Annotated
+
+import numpy as np
+import vtk
+import vtk.util.numpy_support
+
+import slicer
+from slicer.parameterNodeWrapper import (
+    Decimals,
+    Default,
+    FloatRange,
+    Minimum,
+    RangeBounds,
+    SingleStep,
+)
+
+try:
+    import scipy.ndimage
+except ImportError:
+    slicer.util.pip_install("scipy")
+    import scipy.ndimage
+
+from PipelineCreator import PipelineOwnedInputs, slicerPipeline
+from _PipelineModules.SegmentEditorWrapping import cloneSegmentation
+
+# Number of voxels processed at once. Bounds the size of the temporary arrays independently of the
+# size of the volume (16M voxels is 32MB of temporaries, a 1024^3 CT is processed in 64 chunks)
+_chunkVoxels = 1 << 24
+
+_binaryLabelmapName = slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName()
+
+
+def _makeLabelmapLike(volume: slicer.vtkMRMLScalarVolumeNode) -> slicer.vtkOrientedImageData:
+    """
+    Makes an unsigned char vtkOrientedImageData with the same geometry as the volume.
+    """
+    ijkToRAS = vtk.vtkMatrix4x4()
+    volume.GetIJKToRASMatrix(ijkToRAS)
+    labelmap = slicer.vtkOrientedImageData()
+    labelmap.SetExtent(volume.GetImageData().GetExtent())
+    labelmap.SetImageToWorldMatrix(ijkToRAS)
+    labelmap.AllocateScalars(vtk.VTK_UNSIGNED_CHAR, 1)
+    return labelmap
+
+
+def _arrayFromImage(image: vtk.vtkImageData) -> np.ndarray:
+    """
+    Zero-copy, KJI ordered NumPy view of the scalars of a single component image.
+    """
+    return vtk.util.numpy_support.vtk_to_numpy(image.GetPointData().GetScalars()).reshape(image.GetDimensions()[::-1])
+
+
+def _thresholdToLabelmap(volume: slicer.vtkMRMLScalarVolumeNode,
+                         minimum: float,
+                         maximum: float,
+                         chunkVoxels: int = _chunkVoxels) -> slicer.vtkOrientedImageData:
+    """
+    Labelmap that is 1 where minimum <= voxel <= maximum and 0 elsewhere, like the Threshold effect.
+    """
+    source = _arrayFromImage(volume.GetImageData())
+    labelmap = _makeLabelmapLike(volume)
+    output = _arrayFromImage(labelmap)
+
+    if source.size == 0:
+        return labelmap
+
+    slicesPerChunk = max(1, chunkVoxels // (source.shape[1] * source.shape[2]))
+    aboveMinimum = np.empty((slicesPerChunk,) + source.shape[1:], dtype=bool)
+    belowMaximum = np.empty_like(aboveMinimum)
+    for start in range(0, source.shape[0], slicesPerChunk):
+        stop = min(start + slicesPerChunk, source.shape[0])
+        count = stop - start
+        np.greater_equal(source[start:stop], minimum, out=aboveMinimum[:count])
+        np.less_equal(source[start:stop], maximum, out=belowMaximum[:count])
+        np.logical_and(aboveMinimum[:count], belowMaximum[:count], out=output[start:stop])
+    labelmap.GetPointData().GetScalars().Modified()
+    return labelmap
+
+
+@slicerPipeline(name="Labelmap.Thresholding", categories=["Scalar Volume Operations"])
+def thresholding(volume: slicer.vtkMRMLScalarVolumeNode,
+                 thresholdRange: Annotated[FloatRange, RangeBounds(-3000, 3000), Default(FloatRange(-100, 100)), SingleStep(1), Decimals(2)]
+                ) -> slicer.vtkMRMLSegmentationNode:
+    labelmap = _thresholdToLabelmap(volume, thresholdRange.minimum, thresholdRange.maximum)
+
+    segmentationNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSegmentationNode')
+    segmentationNode.CreateBinaryLabelmapRepresentation()
+    segmentationNode.CreateDefaultDisplayNodes()
+    segmentationNode.SetReferenceImageGeometryParameterFromVolumeNode(volume)
+    segmentId = segmentationNode.GetSegmentation().AddEmptySegment()
+    slicer.vtkSlicerSegmentationsModuleLogic.SetBinaryLabelmapToSegment(
+        labelmap, segmentationNode, segmentId,
+        slicer.vtkSlicerSegmentationsModuleLogic.MODE_REPLACE, labelmap.GetExtent())
+    return segmentationNode
+
+
+def _segmentsByLayer(segmentation: slicer.vtkSegmentation) -> dict[int, list[slicer.vtkSegment]]:
+    return {
+        layer: [segmentation.GetSegment(segmentId) for segmentId in segmentation.GetSegmentIDsForLayer(layer)]
+        for layer in range(segmentation.GetNumberOfLayers())
+    }
+
+
+def _removeIslands(segmentationNode: slicer.vtkMRMLSegmentationNode, minimumSize: int, keepLargestOnly: bool) -> None:
+    """
+    Removes in place the islands of all the segments, like the Islands effect does for the selected segment.
+
+    Islands are 6-connected (not fully connected, like the Islands effect). Islands smaller than minimumSize
+    voxels are removed. If keepLargestOnly, only the largest of the remaining islands is kept.
+
+    The segments sharing a labelmap layer are handled together: a single pass over the layer finds the
+    bounding box of every segment, then the components of each segment are labeled within its bounding box.
+    """
+    segmentationNode.CreateBinaryLabelmapRepresentation()
+    segmentationNode.SetMasterRepresentationToBinaryLabelmap()
+    segmentation = segmentationNode.GetSegmentation()
+    structure = scipy.ndimage.generate_binary_structure(3, 1)
+
+    for layer, segments in _segmentsByLayer(segmentation).items():
+        labelmap = segmentation.GetLayerDataObject(layer)
+        if labelmap is None or labelmap.GetPointData().GetScalars() is None:
+            continue
+        voxels = _arrayFromImage(labelmap)
+        if voxels.size == 0:
+            continue
+        boundingBoxes = scipy.ndimage.find_objects(voxels)
+
+        modified = False
+        for segment in segments:
+            labelValue = segment.GetLabelValue()
+            if labelValue < 1 or labelValue > len(boundingBoxes) or boundingBoxes[labelValue - 1] is None:
+                continue  # empty segment
+            segmentVoxels = voxels[boundingBoxes[labelValue - 1]]
+            mask = segmentVoxels == labelValue
+            islands, _ = scipy.ndimage.label(mask, structure=structure)
+            islandSizes = np.bincount(islands.ravel())
+            islandSizes[0] = 0  # background
+
+            keep = islandSizes >= max(minimumSize, 1)
+            if keepLargestOnly:
+                largest = np.argmax(islandSizes)
+                keep[:] = False
+                keep[largest] = islandSizes[largest] >= max(minimumSize, 1)
+            if keep[1:].all():
+                continue
+
+            segmentVoxels[mask & ~keep[islands]] = 0
+            modified = True
+
+        if modified:
+            # notifies the segmentation that the source representation changed
+            labelmap.Modified()
+
+
+@slicerPipeline(name="Labelmap.Islands.KeepLargest", categories=["Segmentation Operations"],
+                requiredRepresentations={"segmentation": [_binaryLabelmapName]})
+def islandsKeepLargest(segmentation: slicer.vtkMRMLSegmentationNode,
+                       minimumSizeVoxels: Annotated[int, Minimum(0), Default(1000)],
+                       ownedInputs: PipelineOwnedInputs = PipelineOwnedInputs()) -> slicer.vtkMRMLSegmentationNode:
+    if "segmentation" not in ownedInputs:
+        segmentation = cloneSegmentation(segmentation)
+    _removeIslands(segmentation, minimumSizeVoxels, keepLargestOnly=True)
+    return segmentation
+
+
+@slicerPipeline(name="Labelmap.Islands.RemoveSmall", categories=["Segmentation Operations"],
+                requiredRepresentations={"segmentation": [_binaryLabelmapName]})
+def islandsRemoveSmall(segmentation: slicer.vtkMRMLSegmentationNode,
+                       minimumSizeVoxels: Annotated[int, Minimum(0), Default(1000)],
+                       ownedInputs: PipelineOwnedInputs = PipelineOwnedInputs()) -> slicer.vtkMRMLSegmentationNode:
+    if "segmentation" not in ownedInputs:
+        segmentation = cloneSegmentation(segmentation)
+    _removeIslands(segmentation, minimumSizeVoxels, keepLargestOnly=False)
+    return segmentation
@@ -1,4 +1,6 @@
+import contextlib
 import enum
+import logging
 from typing import Annotated
 
 import slicer
@@ -12,29 +14,78 @@ from slicer.parameterNodeWrapper import (
     WithinRange,
 )
 import SegmentEditorEffects
-from PipelineCreator import slicerPipeline
+from PipelineCreator import PipelineOwnedInputs, slicerPipeline
+
+# the effects work on the binary labelmap, other representations are only updated for display
+_binaryLabelmapName = slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName()
+
+
+def cloneSegmentation(segmentation: slicer.vtkMRMLSegmentationNode) -> slicer.vtkMRMLSegmentationNode:
+    """
+    Clones the segmentation node, including its display node and segments.
+    """
+    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
+    itemID = shNode.GetItemByDataNode(segmentation)
+    newItemID = slicer.modules.subjecthierarchy.logic().CloneSubjectHierarchyItem(shNode, itemID)
+    return shNode.GetItemDataNode(newItemID)
 
 
 class SegmentEditorHelper:
+    """
+    Applies one Segment Editor effect to segmentations.
+
+    Creating the editor widget is expensive, so prefer getting helpers from segmentEditorHelperPool
+    over creating them directly. Helpers must be closed explicitly when no longer needed.
+    """
     def __init__(self, effectName):
         self.segmentEditorWidget = slicer.qMRMLSegmentEditorWidget()
         self.segmentEditorNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSegmentEditorNode')
+        # the node only exists to drive the effect, it is not user data
+        self.segmentEditorNode.SetHideFromEditors(True)
+        self.segmentEditorNode.SetSaveWithScene(False)
         self.segmentEditorWidget.setMRMLSegmentEditorNode(self.segmentEditorNode)
         self.segmentEditorWidget.setMRMLScene(slicer.mrmlScene)
         self.effectName = effectName
         self.effectParameters = {}
 
-    def __del__(self):
+    def isValid(self) -> bool:
+        """
+        False if the helper was closed or its editor node was removed from the scene (e.g. on scene close).
+        """
+        return self.segmentEditorWidget is not None and bool(slicer.mrmlScene.IsNodePresent(self.segmentEditorNode))
+
+    def reset(self):
+        """
+        Forgets everything about the previous use so the helper can be reused.
+        """
+        self.effectParameters = {}
+        self.segmentEditorWidget.setActiveEffect(None)
+        self.segmentEditorWidget.setSegmentationNode(None)
+        self.segmentEditorWidget.setMasterVolumeNode(None)
+        # effect parameters are stored on the editor node as "<effectName>.<parameterName>" attributes
+        for attributeName in self.segmentEditorNode.GetAttributeNames():
+            if attributeName.startswith(f"{self.effectName}."):
+                self.segmentEditorNode.RemoveAttribute(attributeName)
+        self.segmentEditorWidget.effectByName(self.effectName).setMRMLDefaults()
+
+    def close(self):
+        if self.segmentEditorWidget is None:
+            return
         self.segmentEditorWidget.setMRMLScene(None)
-        slicer.mrmlScene.RemoveNode(self.segmentEditorNode)
+        if slicer.mrmlScene.IsNodePresent(self.segmentEditorNode):
+            slicer.mrmlScene.RemoveNode(self.segmentEditorNode)
         self.segmentEditorWidget.deleteLater()
+        self.segmentEditorWidget = None
+        self.segmentEditorNode = None
 
-    def run(self, inputSeg):
+    def run(self, inputSeg, inPlace=False):
+        """
+        Applies the effect to a copy of inputSeg, or to inputSeg itself if inPlace.
+        """
+        if inPlace:
+            return self.runInPlace(inputSeg)
         # need to clone the segmentation and then make the in-place adjustments
-        shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-        itemID = shNode.GetItemByDataNode(inputSeg)
-        newItemID = slicer.modules.subjecthierarchy.logic().CloneSubjectHierarchyItem(shNode, itemID)
-        return self.runInPlace(shNode.GetItemDataNode(newItemID))
+        return self.runInPlace(cloneSegmentation(inputSeg))
 
     def runInPlace(self, inputSeg):
         self.segmentEditorWidget.setSegmentationNode(inputSeg)
@@ -46,6 +97,70 @@ class SegmentEditorHelper:
         return inputSeg
 
 
+class SegmentEditorHelperPool:
+    """
+    Process wide pool of idle SegmentEditorHelpers keyed by effect name.
+
+    Helpers are reset when they are given back to the pool. Helpers whose editor node disappeared
+    (e.g. because the scene was closed) are closed instead of being reused.
+    """
+    def __init__(self):
+        self._idleHelpers: dict[str, list[SegmentEditorHelper]] = {}
+
+    def acquire(self, effectName) -> SegmentEditorHelper:
+        idleHelpers = self._idleHelpers.get(effectName, [])
+        while idleHelpers:
+            helper = idleHelpers.pop()
+            if helper.isValid():
+                return helper
+            helper.close()
+        return SegmentEditorHelper(effectName)
+
+    def release(self, helper: SegmentEditorHelper) -> None:
+        if not helper.isValid():
+            helper.close()
+            return
+        try:
+            helper.reset()
+        except Exception as e:
+            # a helper in an unknown state must not be reused. release runs when a step ends, possibly
+            # because of an exception, which must not be replaced by this one
+            logging.warning(f"Could not reset the Segment Editor helper of '{helper.effectName}', dropping it: {e}")
+            try:
+                helper.close()
+            except Exception as closeError:
+                logging.warning(f"Could not close the Segment Editor helper of '{helper.effectName}': {closeError}")
+            return
+        self._idleHelpers.setdefault(helper.effectName, []).append(helper)
+
+    @contextlib.contextmanager
+    def helper(self, effectName, effectParameters=None):
+        """
+        Context manager giving a helper for the effect with the given parameters,
+        and giving it back to the pool on exit.
+        """
+        helper = self.acquire(effectName)
+        helper.effectParameters = dict(effectParameters or {})
+        try:
+            yield helper
+        finally:
+            self.release(helper)
+
+    def clear(self) -> None:
+        """
+        Closes all the idle helpers.
+        """
+        for helpers in self._idleHelpers.values():
+            for helper in helpers:
+                helper.close()
+        self._idleHelpers = {}
+
+
+segmentEditorHelperPool = SegmentEditorHelperPool()
+slicer.mrmlScene.AddObserver(slicer.vtkMRMLScene.EndCloseEvent, lambda caller, event: segmentEditorHelperPool.clear())
+slicer.app.aboutToQuit.connect(segmentEditorHelperPool.clear)
+
+
 class SmoothingMethod(enum.Enum):
     Median = "MEDIAN"
     Gaussian = "GAUSSIAN"
@@ -54,16 +169,17 @@ class SmoothingMethod(enum.Enum):
     JointSmoothing = "JOINT_TAUBIN"
 
 
-@slicerPipeline(name="SegmentEditor.Smoothing", categories=["SegmentEditor", "Segmentation Operations"])
+@slicerPipeline(name="SegmentEditor.Smoothing", categories=["SegmentEditor", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": [_binaryLabelmapName]})
 def smoothing(segmentation: slicer.vtkMRMLSegmentationNode,
               method: SmoothingMethod,
-              kernelSize: Annotated[int, Minimum(0), Default(3)]) -> slicer.vtkMRMLSegmentationNode:
-    helper = SegmentEditorHelper("Smoothing")
-    helper.effectParameters = {
+              kernelSize: Annotated[int, Minimum(0), Default(3)],
+              ownedInputs: PipelineOwnedInputs = PipelineOwnedInputs()) -> slicer.vtkMRMLSegmentationNode:
+    with segmentEditorHelperPool.helper("Smoothing", {
         "SmoothingMethod": method.value,
         "KernelSizeMm": kernelSize,
-    }
-    return helper.run(segmentation)
+    }) as helper:
+        return helper.run(segmentation, inPlace="segmentation" in ownedInputs)
 
 
 class MarginMethod(enum.Enum):
@@ -71,15 +187,16 @@ class MarginMethod(enum.Enum):
     Shrink = "Shrink"
 
 
-@slicerPipeline(name="SegmentEditor.Margin", categories=["SegmentEditor", "Segmentation Operations"])
+@slicerPipeline(name="SegmentEditor.Margin", categories=["SegmentEditor", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": [_binaryLabelmapName]})
 def margin(segmentation: slicer.vtkMRMLSegmentationNode,
            method: MarginMethod,
-           marginSize: Annotated[float, Minimum(0), Default(2), Decimals(2), SingleStep(0.01)]) -> slicer.vtkMRMLSegmentationNode:
-    helper = SegmentEditorHelper("Margin")
-    helper.effectParameters = {
+           marginSize: Annotated[float, Minimum(0), Default(2), Decimals(2), SingleStep(0.01)],
+           ownedInputs: PipelineOwnedInputs = PipelineOwnedInputs()) -> slicer.vtkMRMLSegmentationNode:
+    with segmentEditorHelperPool.helper("Margin", {
         "MarginSizeMm": marginSize if method == MarginMethod.Grow else -marginSize,
-    }
-    return helper.run(segmentation)
+    }) as helper:
+        return helper.run(segmentation, inPlace="segmentation" in ownedInputs)
 
 
 class HollowMethod(enum.Enum):
@@ -97,53 +214,55 @@ class HollowMethod(enum.Enum):
         return "Unknown HollowMethod"
 
 
-@slicerPipeline(name="SegmentEditor.Hollow", categories=["SegmentEditor", "Segmentation Operations"])
+@slicerPipeline(name="SegmentEditor.Hollow", categories=["SegmentEditor", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": [_binaryLabelmapName]})
 def hollow(segmentation: slicer.vtkMRMLSegmentationNode,
            method: HollowMethod,
-           thickness: Annotated[float, WithinRange(0.01, 100), Default(3), Decimals(2), SingleStep(0.01)]) -> slicer.vtkMRMLSegmentationNode:
-    helper = SegmentEditorHelper("Hollow")
-    helper.effectParameters = {
+           thickness: Annotated[float, WithinRange(0.01, 100), Default(3), Decimals(2), SingleStep(0.01)],
+           ownedInputs: PipelineOwnedInputs = PipelineOwnedInputs()) -> slicer.vtkMRMLSegmentationNode:
+    with segmentEditorHelperPool.helper("Hollow", {
         "ShellMode": method.value,
         "ShellThicknessMm": thickness,
-    }
-    return helper.run(segmentation)
+    }) as helper:
+        return helper.run(segmentation, inPlace="segmentation" in ownedInputs)
 
 
-@slicerPipeline(name="SegmentEditor.Islands.KeepLargest", categories=["SegmentEditor", "Segmentation Operations"])
+@slicerPipeline(name="SegmentEditor.Islands.KeepLargest", categories=["SegmentEditor", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": [_binaryLabelmapName]})
 def islandsKeepLargest(segmentation: slicer.vtkMRMLSegmentationNode,
-                       minimumSizeVoxels: Annotated[int, Minimum(0), Default(1000)]) -> slicer.vtkMRMLSegmentationNode:
-    helper = SegmentEditorHelper("Islands")
-    helper.effectParameters = {
+                       minimumSizeVoxels: Annotated[int, Minimum(0), Default(1000)],
+                       ownedInputs: PipelineOwnedInputs = PipelineOwnedInputs()) -> slicer.vtkMRMLSegmentationNode:
+    with segmentEditorHelperPool.helper("Islands", {
         "Operation": SegmentEditorEffects.KEEP_LARGEST_ISLAND,
         "MinimumSize": minimumSizeVoxels,
-    }
-    return helper.run(segmentation)
+    }) as helper:
+        return helper.run(segmentation, inPlace="segmentation" in ownedInputs)
 
 
-@slicerPipeline(name="SegmentEditor.Islands.RemoveSmall", categories=["SegmentEditor", "Segmentation Operations"])
+@slicerPipeline(name="SegmentEditor.Islands.RemoveSmall", categories=["SegmentEditor", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": [_binaryLabelmapName]})
 def islandsRemoveSmall(segmentation: slicer.vtkMRMLSegmentationNode,
-                       minimumSizeVoxels: Annotated[int, Minimum(0), Default(1000)]) -> slicer.vtkMRMLSegmentationNode:
-    helper = SegmentEditorHelper("Islands")
-    helper.effectParameters = {
+                       minimumSizeVoxels: Annotated[int, Minimum(0), Default(1000)],
+                       ownedInputs: PipelineOwnedInputs = PipelineOwnedInputs()) -> slicer.vtkMRMLSegmentationNode:
+    with segmentEditorHelperPool.helper("Islands", {
         "Operation": SegmentEditorEffects.REMOVE_SMALL_ISLANDS,
         "MinimumSize": minimumSizeVoxels,
-    }
-    return helper.run(segmentation)
+    }) as helper:
+        return helper.run(segmentation, inPlace="segmentation" in ownedInputs)
 
 
 @slicerPipeline(name="SegmentEditor.Thresholding", categories=["SegmentEditor", "Scalar Volume Operations"])
 def thresholding(volume: slicer.vtkMRMLScalarVolumeNode,
                  thresholdRange: Annotated[FloatRange, RangeBounds(-3000, 3000), Default(FloatRange(-100, 100)), SingleStep(1), Decimals(2)]
                 ) -> slicer.vtkMRMLSegmentationNode:
-    helper = SegmentEditorHelper("Threshold")
-    helper.effectParameters = {
-        "MinimumThreshold": thresholdRange.minimum,
-        "MaximumThreshold": thresholdRange.maximum,
-    }
     segmentationNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSegmentationNode')
     segmentationNode.CreateBinaryLabelmapRepresentation()
     segmentationNode.CreateDefaultDisplayNodes()
     segmentationNode.SetReferenceImageGeometryParameterFromVolumeNode(volume)
     segmentationNode.GetSegmentation().AddEmptySegment()
-    helper.segmentEditorWidget.setMasterVolumeNode(volume)
-    return helper.runInPlace(segmentationNode)
+    with segmentEditorHelperPool.helper("Threshold", {
+        "MinimumThreshold": thresholdRange.minimum,
+        "MaximumThreshold": thresholdRange.maximum,
+    }) as helper:
+        helper.segmentEditorWidget.setMasterVolumeNode(volume)
+        return helper.runInPlace(segmentationNode)
@@ -1,3 +1,4 @@
+import fnmatch
 from typing import Annotated
 
 import vtk
@@ -19,28 +20,90 @@ from slicer import (
     vtkMRMLSegmentationNode,
 )
 
-from PipelineCreator import slicerPipeline
+from PipelineCreator import createGeometryOnlyVolume, slicerPipeline
 
+_binaryLabelmapName = slicer.vtkSegmentationConverter.GetSegmentationBinaryLabelmapRepresentationName()
 
-@slicerPipeline(name="Export First Segment to Model", categories=["Conversions", "Segmentation Operations"])
-def exportFirstSegmentToModel(segmentation: vtkMRMLSegmentationNode) -> vtkMRMLModelNode:
-    shNode = slicer.mrmlScene.GetSubjectHierarchyNode()
-    exportFolderItemId = shNode.CreateFolderItem(shNode.GetSceneItemID(), "TempSegmentToModel")
-    slicer.modules.segmentations.logic().ExportAllSegmentsToModels(segmentation, exportFolderItemId)
 
-    children = vtk.vtkIdList()
-    shNode.GetItemChildren(exportFolderItemId, children)
-    if children.GetNumberOfIds() == 0:
-        raise Exception("Export Segmentation to Model pipeline: No models were created")
+def _exportSegmentsToModels(segmentationNode: vtkMRMLSegmentationNode, segmentIds: list[str]) -> list[vtkMRMLModelNode]:
+    """
+    Exports the given segments to new models, in the same order.
+
+    Only the closed surfaces of the given segments are created, and they are created on a temporary
+    segmentation, so the input segmentation is left unchanged. The surfaces are generated by a single
+    conversion of the temporary segmentation, so segments sharing a labelmap are converted together.
+    """
+    closedSurfaceName = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+    segmentation = segmentationNode.GetSegmentation()
+
+    exportSegmentation = slicer.vtkSegmentation()
+    exportSegmentation.SetMasterRepresentationName(segmentation.GetMasterRepresentationName())
+    exportSegmentation.CopyConversionParameters(segmentation)
+    for segmentId in segmentIds:
+        exportSegmentation.CopySegmentFromSegmentation(segmentation, segmentId, False)
+    if not exportSegmentation.CreateRepresentation(closedSurfaceName):
+        raise RuntimeError(f"Failed to create closed surfaces for segments {segmentIds} of '{segmentationNode.GetName()}'")
 
-    modelShId = children.GetId(0)
-    shNode.SetItemParent(modelShId, shNode.GetItemParent(exportFolderItemId))
-    shNode.RemoveItem(exportFolderItemId)
+    models = []
+    for segmentId in segmentIds:
+        segment = exportSegmentation.GetSegment(segmentId)
+        polyData = vtk.vtkPolyData()
+        polyData.ShallowCopy(segment.GetRepresentation(closedSurfaceName))
+        model = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode", segment.GetName())
+        model.SetAndObservePolyData(polyData)
+        model.SetAndObserveTransformNodeID(segmentationNode.GetTransformNodeID())
+        model.CreateDefaultDisplayNodes()
+        model.GetDisplayNode().SetColor(segment.GetColor())
+        models.append(model)
+    return models
 
-    return shNode.GetItemDataNode(modelShId)
 
+def _segmentIds(segmentation: vtkMRMLSegmentationNode) -> list[str]:
+    return list(segmentation.GetSegmentation().GetSegmentIDs())
 
-@slicerPipeline(name="Export Segmentation to LabelMap", categories=["Conversions", "Segmentation Operations"])
+
+@slicerPipeline(name="Export First Segment to Model", categories=["Conversions", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": []})
+def exportFirstSegmentToModel(segmentation: vtkMRMLSegmentationNode) -> vtkMRMLModelNode:
+    return exportSegmentToModelByIndex(segmentation, 0)
+
+
+@slicerPipeline(name="Export Segment to Model - Index", categories=["Conversions", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": []})
+def exportSegmentToModelByIndex(segmentation: vtkMRMLSegmentationNode,
+                                index: Annotated[int, Minimum(0)]) -> vtkMRMLModelNode:
+    segmentIds = _segmentIds(segmentation)
+    if index >= len(segmentIds):
+        raise ValueError(f"Cannot export segment {index}, '{segmentation.GetName()}' has {len(segmentIds)} segments")
+    return _exportSegmentsToModels(segmentation, [segmentIds[index]])[0]
+
+
+@slicerPipeline(name="Export Segment to Model - Name", categories=["Conversions", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": []})
+def exportSegmentToModelByName(segmentation: vtkMRMLSegmentationNode,
+                               segmentName: str) -> vtkMRMLModelNode:
+    segmentId = segmentation.GetSegmentation().GetSegmentIdBySegmentName(segmentName)
+    if not segmentId:
+        raise ValueError(f"No segment named '{segmentName}' in '{segmentation.GetName()}'")
+    return _exportSegmentsToModels(segmentation, [segmentId])[0]
+
+
+@slicerPipeline(name="Export Segments to Models - Name Pattern", categories=["Conversions", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": []})
+def exportSegmentsToModelsByNamePattern(segmentation: vtkMRMLSegmentationNode,
+                                        namePattern: Annotated[str, Default("*")]) -> list[vtkMRMLModelNode]:
+    """
+    Exports the segments whose name matches the shell-style pattern (e.g. "*artery*"), in segment order.
+    """
+    segmentIds = [segmentId for segmentId in _segmentIds(segmentation)
+                  if fnmatch.fnmatchcase(segmentation.GetSegmentation().GetSegment(segmentId).GetName(), namePattern)]
+    if not segmentIds:
+        return []
+    return _exportSegmentsToModels(segmentation, segmentIds)
+
+
+@slicerPipeline(name="Export Segmentation to LabelMap", categories=["Conversions", "Segmentation Operations"],
+                requiredRepresentations={"segmentation": [_binaryLabelmapName]})
 def exportSegmentationToLabelMap(segmentation: vtkMRMLSegmentationNode) -> vtkMRMLLabelMapVolumeNode:
     outputNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLLabelMapVolumeNode')
     slicer.modules.segmentations.logic().ExportAllSegmentsToLabelmapNode(
@@ -54,11 +117,14 @@ def exportSegmentationToLabelMap(segmentation: vtkMRMLSegmentationNode) -> vtkMR
 def exportLabelMapToSegmentation(labelMap: vtkMRMLLabelMapVolumeNode) -> vtkMRMLSegmentationNode:
     seg = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentationNode")
     slicer.modules.segmentations.logic().ImportLabelmapToSegmentationNode(labelMap, seg)
-    seg.CreateClosedSurfaceRepresentation()
+    # no closed surface here, it is expensive and later steps often only need the binary labelmap.
+    # Pipelines create it when a step requires it and the module widget creates it for display.
     return seg
 
 
-@slicerPipeline(name="Export Model to Segmentation - Reference Volume", categories=["Conversions", "Model Operations"])
+# only the geometry of the reference volume is used, so a geometry only volume is not materialized for it
+@slicerPipeline(name="Export Model to Segmentation - Reference Volume", categories=["Conversions", "Model Operations"],
+                geometryOnlyVolumes=["referenceVolume"])
 def exportModelToSegmentationReferenceVolume(model: vtkMRMLModelNode,
                                              referenceVolume: vtkMRMLScalarVolumeNode) -> vtkMRMLSegmentationNode:
     segmentationNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSegmentationNode')
@@ -86,20 +152,12 @@ def exportModelToSegmentationSpacing(model: vtkMRMLModelNode,
     volumeSpacing = [spacingX, spacingY, spacingZ]
     
     #create reference volume
+    # Only its geometry is needed, so no voxels are allocated. Use materializeVolume to get an empty volume.
     bounds = [0.]*6
     model.GetBounds(bounds)
-    imageData = vtk.vtkImageData()
     imageSize = [int((bounds[axis * 2 + 1] - bounds[axis * 2] + volumeMargin[axis] * 2.0) / volumeSpacing[axis]) for axis in range(3)]
     imageOrigin = [ bounds[axis * 2] - volumeMargin[axis] for axis in range(3) ]
-    imageData.SetDimensions(imageSize)
-    imageData.AllocateScalars(vtk.VTK_UNSIGNED_CHAR, 1)
-    imageData.GetPointData().GetScalars().Fill(0)
-    referenceVolumeNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScalarVolumeNode")
-    referenceVolumeNode.SetName(f"{model.GetName()}_ReferenceVolume")
-    referenceVolumeNode.SetOrigin(imageOrigin)
-    referenceVolumeNode.SetSpacing(volumeSpacing)
-    referenceVolumeNode.SetAndObserveImageData(imageData)
-    referenceVolumeNode.CreateDefaultDisplayNodes()
+    referenceVolumeNode = createGeometryOnlyVolume(f"{model.GetName()}_ReferenceVolume", imageOrigin, volumeSpacing, imageSize)
 
     segmentationNode = slicer.mrmlScene.AddNewNodeByClass('vtkMRMLSegmentationNode')
     segmentationNode.CreateDefaultDisplayNodes()
@@ -1,6 +1,7 @@
 from typing import Annotated
 
 import slicer
+import vtk
 from slicer.parameterNodeWrapper import (
     Decimals,
     Default,
@@ -14,14 +15,62 @@ from PipelineCreator import slicerPipeline
 from SurfaceToolbox import SurfaceToolboxLogic
 
 
+class _SurfaceToolboxBatch:
+    """
+    Shares one SurfaceToolboxLogic and parameter node among all SurfaceToolbox calls made during a batch.
+    Batches can be nested (e.g. a generated pipeline using another one), the shared objects are
+    released when the outermost batch ends.
+    """
+    depth = 0
+    logic = None
+    parameterNode = None
+
+    @classmethod
+    def setup(cls):
+        cls.depth += 1
+
+    @classmethod
+    def teardown(cls):
+        cls.depth -= 1
+        if cls.depth == 0:
+            if cls.parameterNode is not None and cls.parameterNode.GetScene() is not None:
+                slicer.mrmlScene.RemoveNode(cls.parameterNode)
+            cls.logic = None
+            cls.parameterNode = None
+
+    @classmethod
+    def logicAndParameterNode(cls):
+        if cls.logic is None:
+            cls.logic = SurfaceToolboxLogic()
+        # the scene may have been cleared in between calls
+        if cls.parameterNode is None or cls.parameterNode.GetScene() is None:
+            cls.parameterNode = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLScriptedModuleNode")
+        else:
+            # don't let the parameters of the previous call leak into this one
+            cls.parameterNode.UnsetAllParameters()
+        return cls.logic, cls.parameterNode
+
+
+def _batchSetup():
+    _SurfaceToolboxBatch.setup()
+
+
+def _batchTeardown():
+    _SurfaceToolboxBatch.teardown()
+
+
 def _surfaceToolboxRun(mesh: vtkMRMLModelNode,
                        operation: str,
                        params: dict[str, str]):
     outputModel = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
-    parameterNode = slicer.mrmlScene.AddNewNodeByClass(
-        "vtkMRMLScriptedModuleNode")
-    try:
+    inBatch = _SurfaceToolboxBatch.depth > 0
+    if inBatch:
+        logic, parameterNode = _SurfaceToolboxBatch.logicAndParameterNode()
+    else:
         logic = SurfaceToolboxLogic()
+        parameterNode = slicer.mrmlScene.AddNewNodeByClass(
+            "vtkMRMLScriptedModuleNode")
+    try:
         logic.setDefaultParameters(parameterNode)
 
         parameterNode.SetNodeReferenceID("inputModel", mesh.GetID())
@@ -33,7 +82,98 @@ def _surfaceToolboxRun(mesh: vtkMRMLModelNode,
         logic.applyFilters(parameterNode)
         return outputModel
     finally:
-        slicer.mrmlScene.RemoveNode(parameterNode)
+        if not inBatch:
+            slicer.mrmlScene.RemoveNode(parameterNode)
+
+
+#
+# Direct implementations
+#
+# Most SurfaceToolbox operations are a single VTK filter. Running them directly skips creating
+# a parameter node, converting all the parameters to strings and back, and going through
+# SurfaceToolboxLogic.applyFilters. The filters are configured exactly like SurfaceToolbox does,
+# so the results are the same. Operations that SurfaceToolbox delegates to something else than
+# a VTK filter (decimation runs a CLI module, uniform remeshing uses pyacvd) still go through
+# _surfaceToolboxRun.
+#
+
+def _runFilter(filter_, inputPolyData) -> vtk.vtkPolyData:
+    filter_.SetInputData(inputPolyData)
+    filter_.Update()
+    return filter_.GetOutput()
+
+
+def _polyDataToModel(polyData) -> vtkMRMLModelNode:
+    outputModel = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+    outputModel.SetAndObservePolyData(polyData)
+    return outputModel
+
+
+def _clean(inputPolyData) -> vtk.vtkPolyData:
+    return _runFilter(vtk.vtkCleanPolyData(), inputPolyData)
+
+
+def _smooth(inputPolyData, method, iterations, laplaceRelaxationFactor=0.5, taubinPassBand=0.1, boundarySmoothing=True) -> vtk.vtkPolyData:
+    if method == "Laplace":
+        smoothing = vtk.vtkSmoothPolyDataFilter()
+        smoothing.SetRelaxationFactor(laplaceRelaxationFactor)
+    else:  # "Taubin"
+        smoothing = vtk.vtkWindowedSincPolyDataFilter()
+        smoothing.SetPassBand(taubinPassBand)
+    smoothing.SetBoundarySmoothing(boundarySmoothing)
+    smoothing.SetNumberOfIterations(iterations)
+    return _runFilter(smoothing, inputPolyData)
+
+
+def _fillHoles(inputPolyData, maximumHoleSize) -> vtk.vtkPolyData:
+    fill = vtk.vtkFillHolesFilter()
+    fill.SetInputData(inputPolyData)
+    fill.SetHoleSize(maximumHoleSize)
+    # SurfaceToolbox auto-orients the normals so filled holes are not hidden by backface culling
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputConnection(fill.GetOutputPort())
+    normals.SetAutoOrientNormals(True)
+    normals.Update()
+    return normals.GetOutput()
+
+
+def _computeNormals(inputPolyData, autoOrient, flip, split, splitAngle) -> vtk.vtkPolyData:
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetAutoOrientNormals(autoOrient)
+    normals.SetFlipNormals(flip)
+    normals.SetSplitting(split)
+    if split:
+        normals.SetFeatureAngle(splitAngle)
+    return _runFilter(normals, inputPolyData)
+
+
+def _transform(inputPolyData, scaleX=1.0, scaleY=1.0, scaleZ=1.0, translateX=0.0, translateY=0.0, translateZ=0.0) -> vtk.vtkPolyData:
+    transform = vtk.vtkTransform()
+    transform.Translate(translateX, translateY, translateZ)
+    transform.Scale(scaleX, scaleY, scaleZ)
+    transformFilter = vtk.vtkTransformFilter()
+    transformFilter.SetTransform(transform)
+    output = _runFilter(transformFilter, inputPolyData)
+    if transform.GetMatrix().Determinant() >= 0.0:
+        return output
+    # The mesh is turned inside out, reverse the cells to keep them facing outside
+    return _runFilter(vtk.vtkReverseSense(), output)
+
+
+def _extractEdges(inputPolyData, boundary, feature, featureAngle, manifold, nonManifold) -> vtk.vtkPolyData:
+    edges = vtk.vtkFeatureEdges()
+    edges.SetBoundaryEdges(boundary)
+    edges.SetFeatureEdges(feature)
+    edges.SetFeatureAngle(featureAngle)
+    edges.SetManifoldEdges(manifold)
+    edges.SetNonManifoldEdges(nonManifold)
+    return _runFilter(edges, inputPolyData)
+
+
+def _extractLargestComponent(inputPolyData) -> vtk.vtkPolyData:
+    connect = vtk.vtkPolyDataConnectivityFilter()
+    connect.SetExtractionModeToLargestRegion()
+    return _runFilter(connect, inputPolyData)
 
 
 _surfaceToolboxDeps = ["SurfaceToolbox"]
@@ -46,10 +186,11 @@ def formatBool(cond):
 
 @slicerPipeline(name="SurfaceToolbox.Clean", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
 def clean(mesh: vtkMRMLModelNode) -> vtkMRMLModelNode:
-    return _surfaceToolboxRun(mesh, "cleaner", {})
+    return _polyDataToModel(_clean(mesh.GetPolyData()))
 
 
-@slicerPipeline(name="SurfaceToolbox.UniformRemesh", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
+@slicerPipeline(name="SurfaceToolbox.UniformRemesh", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats,
+                batchSetup=_batchSetup, batchTeardown=_batchTeardown)
 def remesh(mesh: vtkMRMLModelNode,
            numPoints: Annotated[int, WithinRange(100, 100000), Default(10000)],
            subdivide: Annotated[int, WithinRange(0, 8)]) -> vtkMRMLModelNode:
@@ -59,7 +200,8 @@ def remesh(mesh: vtkMRMLModelNode,
     })
 
 
-@slicerPipeline(name="SurfaceToolbox.Decimate", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
+@slicerPipeline(name="SurfaceToolbox.Decimate", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats,
+                batchSetup=_batchSetup, batchTeardown=_batchTeardown)
 def decimation(mesh: vtkMRMLModelNode,
                reduction: Annotated[float, WithinRange(0, 1), Default(0.8), Decimals(2), SingleStep(0.01)],
                boundaryDeletion: Annotated[bool, Default(True)]) -> vtkMRMLModelNode:
@@ -74,12 +216,8 @@ def taubinSmoothing(mesh: vtkMRMLModelNode,
                     iterations: Annotated[int, WithinRange(0, 100), Default(30)],
                     passBand: Annotated[float, WithinRange(0, 2), Default(0.1), Decimals(4), SingleStep(0.0001)],
                     boundarySmoothing: Annotated[bool, Default(True)]) -> vtkMRMLModelNode:
-    return _surfaceToolboxRun(mesh, "smoothing", {
-        "smoothingMethod": "Taubin",
-        "smoothingTaubinIterations": str(iterations),
-        "smoothingTaubinPassBand": str(passBand),
-        "smoothingBoundarySmoothing": formatBool(boundarySmoothing),
-    })
+    return _polyDataToModel(_smooth(mesh.GetPolyData(), "Taubin", iterations,
+                                    taubinPassBand=passBand, boundarySmoothing=boundarySmoothing))
 
 
 @slicerPipeline(name="SurfaceToolbox.Smoothing.Laplace", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
@@ -87,20 +225,14 @@ def laplaceSmoothing(mesh: vtkMRMLModelNode,
                     iterations: Annotated[int, WithinRange(0, 500), Default(100)],
                     relaxation: Annotated[float, WithinRange(0, 1), Default(0.5), Decimals(1), SingleStep(0.1)],
                     boundarySmoothing: Annotated[bool, Default(True)]) -> vtkMRMLModelNode:
-    return _surfaceToolboxRun(mesh, "smoothing", {
-        "smoothingMethod": "Laplace",
-        "smoothingLaplaceIterations": str(iterations),
-        "smoothingLaplaceRelaxation": str(relaxation),
-        "smoothingBoundarySmoothing": formatBool(boundarySmoothing),
-    })
+    return _polyDataToModel(_smooth(mesh.GetPolyData(), "Laplace", iterations,
+                                    laplaceRelaxationFactor=relaxation, boundarySmoothing=boundarySmoothing))
 
 
 @slicerPipeline(name="SurfaceToolbox.FillHoles", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
 def fillHoles(mesh: vtkMRMLModelNode,
               maxHoleSize: Annotated[float, WithinRange(0, 1000), Default(1000), Decimals(1), SingleStep(0.1)]) -> vtkMRMLModelNode:
-    return _surfaceToolboxRun(mesh, "fillHoles", {
-        "fillHolesSize": str(maxHoleSize),
-    })
+    return _polyDataToModel(_fillHoles(mesh.GetPolyData(), maxHoleSize))
 
 
 @slicerPipeline(name="SurfaceToolbox.Normals", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
@@ -109,12 +241,7 @@ def normals(mesh: vtkMRMLModelNode,
             flipNormals: bool,
             splitting: bool,
             featureAngleForSplitting: Annotated[float, WithinRange(0, 180), Default(30)]) -> vtkMRMLModelNode:
-    return _surfaceToolboxRun(mesh, "normals", {
-        "normalsOrient": formatBool(autoOrientNormals),
-        "normalsFlip": formatBool(flipNormals),
-        "normalsSplitting": formatBool(splitting),
-        "normalsFeatureAngle": str(featureAngleForSplitting),
-    })
+    return _polyDataToModel(_computeNormals(mesh.GetPolyData(), autoOrientNormals, flipNormals, splitting, featureAngleForSplitting))
 
 
 @slicerPipeline(name="SurfaceToolbox.Mirror", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
@@ -122,11 +249,10 @@ def mirrorMesh(mesh: vtkMRMLModelNode,
                mirrorX: bool,
                mirrorY: bool,
                mirrorZ: bool) -> vtkMRMLModelNode:
-    return _surfaceToolboxRun(mesh, "mirror", {
-        "mirrorX": formatBool(mirrorX),
-        "mirrorY": formatBool(mirrorY),
-        "mirrorZ": formatBool(mirrorZ),
-    })
+    return _polyDataToModel(_transform(mesh.GetPolyData(),
+                                       scaleX=-1.0 if mirrorX else 1.0,
+                                       scaleY=-1.0 if mirrorY else 1.0,
+                                       scaleZ=-1.0 if mirrorZ else 1.0))
 
 
 @slicerPipeline(name="SurfaceToolbox.ScaleMesh", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
@@ -134,12 +260,7 @@ def scaleMesh(mesh: vtkMRMLModelNode,
               scaleX: Annotated[float, Minimum(0)],
               scaleY: Annotated[float, Minimum(0)],
               scaleZ: Annotated[float, Minimum(0)]) -> vtkMRMLModelNode:
-
-    return _surfaceToolboxRun(mesh, "scale", {
-        "scaleX": str(scaleX),
-        "scaleY": str(scaleY),
-        "scaleZ": str(scaleZ),
-    })
+    return _polyDataToModel(_transform(mesh.GetPolyData(), scaleX=scaleX, scaleY=scaleY, scaleZ=scaleZ))
 
 
 @slicerPipeline(name="SurfaceToolbox.TranslateMesh", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
@@ -147,11 +268,7 @@ def translateMesh(mesh: vtkMRMLModelNode,
                   translateX: float,
                   translateY: float,
                   translateZ: float) -> vtkMRMLModelNode:
-    return _surfaceToolboxRun(mesh, "translate", {
-        "translateX": str(translateX),
-        "translateY": str(translateY),
-        "translateZ": str(translateZ),
-    })
+    return _polyDataToModel(_transform(mesh.GetPolyData(), translateX=translateX, translateY=translateY, translateZ=translateZ))
 
 
 @slicerPipeline(name="SurfaceToolbox.ExtractEdges", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
@@ -161,15 +278,9 @@ def extractEdges(mesh: vtkMRMLModelNode,
               featureAngle: Annotated[float, WithinRange(0, 180), Default(20)],
               manifoldEdges: bool,
               nonManifoldEdges: bool) -> vtkMRMLModelNode:
-
-    return _surfaceToolboxRun(mesh, "extractEdges", {
-        "extractEdgesBoundary": formatBool(boundaryEdges),
-        "extractEdgesFeature": formatBool(featureEdges),
-        "extractEdgesFeatureAngle": str(featureAngle),
-        "extractEdgesManifold": formatBool(manifoldEdges),
-        "extractEdgesNonManifold": formatBool(nonManifoldEdges),
-    })
+    return _polyDataToModel(_extractEdges(mesh.GetPolyData(), boundaryEdges, featureEdges, featureAngle,
+                                          manifoldEdges, nonManifoldEdges))
 
 @slicerPipeline(name="SurfaceToolbox.ExtractLargestComponent", dependencies=_surfaceToolboxDeps, categories=_surfaceToolboxCats)
 def extractLargestComponent(mesh: vtkMRMLModelNode) -> vtkMRMLModelNode:
-    return _surfaceToolboxRun(mesh, "connectivity", {})
+    return _polyDataToModel(_extractLargestComponent(mesh.GetPolyData()))
@@ -4,6 +4,7 @@ import vtk
 
 import slicer
 from slicer.parameterNodeWrapper import (
+    Choice,
     Decimals,
     Default,
     SingleStep,
@@ -146,3 +147,54 @@ def windowedSincPolyDataFilter(mesh: slicer.vtkMRMLModelNode,
                                    NonManifoldSmoothing=nonManifoldSmoothing,
                                    FeatureAngle=featureAngle,
                                    EdgeAngle=edgeAngle)
+
+
+#
+# SMP-parallel filters
+#
+# These filters are threaded with vtkSMPTools, so they use the backend and number of threads
+# selected through PipelineExecutionSettings. They are only registered if the VTK Slicer
+# is built against has them.
+#
+
+if hasattr(vtk, "vtkBinnedDecimation"):
+    _binnedDecimationPointModes = {
+        "UseInputPoints": vtk.vtkBinnedDecimation.INPUT_POINTS,
+        "BinPoints": vtk.vtkBinnedDecimation.BIN_POINTS,
+        "BinCenters": vtk.vtkBinnedDecimation.BIN_CENTERS,
+        "BinAverages": vtk.vtkBinnedDecimation.BIN_AVERAGES,
+    }
+
+    @slicerPipeline(name="vtkBinnedDecimation", categories=["VTK"])
+    def binnedDecimation(mesh: slicer.vtkMRMLModelNode,
+                         numberOfDivisions: Annotated[int, WithinRange(2, 2048), Default(256)],
+                         autoAdjustNumberOfDivisions: Annotated[bool, Default(True)],
+                         pointGenerationMode: Annotated[str, Choice(list(_binnedDecimationPointModes)), Default("BinAverages")]) -> slicer.vtkMRMLModelNode:
+        return vtkPolyDataPipelineImpl(vtk.vtkBinnedDecimation(),
+                                       mesh,
+                                       NumberOfDivisions=(numberOfDivisions,) * 3,
+                                       AutoAdjustNumberOfDivisions=autoAdjustNumberOfDivisions,
+                                       PointGenerationMode=_binnedDecimationPointModes[pointGenerationMode])
+
+
+if hasattr(vtk, "vtkConstrainedSmoothingFilter"):
+    @slicerPipeline(name="vtkConstrainedSmoothingFilter", categories=["VTK"])
+    def constrainedSmoothingFilter(mesh: slicer.vtkMRMLModelNode,
+                                   relaxationFactor: Annotated[float, WithinRange(0, 1), Default(0.8), Decimals(2), SingleStep(0.01)],
+                                   iterations: Annotated[int, WithinRange(1, 100), Default(30)],
+                                   constraintDistance: Annotated[float, WithinRange(0, 1000), Default(1), Decimals(2), SingleStep(0.01)]) -> slicer.vtkMRMLModelNode:
+        return vtkPolyDataPipelineImpl(vtk.vtkConstrainedSmoothingFilter(),
+                                       mesh,
+                                       RelaxationFactor=relaxationFactor,
+                                       NumberOfIterations=iterations,
+                                       ConstraintDistance=constraintDistance)
+
+
+if hasattr(vtk, "vtkTriangleMeshPointNormals"):
+    @slicerPipeline(name="vtkTriangleMeshPointNormals", categories=["VTK"])
+    def triangleMeshPointNormals(mesh: slicer.vtkMRMLModelNode) -> slicer.vtkMRMLModelNode:
+        """
+        Point normals of a triangle mesh. Much faster than vtkPolyDataNormals, but it does
+        not split sharp edges or reorient the triangles, so the mesh must be consistently oriented.
+        """
+        return vtkPolyDataPipelineImpl(vtk.vtkTriangleMeshPointNormals(), mesh)